@@ -19,6 +19,11 @@ const char *serverIP = "192.168.38.118"; // IP address of the data receiving ser
 const int serverPort = 8889;             // TCP port for server communication
 const int httpPort = 8888;               // HTTP port for data transmission
 
+//==== DATA FORMAT ====//
+// Send chunks as delta frames instead of text (about 7x fewer bytes;
+// needs a server whose data_decoder.py supports them)
+const bool useDeltaFrames = false;
+
 // MAX30105 sensor object
 MAX30105 particleSensor;
 
@@ -3,6 +3,58 @@
 
 #include "config.h" // Import serverIP and SensorData structure
 
+/**
+ * Delta frame encoding (decoded by data_decoder.py on the server):
+ * "PPD1", then LEB128 varints: sample count, first timestamp/ir/red, then
+ * for each following sample the zigzag-encoded differences (timestamp
+ * step minus the nominal 25 ms, ir step, red step)
+ */
+const int DELTA_FRAME_HEADER_MAX = 4 + 4 * 5; // Magic + 4 varints
+const int DELTA_SAMPLE_MAX = 3 * 5;           // 3 varints of up to 5 bytes
+
+size_t putVarint(uint8_t *out, uint32_t value)
+{
+    size_t n = 0;
+    while (value >= 0x80)
+    {
+        out[n++] = (value & 0x7F) | 0x80;
+        value >>= 7;
+    }
+    out[n++] = value;
+    return n;
+}
+
+uint32_t zigzag(int32_t value)
+{
+    return ((uint32_t)value << 1) ^ (uint32_t)(value >> 31);
+}
+
+size_t encodeDeltaFrame(const SensorData *samples, int count, uint8_t *out)
+{
+    memcpy(out, "PPD1", 4);
+    size_t n = 4;
+    n += putVarint(out + n, count);
+    if (count > 0)
+    {
+        n += putVarint(out + n, samples[0].timestamp);
+        n += putVarint(out + n, samples[0].ir);
+        n += putVarint(out + n, samples[0].red);
+    }
+    for (int i = 1; i < count; i++)
+    {
+        n += putVarint(out + n, zigzag((int32_t)(samples[i].timestamp - samples[i - 1].timestamp) - 25));
+        n += putVarint(out + n, zigzag((int32_t)(samples[i].ir - samples[i - 1].ir)));
+        n += putVarint(out + n, zigzag((int32_t)(samples[i].red - samples[i - 1].red)));
+
+        // Process ESP32 background tasks occasionally
+        if (i % 100 == 0)
+        {
+            yield();
+        }
+    }
+    return n;
+}
+
 /**
  * Send collected data to server in chunks
  * 
@@ -47,33 +99,59 @@ void sendCollectedData(SensorData *measurements, int sampleCount, int chunkSize)
         }
 
         // Prepare data for this chunk
-        String data = String(chunkSamples) + "\n";
-        for (int i = startIdx; i < endIdx; i++)
+        String data;
+        uint8_t *frame = NULL;
+        size_t bodyLength;
+        if (useDeltaFrames)
         {
-            data += String(measurements[i].timestamp) + "," +
-                    String(measurements[i].ir) + "," +
-                    String(measurements[i].red) + "\n";
-
-            // Process ESP32 background tasks occasionally
-            if ((i - startIdx) % 100 == 0)
+            frame = (uint8_t *)malloc(DELTA_FRAME_HEADER_MAX + chunkSamples * DELTA_SAMPLE_MAX);
+            if (frame == NULL)
+            {
+                Serial.println("Not enough memory for delta frame");
+                httpClient.stop();
+                continue;
+            }
+            bodyLength = encodeDeltaFrame(&measurements[startIdx], chunkSamples, frame);
+        }
+        else
+        {
+            data = String(chunkSamples) + "\n";
+            for (int i = startIdx; i < endIdx; i++)
             {
-                yield();
+                data += String(measurements[i].timestamp) + "," +
+                        String(measurements[i].ir) + "," +
+                        String(measurements[i].red) + "\n";
+
+                // Process ESP32 background tasks occasionally
+                if ((i - startIdx) % 100 == 0)
+                {
+                    yield();
+                }
             }
+            bodyLength = data.length();
         }
 
         // Send HTTP request with chunk information in headers
         String httpHeader = "POST /data HTTP/1.1\r\n"
                             "Host: " + String(serverIP) + "\r\n"
-                            "Content-Type: text/plain\r\n"
-                            "Content-Length: " + String(data.length()) + "\r\n"
+                            "Content-Type: " + String(useDeltaFrames ? "application/x-ppg-delta" : "text/plain") + "\r\n"
+                            "Content-Length: " + String(bodyLength) + "\r\n"
                             "X-Chunk-Index: " + String(chunk) + "\r\n"
                             "X-Total-Chunks: " + String(totalChunks) + "\r\n"
                             "X-Total-Samples: " + String(sampleCount) + "\r\n"
                             "X-Chunk-Start-Index: " + String(startIdx) + "\r\n\r\n";
 
-        Serial.printf("Sending chunk %d/%d: %d bytes\n", chunk + 1, totalChunks, data.length());
+        Serial.printf("Sending chunk %d/%d: %d bytes\n", chunk + 1, totalChunks, (int)bodyLength);
         httpClient.print(httpHeader);
-        httpClient.print(data);
+        if (frame != NULL)
+        {
+            httpClient.write(frame, bodyLength);
+            free(frame);
+        }
+        else
+        {
+            httpClient.print(data);
+        }
 
         // Wait for response for each chunk
         unsigned long timeout = millis();
@@ -0,0 +1,281 @@
+import os
+import glob
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The standalone runtime is enough for inference; fall back to full TensorFlow
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    try:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    except ImportError:
+        Interpreter = None
+
+MODEL_PATH = os.environ.get(
+    'ACTIVITY_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 '..', '..', 'trainModel', 'model_int8.tflite'))
+
+CLASSES = ['resting', 'sitting', 'walking']  # Firmware class order
+WINDOW_SIZE = 100   # Samples per window (WINDOW_SIZE in the firmware)
+CHANNELS = ['ir', 'red']
+BATCH_SIZE = 256    # Windows per interpreter invocation
+
+# Fixed normalization used on the device (model_runner.h)
+FIRMWARE_NORMALIZATION = {
+    'ir': (105500.0, 1000.0),
+    'red': (101000.0, 800.0),
+}
+
+
+def normalize_windows(windows, normalization='window'):
+    """
+    Normalize raw windows for the model.
+
+    Args:
+        windows: Array (n_windows, window_size, 2) of raw IR/red values
+        normalization: 'window' z-normalizes each window and channel like the
+            training notebook, 'firmware' uses the device's fixed constants
+
+    Returns:
+        float32 array with the same shape
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    if normalization == 'firmware':
+        mean = np.array([FIRMWARE_NORMALIZATION[c][0] for c in CHANNELS])
+        std = np.array([FIRMWARE_NORMALIZATION[c][1] for c in CHANNELS])
+    elif normalization == 'window':
+        mean = windows.mean(axis=1, keepdims=True)
+        std = windows.std(axis=1, keepdims=True)
+        std[std == 0] = 1.0
+    else:
+        raise ValueError(f"Unknown normalization: {normalization}")
+    return ((windows - mean) / std).astype(np.float32)
+
+
+def signal_windows(values, window_size=WINDOW_SIZE, step=WINDOW_SIZE):
+    """
+    Windows of a continuous (n_samples, 2) signal without copying.
+
+    Returns:
+        Tuple (windows, starts): windows is (n_windows, window_size, 2)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window_size:
+        return np.empty((0, window_size, values.shape[1])), np.empty(0, dtype=np.int64)
+    view = sliding_window_view(values, window_size, axis=0)[::step]
+    starts = np.arange(len(view)) * step
+    return view.transpose(0, 2, 1), starts
+
+
+class ActivityClassifier:
+    """
+    TFLite activity model loaded once and run on batches of windows.
+
+    Quantized (int8) inputs and outputs are converted to and from float
+    using the tensor's quantization parameters, so callers always pass
+    normalized float windows and get class probabilities back.
+
+    An interpreter is not thread-safe: calls are serialized on an internal
+    lock. Use one instance per worker thread for parallel work.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, batch_size=BATCH_SIZE, num_threads=1):
+        if Interpreter is None:
+            raise RuntimeError("TFLite interpreter not available "
+                               "(install tflite-runtime or tensorflow)")
+        self.model_path = model_path
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._lock = threading.Lock()
+
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.window_size = int(self.input['shape'][1])
+        self.channels = int(self.input['shape'][2])
+
+        # Run several windows per invoke when the model allows a larger batch
+        self.batch_size = 1
+        if batch_size > 1:
+            try:
+                self.interpreter.resize_tensor_input(
+                    self.input['index'], [batch_size, self.window_size, self.channels])
+                self.interpreter.allocate_tensors()
+                self.batch_size = batch_size
+            except (RuntimeError, ValueError):
+                self.interpreter.resize_tensor_input(
+                    self.input['index'], [1, self.window_size, self.channels])
+                self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+
+    def _quantize(self, batch):
+        dtype = self.input['dtype']
+        if not np.issubdtype(dtype, np.integer):
+            return batch.astype(dtype)
+        scale, zero_point = self.input['quantization']
+        info = np.iinfo(dtype)
+        q = np.round(batch / scale + zero_point)
+        return np.clip(q, info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if not np.issubdtype(output.dtype, np.integer):
+            return output.astype(np.float32)
+        scale, zero_point = self.output['quantization']
+        return ((output.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+    def predict_proba(self, windows):
+        """
+        Class probabilities for normalized windows.
+
+        Args:
+            windows: float array (n_windows, window_size, channels)
+
+        Returns:
+            float32 array (n_windows, n_classes)
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        n_windows = len(windows)
+        n_classes = int(self.output['shape'][-1])
+        probabilities = np.empty((n_windows, n_classes), dtype=np.float32)
+        if n_windows == 0:
+            return probabilities
+
+        # Quantize everything at once; the last batch is zero-padded so the
+        # input tensor never has to be reallocated
+        quantized = self._quantize(windows)
+        padded = np.zeros((self.batch_size,) + quantized.shape[1:], dtype=quantized.dtype)
+
+        with self._lock:
+            for start in range(0, n_windows, self.batch_size):
+                batch = quantized[start:start + self.batch_size]
+                if len(batch) < self.batch_size:
+                    padded[:len(batch)] = batch
+                    batch = padded
+                self.interpreter.set_tensor(self.input['index'], batch)
+                self.interpreter.invoke()
+                result = self.interpreter.get_tensor(self.output['index'])
+                count = min(self.batch_size, n_windows - start)
+                probabilities[start:start + count] = self._dequantize(result[:count])
+        return probabilities
+
+    def predict(self, windows):
+        """
+        Returns:
+            Tuple (class_index, confidence) arrays, one entry per window
+        """
+        probabilities = self.predict_proba(windows)
+        class_index = probabilities.argmax(axis=1)
+        return class_index, probabilities[np.arange(len(class_index)), class_index]
+
+    def classify_signal(self, ir, red, step=WINDOW_SIZE, normalization='window'):
+        """
+        Classify consecutive windows of a continuous recording.
+
+        Returns:
+            DataFrame with start sample, class index, label and confidence
+        """
+        values = np.column_stack((np.asarray(ir, dtype=np.float64),
+                                  np.asarray(red, dtype=np.float64)))
+        windows, starts = signal_windows(values, self.window_size, step)
+        class_index, confidence = self.predict(normalize_windows(windows, normalization))
+        return pd.DataFrame({
+            'start': starts,
+            'actionClass': class_index,
+            'label': np.array(CLASSES, dtype=object)[class_index],
+            'confidence': confidence,
+        })
+
+
+def classify_file(classifier, csv_path, step=WINDOW_SIZE, normalization='window'):
+    """Per-window activity labels for one recording (timestamps included)"""
+    df = pd.read_csv(csv_path)
+    result = classifier.classify_signal(df['ir'].values, df['red'].values,
+                                        step, normalization)
+    if 'timestamp' in df.columns:
+        result.insert(1, 'timestamp', df['timestamp'].values[result['start'].values])
+    return result
+
+
+def backfill_labels(csv_dir, out_dir, workers=4, step=WINDOW_SIZE,
+                    normalization='window', model_path=MODEL_PATH, force=False):
+    """
+    Label every recording in csv_dir with a pool of worker threads.
+
+    Each worker owns its own interpreter (the interpreter releases the GIL
+    while invoking). Output files already newer than their recording are
+    skipped unless force is set.
+
+    Returns:
+        List of (csv_path, label_path, n_windows)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for csv_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        name = os.path.splitext(os.path.basename(csv_path))[0]
+        label_path = os.path.join(out_dir, f"{name}_activity.csv")
+        if (not force and os.path.exists(label_path)
+                and os.path.getmtime(label_path) >= os.path.getmtime(csv_path)):
+            continue
+        jobs.append((csv_path, label_path))
+
+    local = threading.local()
+
+    def run(job):
+        csv_path, label_path = job
+        if not hasattr(local, 'classifier'):
+            local.classifier = ActivityClassifier(model_path)
+        result = classify_file(local.classifier, csv_path, step, normalization)
+        result.to_csv(label_path, index=False)
+        print(f"{csv_path}: {len(result)} windows labelled")
+        return csv_path, label_path, len(result)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(run, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Classify recordings with the TFLite activity model')
+    parser.add_argument('file', nargs='?', help='CSV file to classify')
+    parser.add_argument('--all', action='store_true',
+                        help='Label every recording in data/csv into data/labels')
+    parser.add_argument('--model', default=MODEL_PATH, help='TFLite model file')
+    parser.add_argument('--step', type=int, default=WINDOW_SIZE,
+                        help='Step between windows in samples')
+    parser.add_argument('--normalization', choices=['window', 'firmware'], default='window',
+                        help='Per-window z-score (training) or the fixed device constants')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker threads for --all')
+    parser.add_argument('--force', action='store_true',
+                        help='Relabel recordings that already have labels')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.all:
+        results = backfill_labels(os.path.join('data', 'csv'), os.path.join('data', 'labels'),
+                                  args.workers, args.step, args.normalization,
+                                  args.model, args.force)
+        windows = sum(n for _, _, n in results)
+        print(f"Labelled {windows} windows in {len(results)} recordings "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif args.file:
+        classifier = ActivityClassifier(args.model)
+        result = classify_file(classifier, args.file, args.step, args.normalization)
+        print(result.to_string(index=False))
+        print(result['label'].value_counts().to_string())
+        print(f"{len(result)} windows in {time.perf_counter() - start:.2f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Compact archival format for decoded recordings.
+
+A recording (timestamp, ir, red, time_delta) is stored in blocks of
+BLOCK_SIZE samples. Each block holds its first sample, then the
+zigzag-encoded differences of the following samples (timestamp steps
+relative to the nominal 25 ms) as LEB128 varints, compressed with zstd
+when zstandard is installed and zlib otherwise. time_delta is not stored;
+it is derived from the timestamps when reading.
+
+File layout (little-endian):
+    header   magic, version, compression, block size, samples, blocks,
+             first timestamp (HEADER)
+    index    one INDEX_DTYPE entry per block: first sample, byte offset,
+             size, first timestamp
+    blocks   compressed block payloads
+
+The index gives random access: ArchiveReader.read(start, stop) reads and
+decodes only the blocks covering those samples.
+
+Usage:
+    python archive.py --all --verify           # archive data/csv into data/archive
+    python archive.py --all --remove-csv       # and delete the archived CSVs
+    python archive.py --extract data/archive/<name>.ppga
+"""
+import os
+import glob
+import time
+import zlib
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+
+from data_decoder import (NOMINAL_INTERVAL_MS, decode_varints, encode_varints,
+                          save_decoded_data, zigzag_decode, zigzag_encode)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_MAGIC = b'PPA1'
+ARCHIVE_VERSION = 1
+ARCHIVE_EXTENSION = '.ppga'
+ARCHIVE_DIR = os.path.join('data', 'archive')
+BLOCK_SIZE = 4096   # Samples per block (~100 s at 40 Hz)
+ZSTD_LEVEL = 19     # Archives are written once and read many times
+ZLIB_LEVEL = 9
+
+COMPRESSIONS = {'none': 0, 'zlib': 1, 'zstd': 2}
+HEADER = struct.Struct('<4sBBxxIQIq')
+INDEX_DTYPE = np.dtype([('start', '<u8'), ('offset', '<u8'), ('size', '<u4'),
+                        ('timestamp', '<i8')])
+COLUMNS = ['timestamp', 'ir', 'red']
+
+
+def default_compression():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def _compress(payload, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+    if compression == 'zlib':
+        return zlib.compress(payload, ZLIB_LEVEL)
+    return payload
+
+
+def _decompress(data, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Archive is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == 'zlib':
+        return zlib.decompress(data)
+    return data
+
+
+def _samples(df):
+    """(n, 3) int64 samples of a decoded recording, checking nothing would be lost"""
+    extra = set(df.columns) - set(COLUMNS) - {'time_delta'}
+    if extra or not set(COLUMNS) <= set(df.columns):
+        raise ValueError(f"Expected columns {COLUMNS + ['time_delta']}, got {list(df.columns)}")
+    samples = df[COLUMNS].to_numpy()
+    if samples.dtype.kind not in 'iu':
+        if not np.array_equal(samples, np.round(samples)):
+            raise ValueError("timestamp, ir and red must be integers")
+    samples = samples.astype(np.int64)
+    if 'time_delta' in df.columns and len(samples):
+        derived = (samples[:, 0] - samples[0, 0]) / 1000.0
+        if not np.allclose(df['time_delta'].to_numpy(dtype=np.float64), derived,
+                           rtol=0, atol=1e-6):
+            raise ValueError("time_delta does not follow from timestamp")
+    return samples
+
+
+def encode_recording(df, block_size=BLOCK_SIZE, compression=None):
+    """
+    Encode a decoded recording as an archive.
+
+    Parameters:
+        df (pd.DataFrame): timestamp, ir, red and optionally time_delta
+        block_size (int): Samples per block
+        compression (str): 'zstd', 'zlib' or 'none' (default: zstd if available)
+
+    Returns:
+        bytes: The archive file contents
+    """
+    compression = compression or default_compression()
+    samples = _samples(df)
+    n = len(samples)
+    starts = np.arange(0, n, block_size)
+
+    # Differences of the whole recording at once; each block starts with
+    # its absolute first sample
+    deltas = np.diff(samples, axis=0, prepend=np.zeros((1, 3), dtype=np.int64))
+    deltas[:, 0] -= NOMINAL_INTERVAL_MS
+    deltas[starts] = samples[starts]
+    values = zigzag_encode(deltas.ravel())
+
+    blocks = [_compress(encode_varints(values[start * 3:(start + block_size) * 3]), compression)
+              for start in starts]
+    index = np.zeros(len(blocks), dtype=INDEX_DTYPE)
+    index['start'] = starts
+    index['size'] = [len(block) for block in blocks]
+    index['offset'] = np.cumsum(index['size'], dtype=np.uint64) - index['size']
+    index['timestamp'] = samples[starts, 0]
+
+    header = HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, COMPRESSIONS[compression], block_size,
+                         n, len(blocks), int(samples[0, 0]) if n else 0)
+    return header + index.tobytes() + b''.join(blocks)
+
+
+def write_archive(df, path, block_size=BLOCK_SIZE, compression=None):
+    """Write a recording as an archive; returns the file size in bytes"""
+    data = encode_recording(df, block_size, compression)
+    # Write then rename, so a reader never sees a partial archive
+    partial = path + '.part'
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+    return len(data)
+
+
+class ArchiveReader:
+    """
+    Random-access reader of an archive file.
+
+    Only the header and the block index are read when opening; read()
+    loads the blocks covering the requested samples.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or not header.startswith(ARCHIVE_MAGIC):
+                raise ValueError(f"{path} is not a recording archive")
+            (_, version, compression, self.block_size, self.n_samples, n_blocks,
+             self.first_timestamp) = HEADER.unpack(header)
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported archive version {version}")
+            self.index = np.frombuffer(f.read(n_blocks * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+            if len(self.index) != n_blocks:
+                raise ValueError(f"Truncated archive {path}")
+        self.compression = {code: name for name, code in COMPRESSIONS.items()}[compression]
+        self._data_offset = HEADER.size + n_blocks * INDEX_DTYPE.itemsize
+
+    def __len__(self):
+        return self.n_samples
+
+    def locate(self, timestamp):
+        """Index of the first sample at or after `timestamp` (ms), decoding one block"""
+        if not len(self.index):
+            return 0
+        block = max(int(np.searchsorted(self.index['timestamp'], timestamp, side='right')) - 1, 0)
+        start = int(self.index['start'][block])
+        samples = self._decode(block, block + 1)
+        return start + int(np.searchsorted(samples[:, 0], timestamp))
+
+    def _decode(self, first, last):
+        """int64 samples of blocks first..last-1"""
+        blocks = self.index[first:last]
+        if not len(blocks):
+            return np.empty((0, 3), dtype=np.int64)
+        with open(self.path, 'rb') as f:
+            f.seek(self._data_offset + int(blocks['offset'][0]))
+            data = f.read(int(blocks['offset'][-1] - blocks['offset'][0]) + int(blocks['size'][-1]))
+        bounds = (blocks['offset'] - blocks['offset'][0]).astype(np.int64)
+        payload = b''.join(_decompress(data[offset:offset + size], self.compression)
+                           for offset, size in zip(bounds, blocks['size'].astype(np.int64)))
+
+        # All blocks decode in one pass; the cumulative sum restarts at
+        # each block's absolute first sample
+        values, used = decode_varints(payload)
+        counts = np.minimum(self.block_size, self.n_samples - blocks['start']).astype(np.int64)
+        if used != len(payload) or len(values) != counts.sum() * 3:
+            raise ValueError(f"Corrupt archive {self.path}")
+        deltas = zigzag_decode(values).reshape(-1, 3)
+        block_starts = np.cumsum(counts) - counts
+        deltas[:, 0] += NOMINAL_INTERVAL_MS
+        deltas[block_starts, 0] -= NOMINAL_INTERVAL_MS
+        totals = np.cumsum(deltas, axis=0)
+        before = np.vstack((np.zeros((1, 3), dtype=np.int64), totals[block_starts[1:] - 1]))
+        return totals - np.repeat(before, counts, axis=0)
+
+    def read(self, start=0, stop=None):
+        """
+        Samples start..stop-1 in the layout of the decoders' DataFrames.
+
+        time_delta stays relative to the recording's first sample.
+        """
+        stop = self.n_samples if stop is None else min(stop, self.n_samples)
+        start = max(start, 0)
+        if start >= stop:
+            samples = np.empty((0, 3), dtype=np.int64)
+        else:
+            first = start // self.block_size
+            last = (stop - 1) // self.block_size + 1
+            offset = first * self.block_size
+            samples = self._decode(first, last)[start - offset:stop - offset]
+        df = pd.DataFrame({
+            'timestamp': samples[:, 0],
+            'ir': samples[:, 1],
+            'red': samples[:, 2]
+        })
+        df['time_delta'] = (df['timestamp'] - self.first_timestamp) / 1000.0
+        return df
+
+
+def read_archive(path):
+    """Whole recording from an archive"""
+    return ArchiveReader(path).read()
+
+
+def load_recording(path, columns=None):
+    """Recording from an archive or a CSV file, optionally only some columns"""
+    if path.endswith(ARCHIVE_EXTENSION):
+        df = read_archive(path)
+        return df[columns] if columns is not None else df
+    return pd.read_csv(path, usecols=columns)
+
+
+def archive_path(csv_path, archive_dir=ARCHIVE_DIR):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(archive_dir, name + ARCHIVE_EXTENSION)
+
+
+def archive_file(csv_path, archive_dir=ARCHIVE_DIR, block_size=BLOCK_SIZE, compression=None,
+                 verify=False):
+    """
+    Archive one CSV recording.
+
+    Returns:
+        dict with the archive path, both sizes and, when verifying, the read
+        times of the CSV and of the archive
+    """
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path)
+    csv_seconds = time.perf_counter() - start
+    path = archive_path(csv_path, archive_dir)
+    size = write_archive(df, path, block_size, compression)
+    result = {'archive': path, 'csv_bytes': os.path.getsize(csv_path), 'archive_bytes': size}
+    if verify:
+        start = time.perf_counter()
+        restored = read_archive(path)
+        result['csv_seconds'] = csv_seconds
+        result['archive_seconds'] = time.perf_counter() - start
+        pd.testing.assert_frame_equal(restored, df[restored.columns], check_dtype=False,
+                                      check_exact=False, rtol=0, atol=1e-6)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive stored recordings in a compact format')
+    parser.add_argument('files', nargs='*', help='CSV files to archive')
+    parser.add_argument('--all', action='store_true',
+                        help='Archive every recording in data/csv')
+    parser.add_argument('--output', default=ARCHIVE_DIR, help='Archive directory')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Samples per block')
+    parser.add_argument('--compression', choices=sorted(COMPRESSIONS),
+                        help='Block compression (default: zstd if installed, else zlib)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Read each archive back and compare it with the CSV')
+    parser.add_argument('--remove-csv', action='store_true',
+                        help='Delete each CSV once its archive is verified')
+    parser.add_argument('--extract', nargs='+', metavar='ARCHIVE',
+                        help='Write archives back as CSV files into data/csv')
+
+    args = parser.parse_args()
+
+    if args.extract:
+        os.makedirs(os.path.join('data', 'csv'), exist_ok=True)
+        for path in args.extract:
+            csv_path = os.path.join('data', 'csv',
+                                    os.path.splitext(os.path.basename(path))[0] + '.csv')
+            save_decoded_data(read_archive(path), csv_path)
+            print(f"{path} -> {csv_path}")
+        return
+
+    if args.all:
+        files = sorted(glob.glob(os.path.join('data', 'csv', '*.csv')))
+    elif args.files:
+        files = args.files
+    else:
+        parser.print_help()
+        return
+
+    os.makedirs(args.output, exist_ok=True)
+    total_csv = total_archive = 0
+    for csv_path in files:
+        try:
+            result = archive_file(csv_path, args.output, args.block_size, args.compression,
+                                  verify=args.verify or args.remove_csv)
+        except (ValueError, AssertionError) as e:
+            print(f"{os.path.basename(csv_path)}: not archived ({e})")
+            continue
+        total_csv += result['csv_bytes']
+        total_archive += result['archive_bytes']
+        line = (f"{os.path.basename(csv_path)}: {result['csv_bytes']} -> "
+                f"{result['archive_bytes']} bytes "
+                f"({result['csv_bytes'] / max(result['archive_bytes'], 1):.1f}x)")
+        if 'archive_seconds' in result:
+            line += (f", read {result['csv_seconds'] * 1000:.1f} ms as CSV, "
+                     f"{result['archive_seconds'] * 1000:.1f} ms archived")
+        print(line)
+        if args.remove_csv:
+            os.remove(csv_path)
+    if total_archive:
+        print(f"Total: {total_csv} -> {total_archive} bytes ({total_csv / total_archive:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
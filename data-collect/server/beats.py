@@ -0,0 +1,213 @@
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.ndimage import median_filter
+from scipy.signal import find_peaks
+from filters import bandpass_filter
+from recording_cache import RecordingCache
+
+SAMPLING_RATE = 40      # Hz, nominal sensor rate
+MIN_HEART_RATE = 30     # BPM; longer RR intervals are rejected
+MAX_HEART_RATE = 200    # BPM; also sets the refractory distance between peaks
+PROMINENCE = 0.3        # Minimum peak prominence, in standard deviations of the filtered signal
+MAX_RR_DEVIATION = 0.3  # Max relative deviation of an RR interval from its local median
+MEDIAN_BEATS = 5        # Beats in the local median used for artifact rejection
+
+CACHE_SIZE = 32         # Recordings kept in the beat cache
+
+
+def estimate_fs(time_delta, default=SAMPLING_RATE):
+    """Sampling frequency from the median interval of a time column (seconds)"""
+    intervals = np.diff(np.asarray(time_delta, dtype=np.float64))
+    intervals = intervals[intervals > 0]
+    if len(intervals) == 0:
+        return float(default)
+    return float(1.0 / np.median(intervals))
+
+
+def detect_peaks(ir, fs=SAMPLING_RATE):
+    """
+    Systolic peaks of a whole IR recording.
+
+    The signal is bandpass filtered with zero phase (so peaks are not
+    shifted), standardized, and searched with find_peaks using a refractory
+    distance of one beat at MAX_HEART_RATE.
+
+    Returns:
+        Tuple (peak indices, peak positions refined to a fraction of a sample)
+    """
+    # Shorter than one beat at MIN_HEART_RATE (no interval can be measured)
+    # or flat (the filter would only leave rounding noise)
+    ir = np.asarray(ir, dtype=np.float64)
+    if len(ir) < fs * 60.0 / MIN_HEART_RATE or np.ptp(ir) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    filtered = bandpass_filter(ir, 0.5, 4.0, fs, order=2)
+    z = (filtered - filtered.mean()) / filtered.std()
+
+    distance = max(1, int(fs * 60.0 / MAX_HEART_RATE))
+    peaks, _ = find_peaks(z, distance=distance, prominence=PROMINENCE)
+
+    # Parabolic interpolation through each peak and its neighbours; at 40 Hz
+    # the sample grid alone quantizes RR intervals to 25 ms
+    left, center, right = z[peaks - 1], z[peaks], z[peaks + 1]
+    denominator = left - 2 * center + right
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offset = np.where(denominator != 0, 0.5 * (left - right) / denominator, 0.0)
+    return peaks, peaks + np.clip(offset, -0.5, 0.5)
+
+
+def rr_intervals(beat_times):
+    """
+    RR intervals between consecutive beats and a validity mask.
+
+    An interval is valid when it is within the MIN/MAX_HEART_RATE range and
+    within MAX_RR_DEVIATION of the median of its neighbours (missed or
+    extra beats show up as outliers there).
+
+    Args:
+        beat_times: Beat times in seconds
+
+    Returns:
+        Tuple (rr in seconds, valid mask), one entry per beat after the first
+    """
+    rr = np.diff(np.asarray(beat_times, dtype=np.float64))
+    valid = (rr >= 60.0 / MAX_HEART_RATE) & (rr <= 60.0 / MIN_HEART_RATE)
+    if len(rr):
+        local_median = median_filter(rr, size=MEDIAN_BEATS, mode='nearest')
+        valid &= np.abs(rr - local_median) <= MAX_RR_DEVIATION * local_median
+    return rr, valid
+
+
+def hrv_metrics(rr, valid):
+    """
+    Heart rate and HRV over the valid RR intervals.
+
+    RMSSD and pNN50 use only successive differences where both intervals
+    are valid.
+
+    Returns:
+        Dict with beats, mean_hr (BPM), mean_rr, sdnn, rmssd (ms) and pnn50 (%)
+    """
+    rr_ms = rr[valid] * 1000.0
+    pairs = valid[1:] & valid[:-1]
+    successive = np.diff(rr * 1000.0)[pairs]
+
+    metrics = {
+        'beats': int(len(rr) + 1) if len(rr) else 0,
+        'valid_intervals': int(valid.sum()),
+        'mean_hr': None,
+        'mean_rr': None,
+        'sdnn': None,
+        'rmssd': None,
+        'pnn50': None,
+    }
+    if len(rr_ms):
+        metrics['mean_rr'] = float(rr_ms.mean())
+        metrics['mean_hr'] = float(60000.0 / rr_ms.mean())
+    if len(rr_ms) > 1:
+        metrics['sdnn'] = float(rr_ms.std(ddof=1))
+    if len(successive):
+        metrics['rmssd'] = float(np.sqrt(np.mean(successive ** 2)))
+        metrics['pnn50'] = float(np.mean(np.abs(successive) > 50.0) * 100.0)
+    return metrics
+
+
+def analyze_beats(df, fs=None):
+    """
+    Beats, RR intervals, instantaneous HR and HRV metrics of a recording.
+
+    Args:
+        df: DataFrame with 'ir' and 'time_delta' columns
+        fs: Sampling frequency (Hz); estimated from time_delta when None
+
+    Returns:
+        Tuple (beats DataFrame, metrics dict)
+    """
+    time_delta = df['time_delta'].to_numpy(dtype=np.float64)
+    if fs is None:
+        fs = estimate_fs(time_delta)
+
+    peaks, positions = detect_peaks(df['ir'].to_numpy(dtype=np.float64), fs)
+    # Beat times come from the recorded timestamps, so jitter in the sample
+    # spacing does not leak into the intervals (an empty recording has none)
+    if len(time_delta):
+        beat_times = np.interp(positions, np.arange(len(time_delta)), time_delta)
+    else:
+        beat_times = np.empty(0)
+    rr, valid = rr_intervals(beat_times)
+
+    with np.errstate(divide='ignore'):
+        instant_hr = np.where(rr > 0, 60.0 / rr, 0.0)
+    # The first beat has no interval before it
+    first = slice(0, 1 if len(peaks) else 0)
+    beats = pd.DataFrame({
+        'index': peaks,
+        'time': beat_times,
+        'rr_ms': np.concatenate(([np.nan][first], rr * 1000.0)),
+        'hr': np.concatenate(([np.nan][first], instant_hr)),
+        'valid': np.concatenate(([False][first], valid)),
+    })
+    metrics = hrv_metrics(rr, valid)
+    metrics['fs'] = float(fs)
+    metrics['duration'] = float(time_delta[-1] - time_delta[0]) if len(time_delta) else 0.0
+    return beats, metrics
+
+
+_cache = RecordingCache(CACHE_SIZE)
+
+
+def analyze_recording(file_path, fs=None):
+    """
+    analyze_beats for a CSV recording, cached per file.
+
+    A rewritten recording is analyzed again. The returned objects are
+    shared between callers and must not be modified.
+    """
+    return _cache.get(
+        file_path,
+        lambda path: analyze_beats(pd.read_csv(path, usecols=['ir', 'time_delta']), fs),
+        fs)
+
+
+def _format(value, unit=''):
+    return '-' if value is None else f"{value:.1f}{unit}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Detect beats and compute HRV for stored recordings')
+    parser.add_argument('file', nargs='?', help='CSV file to process')
+    parser.add_argument('--all', action='store_true',
+                        help='Process every recording in data/csv')
+    parser.add_argument('--fs', type=float,
+                        help='Sampling frequency (default: estimated from time_delta)')
+    parser.add_argument('--beats', action='store_true',
+                        help='Print every beat, not only the summary')
+
+    args = parser.parse_args()
+
+    if args.all:
+        files = sorted(glob.glob(os.path.join('data', 'csv', '*.csv')))
+    elif args.file:
+        files = [args.file]
+    else:
+        parser.print_help()
+        return
+
+    for file_path in files:
+        start = time.perf_counter()
+        beats, metrics = analyze_recording(file_path, args.fs)
+        elapsed = time.perf_counter() - start
+        print(f"{os.path.basename(file_path)}: {metrics['beats']} beats in "
+              f"{metrics['duration']:.0f}s, HR {_format(metrics['mean_hr'], ' bpm')}, "
+              f"SDNN {_format(metrics['sdnn'], ' ms')}, RMSSD {_format(metrics['rmssd'], ' ms')}, "
+              f"pNN50 {_format(metrics['pnn50'], '%')} ({elapsed * 1000:.1f} ms)")
+        if args.beats:
+            print(beats.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
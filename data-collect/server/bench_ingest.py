@@ -0,0 +1,304 @@
+"""
+Benchmarks for the data-collect ingestion path.
+
+Measures the decoders on synthetic text, binary and delta payloads, and the full
+chunked upload through /data (Flask test client, or a running server with
+--url): per-chunk request latency, finalize latency until the CSV is
+written, analysis latency and throughput. Results can be saved as a
+baseline and compared against later runs:
+
+    python bench_ingest.py --save baseline.json
+    python bench_ingest.py --compare baseline.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import urllib.request
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from data_decoder import (decode_text_sensor_data, decode_binary_sensor_data, decode_delta_frame,
+                          decode_chunked_data, encode_delta_frame)
+from synthetic_upload import (CHUNK_SIZE, synthetic_samples, text_payload, binary_payload,
+                              chunked_upload, post)
+
+DECODE_SIZES = [1000, 10000, 100000]
+UPLOAD_SIZES = [6000, 24000]
+REPEAT = 5
+FINALIZE_TIMEOUT = 120.0
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(fn, repeat=REPEAT, memory=False):
+    """
+    Time fn over several runs.
+
+    Returns:
+        Dict with min and median milliseconds and, with memory, the peak
+        traced allocation of one extra run in KB
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    result = {'min_ms': min(times) * 1000, 'median_ms': float(np.median(times)) * 1000}
+    if memory:
+        tracemalloc.start()
+        fn()
+        result['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def bench_decoders(sizes=DECODE_SIZES, repeat=REPEAT, memory=False):
+    results = []
+    for n_samples in sizes:
+        samples = synthetic_samples(n_samples)
+        text = text_payload(*samples)
+        binary = binary_payload(*samples)
+        delta = encode_delta_frame(*samples)
+        chunks = [{'data': text_payload(*(column[start:start + CHUNK_SIZE] for column in samples)),
+                   'chunk_index': index, 'start_index': start}
+                  for index, start in enumerate(range(0, n_samples, CHUNK_SIZE))]
+
+        cases = [
+            ('decode_text', lambda: decode_text_sensor_data(text), len(text)),
+            ('decode_binary', lambda: decode_binary_sensor_data(binary), len(binary)),
+            ('decode_delta', lambda: decode_delta_frame(delta), len(delta)),
+            ('decode_chunked', lambda: decode_chunked_data(list(chunks)), len(text)),
+        ]
+        for name, fn, size in cases:
+            result = measure(fn, repeat, memory)
+            result.update({
+                'name': f"{name}[{n_samples}]",
+                'samples': n_samples,
+                'bytes': size,
+                'samples_per_s': n_samples / (result['median_ms'] / 1000),
+            })
+            results.append(result)
+    return results
+
+
+def _wait_for(condition, timeout=FINALIZE_TIMEOUT, interval=0.005):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def _snapshot_key(snapshot):
+    """Identifies an upload or analysis snapshot by value (SQLite stores return fresh dicts)"""
+    if not snapshot:
+        return None
+    return snapshot.get('filename'), snapshot.get('samples'), snapshot.get('timestamp')
+
+
+def bench_upload_client(server, n_samples, chunk_size):
+    """Chunked upload through the Flask test client; finalize is observed on the analysis store"""
+    client = server.app.test_client()
+    requests = chunked_upload(n_samples, chunk_size)
+    store = server.analysis_store
+    previous_data = _snapshot_key(store.last_data)
+    previous_analysis = _snapshot_key(store.last_analysis)
+
+    latencies = []
+    start = time.perf_counter()
+    for headers, body in requests:
+        t0 = time.perf_counter()
+        response = client.post('/data', data=body, headers=headers)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"/data returned {response.status_code}")
+    sent = time.perf_counter()
+
+    def finalized_upload():
+        current = store.last_data
+        return (_snapshot_key(current) not in (None, previous_data)
+                and current.get('samples') == n_samples)
+
+    if not _wait_for(finalized_upload):
+        raise RuntimeError("Upload was not finalized in time")
+    finalized = time.perf_counter()
+    filename = store.last_data['filename']
+
+    def analyzed_upload():
+        current = store.last_analysis
+        return (_snapshot_key(current) not in (None, previous_analysis)
+                and current.get('filename') == filename)
+
+    analyzed = None
+    if _wait_for(analyzed_upload):
+        analyzed = time.perf_counter()
+
+    return latencies, start, sent, finalized, analyzed, requests
+
+
+def bench_upload_url(url, n_samples, chunk_size):
+    """Chunked upload to a running server; finalize is observed through /status"""
+    status_url = url.rsplit('/', 1)[0] + '/status'
+
+    def last_data():
+        with urllib.request.urlopen(status_url, timeout=10) as response:
+            return json.loads(response.read()).get('last_data')
+
+    requests = chunked_upload(n_samples, chunk_size)
+    previous = last_data()
+
+    latencies = []
+    start = time.perf_counter()
+    for headers, body in requests:
+        status, elapsed = post(url, headers, body)
+        latencies.append(elapsed)
+        if status != 200:
+            raise RuntimeError(f"/data returned {status}")
+    sent = time.perf_counter()
+
+    def finalized_upload():
+        current = last_data()
+        return current != previous and current and current.get('samples') == n_samples
+
+    if not _wait_for(finalized_upload, interval=0.05):
+        raise RuntimeError("Upload was not finalized in time")
+    return latencies, start, sent, time.perf_counter(), None, requests
+
+
+def bench_uploads(sizes=UPLOAD_SIZES, chunk_size=CHUNK_SIZE, url=None, verbose=False):
+    server = None
+    if url is None:
+        import server  # Creates its data directories in the working directory
+
+    results = []
+    for n_samples in sizes:
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            if url is None:
+                run = bench_upload_client(server, n_samples, chunk_size)
+            else:
+                run = bench_upload_url(url, n_samples, chunk_size)
+        latencies, start, sent, finalized, analyzed, requests = run
+
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            'name': f"upload[{n_samples}]",
+            'samples': n_samples,
+            'chunks': len(requests),
+            'bytes': sum(len(body) for _, body in requests),
+            'chunk_p50_ms': float(np.percentile(latencies_ms, 50)),
+            'chunk_p95_ms': float(np.percentile(latencies_ms, 95)),
+            'finalize_ms': (finalized - sent) * 1000,
+            'analysis_ms': (analyzed - finalized) * 1000 if analyzed else None,
+            'samples_per_s': n_samples / (finalized - start),
+        })
+    return results
+
+
+def _fmt(value, spec='.2f'):
+    return '-' if value is None else format(value, spec)
+
+
+def print_results(results):
+    if results.get('decode'):
+        print(f"{'decoder':<24} {'median ms':>10} {'min ms':>9} {'samples/s':>12} {'peak KB':>9}")
+        for r in results['decode']:
+            print(f"{r['name']:<24} {r['median_ms']:>10.2f} {r['min_ms']:>9.2f} "
+                  f"{r['samples_per_s']:>12,.0f} {_fmt(r.get('peak_kb'), '.0f'):>9}")
+        print()
+    if results.get('upload'):
+        print(f"{'upload':<16} {'chunks':>6} {'KB':>8} {'chunk p50':>10} {'chunk p95':>10} "
+              f"{'finalize':>9} {'analysis':>9} {'samples/s':>11}")
+        for r in results['upload']:
+            print(f"{r['name']:<16} {r['chunks']:>6} {r['bytes'] / 1024:>8.1f} "
+                  f"{r['chunk_p50_ms']:>8.2f}ms {r['chunk_p95_ms']:>8.2f}ms "
+                  f"{r['finalize_ms']:>7.1f}ms {_fmt(r['analysis_ms'], '.1f'):>7}ms "
+                  f"{r['samples_per_s']:>11,.0f}")
+        print()
+    print(f"Peak RSS: {_fmt(results.get('peak_rss_mb'), '.1f')} MB")
+
+
+def compare(results, baseline):
+    """Print the change of the main metric of every case against a baseline"""
+    metrics = {'decode': 'median_ms', 'upload': 'finalize_ms'}
+    print(f"\n{'case':<24} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}")
+    for group, metric in metrics.items():
+        previous = {r['name']: r for r in baseline.get(group, [])}
+        for r in results.get(group, []):
+            if r['name'] not in previous:
+                continue
+            old, new = previous[r['name']][metric], r[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"{r['name']:<24} {metric:<12} {old:>10.2f} {new:>10.2f} {change:>+7.1f}%")
+    old, new = baseline.get('peak_rss_mb'), results.get('peak_rss_mb')
+    if old and new:
+        print(f"{'process':<24} {'peak_rss_mb':<12} {old:>10.1f} {new:>10.1f} "
+              f"{(new - old) / old * 100:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark decoding and chunked uploads of the data-collect server')
+    parser.add_argument('--decode-sizes', type=int, nargs='+', default=DECODE_SIZES,
+                        help='Payload sizes (samples) for the decoder benchmarks')
+    parser.add_argument('--upload-sizes', type=int, nargs='+', default=UPLOAD_SIZES,
+                        help='Upload sizes (samples) for the end-to-end benchmarks')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Samples per chunk')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Runs per decoder case')
+    parser.add_argument('--memory', action='store_true',
+                        help='Also trace peak allocations of each decoder case')
+    parser.add_argument('--url', help='Benchmark a running server (e.g. http://localhost:8888/data) '
+                                      'instead of the Flask test client')
+    parser.add_argument('--workdir', help='Working directory for the in-process server '
+                                          '(default: a temporary directory)')
+    parser.add_argument('--skip-decode', action='store_true', help='Skip decoder benchmarks')
+    parser.add_argument('--skip-upload', action='store_true', help='Skip upload benchmarks')
+    parser.add_argument('--verbose', action='store_true', help='Show server output')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Compare with results saved by --save')
+
+    args = parser.parse_args()
+    # Result files stay relative to where the benchmark was started
+    save = os.path.abspath(args.save) if args.save else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    results = {'python': sys.version.split()[0], 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+    if not args.skip_decode:
+        results['decode'] = bench_decoders(args.decode_sizes, args.repeat, args.memory)
+    if not args.skip_upload:
+        if args.url is None:
+            os.chdir(args.workdir or tempfile.mkdtemp(prefix='bench_ingest_'))
+        results['upload'] = bench_uploads(args.upload_sizes, args.chunk_size, args.url, args.verbose)
+    results['peak_rss_mb'] = peak_rss_mb()
+
+    print_results(results)
+    if baseline:
+        with open(baseline) as f:
+            compare(results, json.load(f))
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {save}")
+
+
+if __name__ == "__main__":
+    main()
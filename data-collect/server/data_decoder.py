@@ -1,8 +1,16 @@
 import pandas as pd
 import numpy as np
 import struct
+import zlib
 from typing import List, Tuple, Union, BinaryIO
 
+# Delta frame: magic, then LEB128 varints: sample count, first timestamp,
+# IR and RED, then per following sample the zigzag-encoded differences
+# (timestamp step - NOMINAL_INTERVAL_MS, IR step, RED step)
+DELTA_MAGIC = b'PPD1'
+DELTA_CONTENT_TYPE = 'application/x-ppg-delta'
+NOMINAL_INTERVAL_MS = 25  # 40 Hz sampling
+
 
 def decode_sensor_data(raw_data: Union[str, bytes]) -> pd.DataFrame:
     """
@@ -24,6 +32,8 @@ def decode_sensor_data(raw_data: Union[str, bytes]) -> pd.DataFrame:
 
     # Check if input is binary data
     if isinstance(raw_data, bytes):
+        if raw_data.startswith(DELTA_MAGIC):
+            return decode_delta_frame(raw_data)
         return decode_binary_sensor_data(raw_data)
     else:
         return decode_text_sensor_data(raw_data)
@@ -100,6 +110,259 @@ def decode_binary_sensor_data(raw_data: bytes) -> pd.DataFrame:
     return df
 
 
+def zigzag_encode(values: np.ndarray) -> np.ndarray:
+    """Signed integers as unsigned, small magnitudes first (0, -1, 1, -2, ...)"""
+    values = np.asarray(values).astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def zigzag_decode(values: np.ndarray) -> np.ndarray:
+    """Inverse of zigzag_encode"""
+    values = np.asarray(values, dtype=np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128 varints of unsigned integers, built with one pass per byte position"""
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    offsets = np.cumsum(lengths) - lengths
+    for k in range(int(lengths.max(initial=0))):
+        has = lengths > k
+        byte = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (lengths[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[has] + k] = byte | more
+    return out.tobytes()
+
+
+def decode_varints(data: Union[bytes, np.ndarray]) -> Tuple[np.ndarray, int]:
+    """
+    Decode the complete LEB128 varints at the start of `data`.
+
+    Returns:
+        Tuple (uint64 values, number of bytes consumed); trailing bytes of
+        an incomplete varint are not consumed
+    """
+    buf = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else data
+    ends = np.flatnonzero(buf < 0x80)
+    if len(ends) == 0:
+        return np.empty(0, dtype=np.uint64), 0
+    used = int(ends[-1]) + 1
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    if lengths.max() > 10:
+        raise ValueError("Malformed varint")
+    position = np.arange(used) - np.repeat(starts, lengths)
+    parts = (buf[:used] & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts), used
+
+
+def encode_delta_frame(timestamp, ir, red) -> bytes:
+    """Encode samples as a delta frame (see DELTA_MAGIC)"""
+    samples = np.column_stack([timestamp, ir, red]).astype(np.int64)
+    header = [len(samples)]
+    if len(samples):
+        header.extend(samples[0].tolist())
+    deltas = np.diff(samples, axis=0)
+    deltas[:, 0] -= NOMINAL_INTERVAL_MS
+    return (DELTA_MAGIC + encode_varints(np.array(header, dtype=np.uint64))
+            + encode_varints(zigzag_encode(deltas.ravel())))
+
+
+class DeltaFrameDecoder:
+    """
+    Decoder of one delta frame, with vectorized numpy operations.
+
+    feed() also accepts the frame in pieces of any size and returns the
+    samples completed by that piece. The server decodes whole frames
+    (decode_delta_frame) when a session is finalized.
+    """
+
+    def __init__(self):
+        self.n_samples = None
+        self.decoded = 0
+        self._magic = False
+        self._pending = b''                          # Bytes of an incomplete varint (or magic)
+        self._values = np.empty(0, dtype=np.uint64)  # Varints not forming a whole sample yet
+        self._last = None                            # Previous sample (timestamp, ir, red)
+        self._blocks = []
+
+    @property
+    def complete(self):
+        return self.n_samples is not None and self.decoded >= self.n_samples
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Decode the next piece of the frame.
+
+        Returns:
+            int64 array of shape (n, 3) with the samples completed by this piece
+        """
+        data = self._pending + data
+        if not self._magic:
+            if len(data) < len(DELTA_MAGIC):
+                self._pending = data
+                return np.empty((0, 3), dtype=np.int64)
+            if not data.startswith(DELTA_MAGIC):
+                raise ValueError("Not a delta frame")
+            self._magic = True
+            data = data[len(DELTA_MAGIC):]
+
+        values, used = decode_varints(data)
+        self._pending = data[used:]
+        values = np.concatenate((self._values, values))
+
+        samples = np.empty((0, 3), dtype=np.int64)
+        if self.n_samples is None:
+            if not len(values):
+                self._values = values
+                return samples
+            self.n_samples = int(values[0])
+            values = values[1:]
+        if self._last is None and self.n_samples > 0:
+            if len(values) < 3:
+                self._values = values
+                return samples
+            self._last = values[:3].astype(np.int64)
+            samples = self._last[None, :]
+            self.decoded = 1
+            values = values[3:]
+
+        count = min(len(values) // 3, self.n_samples - self.decoded) if self._last is not None else 0
+        if count > 0:
+            deltas = zigzag_decode(values[:count * 3]).reshape(-1, 3)
+            deltas[:, 0] += NOMINAL_INTERVAL_MS
+            steps = self._last + np.cumsum(deltas, axis=0)
+            self._last = steps[-1]
+            self.decoded += count
+            samples = np.concatenate((samples, steps))
+        # Anything past the last sample is ignored
+        self._values = values[count * 3:] if not self.complete else np.empty(0, dtype=np.uint64)
+        if len(samples):
+            self._blocks.append(samples)
+        return samples
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """All decoded samples, in the same layout as the other decoders"""
+        if not self.complete:
+            raise ValueError(f"Truncated delta frame: {self.decoded} of "
+                             f"{self.n_samples if self.n_samples is not None else '?'} samples")
+        samples = np.concatenate(self._blocks) if self._blocks else np.empty((0, 3), dtype=np.int64)
+        df = pd.DataFrame({
+            'timestamp': samples[:, 0],
+            'ir': samples[:, 1],
+            'red': samples[:, 2]
+        })
+        if not df.empty:
+            df['time_delta'] = (df['timestamp'] - df['timestamp'].iloc[0]) / 1000.0
+        return df
+
+
+def decode_delta_frame(raw_data: bytes) -> pd.DataFrame:
+    """Decode sensor data in the delta frame format"""
+    decoder = DeltaFrameDecoder()
+    decoder.feed(raw_data)
+    return decoder.to_dataframe()
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class BodyDecompressor:
+    """
+    Incremental decoder of an HTTP Content-Encoding (gzip, deflate or none).
+
+    Raises ValueError for unsupported encodings, corrupt data or a
+    compressed stream that ends early (checked by flush()), and
+    BodyTooLarge for output beyond `max_size` bytes.
+    """
+
+    def __init__(self, content_encoding: str = None, max_size: int = None):
+        encoding = (content_encoding or 'identity').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._zlib = None   # zlib-wrapped or raw; decided on the first bytes
+        elif encoding == 'identity':
+            self._zlib = False
+        else:
+            raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+        self.max_size = max_size
+        self.size = 0
+
+    def _check(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise BodyTooLarge(f"Upload exceeds {self.max_size} bytes")
+        return data
+
+    @property
+    def compressed(self):
+        return self._zlib is not False
+
+    def feed(self, data: bytes) -> bytes:
+        if self._zlib is False:
+            return self._check(data)
+        if self._zlib is None:
+            # Some clients send raw deflate despite the standard (RFC 9110) zlib format
+            zlib_header = len(data) >= 2 and (data[0] & 0x0F) == 8 and \
+                (data[0] << 8 | data[1]) % 31 == 0
+            self._zlib = zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+        limit = 0 if self.max_size is None else self.max_size - self.size + 1
+        try:
+            return self._check(self._zlib.decompress(data, limit))
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed body: {e}")
+
+    def flush(self) -> bytes:
+        if self._zlib is False:
+            return b''
+        if self._zlib is None:
+            raise ValueError("Empty compressed body")
+        try:
+            data = self._check(self._zlib.flush())
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed body: {e}")
+        if not self._zlib.eof:
+            raise ValueError("Truncated compressed body")
+        return data
+
+
+def upload_payload(data: bytes, content_type: str = None) -> Union[str, bytes]:
+    """
+    Raw payload of an uploaded (already decompressed) body.
+
+    Delta frames and application/octet-stream bodies (the fixed-width
+    binary format) stay bytes; everything else is the text format.
+    """
+    if data.startswith(DELTA_MAGIC):
+        return data
+    if content_type and content_type.split(';')[0].strip().lower() == 'application/octet-stream':
+        return data
+    return data.decode('utf-8')
+
+
+def decode_upload_body(body: bytes, content_encoding: str = None, content_type: str = None,
+                       max_size: int = None) -> Union[str, bytes]:
+    """Decompress an uploaded body and return its raw payload (see upload_payload)"""
+    decompressor = BodyDecompressor(content_encoding, max_size)
+    return upload_payload(decompressor.feed(body) + decompressor.flush(), content_type)
+
+
+def payload_format(raw_data: Union[str, bytes]) -> str:
+    """'text', 'binary' or 'delta'"""
+    if isinstance(raw_data, str):
+        return 'text'
+    return 'delta' if raw_data.startswith(DELTA_MAGIC) else 'binary'
+
+
 def decode_chunked_data(chunks_data: List[dict]) -> pd.DataFrame:
     """
     Decode sensor data received in multiple chunks
@@ -125,10 +388,7 @@ def decode_chunked_data(chunks_data: List[dict]) -> pd.DataFrame:
     # Process each chunk
     for chunk in chunks_data:
         # Decode this chunk
-        if isinstance(chunk['data'], bytes):
-            df_chunk = decode_binary_sensor_data(chunk['data'])
-        else:
-            df_chunk = decode_text_sensor_data(chunk['data'])
+        df_chunk = decode_sensor_data(chunk['data'])
 
         # Add to combined datasets
         all_timestamps.extend(df_chunk['timestamp'].tolist())
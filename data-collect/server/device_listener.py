@@ -0,0 +1,194 @@
+"""
+TCP listener for the sensor, usable from the server or as its own process.
+
+In multi-worker deployments the sensor must talk to exactly one process,
+so the listener runs on its own and HTTP workers reach the connection
+through a Unix socket (DEVICE_SOCKET) with RemoteConnection.
+
+Usage:
+    python device_listener.py --socket data/device.sock
+"""
+import os
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+from state import ConnectionManager
+
+TCP_IP = '0.0.0.0'
+TCP_PORT = int(os.environ.get("TCP_PORT", 8889))
+CONTROL_TIMEOUT = 2.0  # Seconds an HTTP worker waits for the listener
+
+
+def handle_client_connection(connection, client_socket, addr, on_message=None):
+    """Handle TCP client connection"""
+    print(f"Connection established with {addr}")
+
+    connection.connect(client_socket, addr)
+
+    try:
+        while True:
+            # Receive data from client
+            data = client_socket.recv(1024)
+            if not data:
+                break
+
+            message = data.decode('utf-8').strip()
+            print(f"Received from {addr}: {message}")
+            if on_message is not None:
+                on_message(message)
+
+            # Handle HELLO message
+            if message == "HELLO":
+                client_socket.send(b"WELCOME\n")
+                print(f"Sent WELCOME to {addr}")
+            # No longer handling Ping/Pong
+    except Exception as e:
+        print(f"Error handling client {addr}: {e}")
+    finally:
+        connection.disconnect(client_socket)
+        client_socket.close()
+        print(f"Connection closed with {addr}")
+
+
+def tcp_server(connection, host=TCP_IP, port=TCP_PORT, on_message=None):
+    """TCP server to handle sensor connections"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(5)
+    print(f"TCP Server listening on {host}:{port}")
+
+    while True:
+        client, addr = server.accept()
+        client_thread = threading.Thread(
+            target=handle_client_connection, args=(connection, client, addr, on_message))
+        client_thread.daemon = True
+        client_thread.start()
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """One JSON request line in, one JSON reply line out"""
+
+    def handle(self):
+        connection = self.server.connection
+        try:
+            request = json.loads(self.rfile.readline())
+            op = request.get('op')
+            if op == 'snapshot':
+                result = connection.snapshot()
+            elif op == 'send_command':
+                result = connection.send_command(request['command'].encode('utf-8'),
+                                                 bool(request['collecting']))
+            elif op == 'set_collecting':
+                connection.set_collecting(bool(request['collecting']))
+                result = None
+            elif op == 'clear':
+                connection.clear()
+                result = None
+            else:
+                raise ValueError(f"Unknown operation {op!r}")
+            reply = {'result': result}
+        except Exception as e:
+            reply = {'error': str(e)}
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b"\n")
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves a ConnectionManager to HTTP workers over a Unix socket"""
+
+    daemon_threads = True
+
+    def __init__(self, path, connection):
+        if os.path.exists(path):
+            os.remove(path)  # Left behind by a previous run
+        self.connection = connection
+        super().__init__(path, _ControlHandler)
+
+
+class RemoteConnection:
+    """
+    ConnectionManager interface backed by a device listener process.
+
+    While the listener is not running the sensor is reported as not
+    connected and commands fail with an error message.
+    """
+
+    def __init__(self, path, timeout=CONTROL_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def _call(self, op, **args):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(json.dumps(dict(args, op=op)).encode('utf-8') + b"\n")
+            reply = json.loads(sock.makefile('rb').readline())
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['result']
+
+    def snapshot(self):
+        try:
+            return self._call('snapshot')
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Device listener unavailable: {e}")
+            return {"connected": False, "client_address": None, "collecting": False}
+
+    @property
+    def connected(self):
+        return self.snapshot()['connected']
+
+    @property
+    def collecting(self):
+        return self.snapshot()['collecting']
+
+    def set_collecting(self, collecting):
+        try:
+            self._call('set_collecting', collecting=collecting)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Device listener unavailable: {e}")
+
+    def clear(self):
+        try:
+            self._call('clear')
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Device listener unavailable: {e}")
+
+    def send_command(self, command, collecting):
+        """Same contract as ConnectionManager.send_command"""
+        try:
+            return self._call('send_command', command=command.decode('utf-8'),
+                              collecting=collecting)
+        except (OSError, ValueError, RuntimeError) as e:
+            return f"Device listener unavailable: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sensor TCP listener for multi-worker deployments')
+    parser.add_argument('--socket', default=os.environ.get("DEVICE_SOCKET"),
+                        help='Unix socket served to HTTP workers (default: $DEVICE_SOCKET)')
+    parser.add_argument('--port', type=int, default=TCP_PORT, help='TCP port for the sensor')
+    parser.add_argument('--host', default=TCP_IP)
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error('--socket or DEVICE_SOCKET is required')
+
+    connection = ConnectionManager()
+    control = ControlServer(args.socket, connection)
+    threading.Thread(target=control.serve_forever, daemon=True, name='device-control').start()
+    print(f"Device control socket at {args.socket}")
+    try:
+        tcp_server(connection, args.host, args.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        control.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+from functools import lru_cache
+from scipy.signal import butter, sosfilt, sosfilt_zi, sosfiltfilt
+
+
+@lru_cache(maxsize=64)
+def bandpass_sos(lowcut, highcut, fs, order=5):
+    """
+    Design a Butterworth bandpass filter as second-order sections.
+
+    Designs are cached by (lowcut, highcut, fs, order), so re-filtering many
+    windows or files does not pay the design cost again. The returned array
+    is shared between callers and must not be modified.
+    """
+    return butter(order, [lowcut, highcut], btype='band', fs=fs, output='sos')
+
+
+def bandpass_filter(data, lowcut=0.5, highcut=5.0, fs=30.0, order=5, axis=-1):
+    """
+    Zero-phase bandpass filter along an axis.
+
+    Args:
+        data: 1-D signal or N-D array of signals (e.g. IR and red stacked)
+        lowcut, highcut: Passband edges (Hz)
+        fs: Sampling frequency (Hz)
+        order: Butterworth order
+        axis: Axis holding the samples
+
+    Returns:
+        Filtered array with the same shape as data
+    """
+    sos = bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
+    return sosfiltfilt(sos, np.asarray(data, dtype=np.float64), axis=axis)
+
+
+class StreamingBandpass:
+    """
+    Causal bandpass filter applied chunk by chunk.
+
+    Keeps the sosfilt state per channel between calls, so filtering a signal
+    in pieces gives exactly the same output as filtering the concatenated
+    signal at once with the same initial state. Memory stays bounded
+    regardless of the session length.
+    """
+
+    def __init__(self, lowcut=0.5, highcut=5.0, fs=40.0, order=5, channels=1):
+        self.sos = bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
+        self.channels = channels
+        self.zi = None  # (n_sections, channels, 2), set by the first chunk
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, chunk):
+        """
+        Filter the next chunk.
+
+        Args:
+            chunk: Array (channels, n_samples); a 1-D array for one channel
+
+        Returns:
+            Filtered array with the same shape as chunk
+        """
+        chunk = np.asarray(chunk, dtype=np.float64)
+        one_channel = chunk.ndim == 1
+        if one_channel:
+            chunk = chunk[None, :]
+        if chunk.shape[-1] == 0:
+            return chunk[0] if one_channel else chunk
+
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid the
+            # transient caused by the large DC level of the raw signal
+            self.zi = sosfilt_zi(self.sos)[:, None, :] * chunk[None, :, :1]
+
+        filtered, self.zi = sosfilt(self.sos, chunk, axis=-1, zi=self.zi)
+        return filtered[0] if one_channel else filtered
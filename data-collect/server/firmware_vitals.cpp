@@ -0,0 +1,64 @@
+// Runs the firmware's vital-signs code on a recording, to record the values
+// the device reports for each window (see vital_signs.py --check).
+//
+// The headers are used unmodified; only the Arduino parts of config.h are
+// replaced below.
+//
+// Build and record (from data-collect/server):
+//   g++ -O2 -I ../../realtime-tracking/ehtracking firmware_vitals.cpp -o /tmp/firmware_vitals
+//   python vital_signs.py --record-firmware /tmp/firmware_vitals
+//
+// Input (stdin): a recording CSV (timestamp,ir,red,time_delta)
+// Output (stdout): start_index,heart_rate,spo2 per non-overlapping window
+
+#include <cstdio>
+#include <cstdlib>
+#include <cstdarg>
+#include <vector>
+
+// Stand-ins for the parts of config.h the algorithms use
+#define CONFIG_H
+#define SAMPLING_RATE 40
+#define WINDOW_SIZE 100
+
+struct SensorData
+{
+    float red;
+    float ir;
+};
+
+struct SerialStub
+{
+    void println(const char *) {}
+    void printf(const char *, ...) {}
+} Serial;
+
+#include "vital_signs.h"
+#include "vital_signs_algo.h"
+
+int main()
+{
+    std::vector<SensorData> samples;
+    char line[256];
+    if (!fgets(line, sizeof(line), stdin))
+        return 1; // Header
+    while (fgets(line, sizeof(line), stdin))
+    {
+        long timestamp;
+        double ir, red;
+        if (sscanf(line, "%ld,%lf,%lf", &timestamp, &ir, &red) == 3)
+            samples.push_back({(float)red, (float)ir});
+    }
+
+    printf("start_index,heart_rate,spo2\n");
+    for (size_t start = 0; start + WINDOW_SIZE <= samples.size(); start += WINDOW_SIZE)
+    {
+        // Same calls as processing_task.h: the heart rate comes from
+        // calculateVitalSigns, SpO2 from calc_spo2_filtered
+        float hr = 0, spo2 = 0;
+        calculateVitalSigns(&samples[start], WINDOW_SIZE, &hr, &spo2);
+        calc_spo2_filtered(&samples[start], WINDOW_SIZE, SAMPLING_RATE, &spo2);
+        printf("%zu,%.9g,%.9g\n", start, hr, spo2);
+    }
+    return 0;
+}
@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for running several HTTP workers.
+
+Starts the sensor's TCP listener once, as its own process, and points
+every worker at it and at a shared SQLite state database:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+WEB_CONCURRENCY sets the number of workers (default 4); STATE_DB and
+DEVICE_SOCKET override the default paths under data/.
+"""
+import os
+import sys
+import subprocess
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8888)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+
+# Inherited by the workers, which are forked after this file is read
+os.makedirs('data', exist_ok=True)
+os.environ.setdefault("STATE_DB", os.path.abspath(os.path.join('data', 'state.db')))
+os.environ.setdefault("DEVICE_SOCKET", os.path.abspath(os.path.join('data', 'device.sock')))
+
+listener = None
+
+
+def on_starting(server):
+    global listener
+    listener = subprocess.Popen([sys.executable, os.path.join(here, 'device_listener.py'),
+                                 '--socket', os.environ["DEVICE_SOCKET"]])
+    server.log.info("Started device listener (pid %s)", listener.pid)
+
+
+def on_exit(server):
+    if listener is not None:
+        listener.terminate()
+        listener.wait(timeout=10)
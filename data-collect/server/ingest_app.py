@@ -0,0 +1,239 @@
+"""
+ASGI ingestion server for sensor uploads (POST /data).
+
+Upload bodies are received asynchronously, so a slow sensor on Wi-Fi no
+longer holds a WSGI worker. Chunks are stored through server.py's shared
+state in a thread, and decoding (single uploads, completed chunked
+sessions) runs in a process pool. Finalizing a chunked session is a job
+on server.py's JobQueue, so at most JOB_WORKERS sessions are finalized
+at once. Everything is written to the same data directory and STATE_DB
+as the Flask UI, so uploads show up there as usual; run the UI with the
+same STATE_DB.
+
+Metrics: the pool processes import server.py again and record into their
+own registries, which nothing serves. Chunk and upload byte counts and
+the finalize job metrics are recorded in this process, but these series
+are absent from /metrics in ingest mode: datacollect_decode_seconds,
+datacollect_finalize_seconds, datacollect_session_seconds,
+datacollect_uploads_total, datacollect_upload_samples_total, and the
+analysis metrics (the analysis jobs run in the pool processes).
+
+Usage:
+    python ingest_app.py --port 8890          # next to the Flask UI
+    python ingest_app.py --port 8888 --ui     # also serve the UI (one port)
+    uvicorn ingest_app:app --port 8890
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Chunk sessions and the latest upload are shared with the Flask UI
+# (and the pool processes) through the SQLite state store
+os.environ.setdefault("STATE_DB", os.path.abspath(os.path.join('data', 'state.db')))
+
+import server
+from jobs import PRIORITY_FINALIZE
+from data_decoder import BodyDecompressor, BodyTooLarge, upload_payload
+
+INGEST_PORT = int(os.environ.get("INGEST_PORT", 8890))
+INGEST_PROCESSES = int(os.environ.get("INGEST_PROCESSES", os.cpu_count() or 2))
+MAX_BODY = server.MAX_UPLOAD_BYTES  # Bytes per request, before and after decompression
+
+
+def _run(name, *args):
+    """Run a server.py processing function in a pool process"""
+    started = time.time()
+    return started, getattr(server, name)(*args)
+
+
+async def _respond(send, status, text, headers=None):
+    body = text.encode('utf-8')
+    response_headers = [(b'content-type', b'text/plain; charset=utf-8'),
+                        (b'content-length', str(len(body)).encode())]
+    response_headers.extend((name.lower().encode(), str(value).encode())
+                            for name, value in (headers or {}).items())
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(headers, receive):
+    """
+    Request body, decompressed piece by piece as it arrives.
+
+    Compressed pieces are decompressed in a thread, so a large body does
+    not hold up the event loop.
+
+    Returns:
+        Tuple (decompressed body, bytes received), or None if the client
+        went away
+    """
+    if int(headers.get('content-length', 0) or 0) > MAX_BODY:
+        raise BodyTooLarge(f"Upload exceeds {MAX_BODY} bytes")
+    decompressor = BodyDecompressor(headers.get('content-encoding'), MAX_BODY)
+    loop = asyncio.get_event_loop()
+    body = bytearray()
+    received = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        piece = message.get('body', b'')
+        received += len(piece)
+        if received > MAX_BODY:
+            raise BodyTooLarge(f"Upload exceeds {MAX_BODY} bytes")
+        if decompressor.compressed:
+            body += await loop.run_in_executor(None, decompressor.feed, piece)
+        else:
+            body += decompressor.feed(piece)
+        if not message.get('more_body', False):
+            body += await loop.run_in_executor(None, decompressor.flush)
+            return bytes(body), received
+
+
+class IngestApp:
+    """
+    ASGI app taking POST /data like the Flask route.
+
+    Other requests go to `fallback` (another ASGI app, e.g. the Flask UI
+    behind a WSGI adapter) or get a 404.
+    """
+
+    def __init__(self, processes=INGEST_PROCESSES, fallback=None):
+        self.processes = processes
+        self.fallback = fallback
+        self.pool = None
+        self._jobs = []   # Finalize jobs submitted by this app, waited for on shutdown
+
+    def _pool(self):
+        if self.pool is None:
+            # spawn: the server process has threads and open SQLite connections
+            self.pool = ProcessPoolExecutor(self.processes,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == '/data':
+            await self._data(scope, receive, send)
+        elif self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        elif scope['type'] == 'http':
+            await _respond(send, 404, "Not found")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._pool()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                loop = asyncio.get_event_loop()
+                for job in self._jobs:
+                    await loop.run_in_executor(None, server.job_queue.wait, job)
+                if self.pool is not None:
+                    self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _data(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            await _respond(send, 405, "Method not allowed")
+            return
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope['headers']}
+        # Text, binary or delta frame, optionally gzip/deflate compressed
+        try:
+            body = await _read_body(headers, receive)
+            if body is None:
+                return
+            raw_data = upload_payload(body[0], headers.get('content-type'))
+        except BodyTooLarge as e:
+            await _respond(send, 413, str(e))
+            return
+        except ValueError as e:
+            await _respond(send, 400, str(e))
+            return
+        body_size = body[1]
+        server.count_upload_bytes(raw_data, headers.get('content-encoding'), body_size)
+
+        loop = asyncio.get_event_loop()
+        try:
+            # The sensor only uploads once it has stopped collecting
+            await loop.run_in_executor(None, server.connection.set_collecting, False)
+            if 'x-chunk-index' in headers:
+                status, text, response_headers = await self._chunk(loop, headers, raw_data,
+                                                                   body_size)
+            else:
+                _, (text, status, response_headers) = await loop.run_in_executor(
+                    self._pool(), _run, 'process_complete_data', raw_data)
+        except Exception as e:
+            print(f"Error processing data: {e}")
+            status, text, response_headers = 500, f"Error: {str(e)}", {}
+        await _respond(send, status, text, response_headers)
+
+    async def _chunk(self, loop, headers, raw_data, body_size):
+        chunk_index = int(headers.get('x-chunk-index', 0))
+        total_chunks = int(headers.get('x-total-chunks', 1))
+        total_samples = int(headers.get('x-total-samples', 0))
+        start_index = int(headers.get('x-chunk-start-index', 0))
+
+        session_id, session_key, received_count, _ = await loop.run_in_executor(
+            None, server.store_chunk, chunk_index, total_chunks, total_samples, start_index,
+            raw_data, body_size)
+
+        response_headers = {}
+        if received_count >= total_chunks and await loop.run_in_executor(
+                None, server.sessions.claim, session_id):
+            job = await loop.run_in_executor(
+                None, lambda: server.job_queue.submit(
+                    'finalize', f"finalize:{session_id}", self._finalize, session_id,
+                    session_key, priority=PRIORITY_FINALIZE))
+            if job.status == 'rejected':
+                # Keep the chunks so the sensor can resend the last one
+                await loop.run_in_executor(None, server.sessions.release, session_id)
+                return 503, "Server busy, retry the last chunk", {'Retry-After': '5'}
+            self._jobs = [j for j in self._jobs if j.active] + [job]
+            response_headers['X-Job-Id'] = job.id
+        return 200, f"Chunk {chunk_index+1}/{total_chunks} received", response_headers
+
+    def _finalize(self, session_id, session_key):
+        """Finalize a chunked session in the pool (runs in a JobQueue worker)"""
+        _, result = self._pool().submit(_run, 'process_complete_chunks',
+                                        session_id, session_key).result()
+        return result
+
+
+app = IngestApp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ASGI ingestion server for sensor uploads')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=INGEST_PORT)
+    parser.add_argument('--processes', type=int, default=INGEST_PROCESSES,
+                        help='Processes decoding uploads')
+    parser.add_argument('--ui', action='store_true',
+                        help='Also serve the Flask UI for all other routes')
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is not installed (pip install uvicorn)")
+
+    fallback = None
+    if args.ui:
+        from uvicorn.middleware.wsgi import WSGIMiddleware
+        fallback = WSGIMiddleware(server.app)
+
+    print(f"Ingestion server on port {args.port} ({args.processes} decode processes)")
+    print(f"- Shared state: {server.STATE_DB}")
+    uvicorn.run(IngestApp(args.processes, fallback), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
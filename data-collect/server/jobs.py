@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import heapq
+import threading
+import traceback
+from collections import OrderedDict
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))          # Concurrent jobs
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "64"))    # Pending jobs before shedding
+JOB_HISTORY = 200  # Finished jobs kept for the status API
+
+# Lower runs first
+PRIORITY_FINALIZE = 0
+PRIORITY_ANALYSIS = 10
+
+
+class Job:
+    """One unit of background work and its status"""
+
+    def __init__(self, kind, key, fn, args, priority):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.status = 'queued'   # queued, running, done, failed, rejected, dropped
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'priority': self.priority,
+            'status': self.status,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    """
+    Priority job queue served by a fixed number of worker threads.
+
+    Jobs with the same key are deduplicated while one is queued or running:
+    submitting again returns the existing job. When more than max_pending
+    jobs are waiting, the lowest-priority pending job is dropped to make
+    room, or the new job is rejected if nothing pending ranks below it.
+    Finalization jobs are never rejected: their upload would be lost, so
+    they are queued past the limit instead.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                 history=JOB_HISTORY, on_finish=None, on_update=None):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.history = history
+        self.on_finish = on_finish       # Called with every finished job
+        self.on_update = on_update       # Called with a job on every status change
+        self._heap = []                  # (priority, seq, job)
+        self._seq = 0
+        self._jobs = OrderedDict()       # id -> job, oldest first
+        self._active_keys = {}           # key -> queued or running job
+        self._running = 0
+        self._threads = []
+        self._cond = threading.Condition()
+
+    def submit(self, kind, key, fn, *args, priority=PRIORITY_ANALYSIS):
+        """Queue fn(*args); returns the Job (an existing one for a duplicate key)"""
+        with self._cond:
+            existing = self._active_keys.get(key)
+            if existing is not None:
+                return existing
+
+            job = Job(kind, key, fn, args, priority)
+            self._remember(job)
+            changed = [job]
+            if len(self._heap) >= self.max_pending:
+                dropped = self._shed(priority)
+                if dropped is None and priority > PRIORITY_FINALIZE:
+                    job.finished = time.time()
+                    job.error = 'Job queue is full'
+                    job.status = 'rejected'
+                    print(f"Job queue full, rejected {kind} job for {key}")
+                elif dropped is not None:
+                    changed.append(dropped)
+
+            if job.status == 'queued':
+                self._active_keys[key] = job
+                self._seq += 1
+                heapq.heappush(self._heap, (priority, self._seq, job))
+                self._start_workers()
+                self._cond.notify()
+        self._updated(*changed)
+        return job
+
+    def _shed(self, priority):
+        """Drop the lowest-priority pending job if it ranks below `priority`; returns it"""
+        lowest = max(self._heap, key=lambda item: (item[0], -item[1]))
+        if lowest[0] <= priority:
+            return None
+        self._heap.remove(lowest)
+        heapq.heapify(self._heap)
+        dropped = lowest[2]
+        dropped.finished = time.time()
+        dropped.error = 'Dropped for a higher-priority job'
+        dropped.status = 'dropped'
+        self._active_keys.pop(dropped.key, None)
+        print(f"Job queue full, dropped {dropped.kind} job for {dropped.key}")
+        return dropped
+
+    def _updated(self, *jobs):
+        """Report status changes (called outside the queue lock)"""
+        if self.on_update is None:
+            return
+        for job in jobs:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Error recording job {job.id}: {e}")
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        # Forget the oldest finished jobs beyond the history size
+        excess = len(self._jobs) - self.history
+        if excess > 0:
+            for job_id in [i for i, j in self._jobs.items() if not j.active][:excess]:
+                del self._jobs[job_id]
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, daemon=True,
+                                      name=f"job-worker-{len(self._threads)}")
+            self._threads.append(thread)
+            thread.start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                job.started = time.time()
+                job.status = 'running'
+                self._running += 1
+            self._updated(job)
+
+            error = None
+            try:
+                result = job.fn(*job.args)
+            except Exception as e:
+                traceback.print_exc()
+                error = str(e)
+
+            with self._cond:
+                # The status is set last: readers never see a finished status
+                # without its result and finish time
+                job.finished = time.time()
+                if error is None:
+                    job.result = result
+                    job.status = 'done'
+                else:
+                    job.error = error
+                    job.status = 'failed'
+                self._running -= 1
+                if self._active_keys.get(job.key) is job:
+                    del self._active_keys[job.key]
+                self._cond.notify_all()
+            self._updated(job)
+            if self.on_finish is not None:
+                self.on_finish(job)
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def find(self, key):
+        """Most recent job with this key, or None"""
+        with self._cond:
+            for job in reversed(self._jobs.values()):
+                if job.key == key:
+                    return job
+        return None
+
+    def jobs(self, limit=50):
+        """Most recent jobs first, as dicts"""
+        with self._cond:
+            return [job.to_dict() for job in reversed(self._jobs.values())][:limit]
+
+    def counts(self):
+        with self._cond:
+            return {'pending': len(self._heap), 'running': self._running}
+
+    def wait(self, job, timeout=None):
+        """Block until a job has finished; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while job.active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
@@ -0,0 +1,63 @@
+import threading
+from collections import deque
+from data_decoder import decode_sensor_data
+from filters import StreamingBandpass
+
+
+class LivePreview:
+    """
+    Filtered preview of a chunked upload, updated as chunks arrive.
+
+    Chunks are fed to a streaming bandpass filter in chunk-index order
+    (chunks that arrive early wait until the gap is filled; chunks sent
+    again after being filtered are ignored). Only the last
+    `max_samples` filtered samples are kept.
+    """
+
+    def __init__(self, fs=40.0, lowcut=0.5, highcut=5.0, order=5, max_samples=2000):
+        self.filter = StreamingBandpass(lowcut, highcut, fs, order, channels=2)
+        self.next_chunk = 0
+        self.pending = {}
+        self.samples = 0
+        self.time = deque(maxlen=max_samples)
+        self.ir = deque(maxlen=max_samples)
+        self.red = deque(maxlen=max_samples)
+        self._first_timestamp = None
+        self._lock = threading.Lock()
+
+    def add_chunk(self, chunk_index, raw_data):
+        """Queue a raw chunk and filter every chunk that is now in order"""
+        with self._lock:
+            if chunk_index < self.next_chunk:
+                return  # Retry of a chunk that was already filtered
+            self.pending[chunk_index] = raw_data
+            while self.next_chunk in self.pending:
+                self._filter_chunk(self.pending.pop(self.next_chunk))
+                self.next_chunk += 1
+
+    def wants(self, chunk_index):
+        """Whether a chunk has not been fed to the preview yet"""
+        with self._lock:
+            return chunk_index >= self.next_chunk and chunk_index not in self.pending
+
+    def _filter_chunk(self, raw_data):
+        df = decode_sensor_data(raw_data)
+        if df.empty:
+            return
+        if self._first_timestamp is None:
+            self._first_timestamp = df['timestamp'].iloc[0]
+
+        ir_filtered, red_filtered = self.filter.process(df[['ir', 'red']].values.T)
+        self.time.extend(((df['timestamp'] - self._first_timestamp) / 1000.0).tolist())
+        self.ir.extend(ir_filtered.tolist())
+        self.red.extend(red_filtered.tolist())
+        self.samples += len(df)
+
+    def snapshot(self, max_points=None):
+        """Return the most recent filtered samples as lists"""
+        with self._lock:
+            time, ir, red = list(self.time), list(self.ir), list(self.red)
+            samples = self.samples
+        if max_points:
+            time, ir, red = time[-max_points:], ir[-max_points:], red[-max_points:]
+        return {'samples': samples, 'time': time, 'ir': ir, 'red': red}
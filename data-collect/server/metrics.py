@@ -0,0 +1,275 @@
+import os
+import time
+import random
+import bisect
+import threading
+import weakref
+
+# Default fraction of observations recorded by sampled histograms
+SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "1.0"))
+
+# Seconds; Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; for lock waits and other sub-millisecond timings
+FAST_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Sharded:
+    """
+    Per-thread storage for a metric.
+
+    Each thread only ever writes its own dictionary, so updates need no
+    lock; a lock is taken once per thread to register its shard. Shards of
+    threads that have exited are folded into a retired total the next time
+    a shard is registered or the metric is read, so short-lived request
+    threads do not accumulate.
+    """
+
+    def __init__(self, merge):
+        self._merge = merge          # merge(total dict, shard dict) in place
+        self._local = threading.local()
+        self._shards = []            # (weakref to thread, shard dict)
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._retire_dead()
+                self._shards.append((weakref.ref(threading.current_thread()), values))
+            return values
+
+    def _retire_dead(self):
+        alive = []
+        for ref, values in self._shards:
+            thread = ref()
+            if thread is None or not thread.is_alive():
+                self._merge(self._retired, values)
+            else:
+                alive.append((ref, values))
+        self._shards = alive
+
+    def collect(self):
+        """Sum of all shards (a consistent-enough snapshot for scraping)"""
+        with self._lock:
+            self._retire_dead()
+            total = {}
+            self._merge(total, self._retired)
+            for _, values in self._shards:
+                # dict.copy() is atomic under the GIL, the owner may keep writing
+                self._merge(total, values.copy())
+        return total
+
+
+def _merge_counts(total, values):
+    for key, value in values.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _merge_histograms(total, values):
+    for key, (counts, sum_) in values.items():
+        if key in total:
+            current = total[key]
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += sum_
+        else:
+            total[key] = [list(counts), sum_]
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = _Sharded(_merge_counts)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        shard = self._values.shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.collect().items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Gauge:
+    """Value computed at scrape time by a callback (no cost on the hot path)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self):
+        yield self.name, '', self.function()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        if self.histogram.sampled():
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.histogram._record(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class Histogram:
+    """
+    Histogram of observations (usually seconds) with optional labels.
+
+    With sample_rate below 1 only that fraction of observations is
+    recorded, each weighted by 1 / sample_rate, so counts and sums remain
+    estimates of the totals while most calls skip the timer entirely.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, sample_rate=1.0):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.sample_rate = sample_rate
+        self._weight = 1.0 / sample_rate if sample_rate > 0 else 0.0
+        self._values = _Sharded(_merge_histograms)
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def observe(self, value, **labels):
+        if self.sampled():
+            self._record(value, labels)
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def _record(self, value, labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        shard = self._values.shard()
+        entry = shard.get(key)
+        if entry is None:
+            # One slot per bucket plus +Inf
+            entry = shard[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        weight = self._weight
+        entry[0][bisect.bisect_left(self.buckets, value)] += weight
+        entry[1] += value * weight
+
+    def samples(self):
+        for key, (counts, sum_) in sorted(self._values.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labels, key, [('le', _format_value(bound))]),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.labels, key), sum_
+            yield self.name + '_count', _format_labels(self.labels, key), cumulative
+
+
+class TimedLock:
+    """threading.Lock that records how long callers waited to acquire it"""
+
+    def __init__(self, histogram, **labels):
+        self._lock = threading.Lock()
+        self.histogram = histogram
+        self.labels = labels
+
+    def acquire(self, blocking=True, timeout=-1):
+        # Uncontended acquires are not timed
+        if self._lock.acquire(False):
+            if self.histogram.sampled():
+                self.histogram._record(0.0, self.labels)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired and self.histogram.sampled():
+            self.histogram._record(time.perf_counter() - start, self.labels)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class Registry:
+    """Named collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, sample_rate=1.0):
+        return self.register(Histogram(name, documentation, labels, buckets, sample_rate))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+            except Exception as e:
+                # A failing gauge callback must not break the whole scrape
+                lines.append(f"# ERROR {metric.name}: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
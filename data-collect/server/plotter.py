@@ -4,7 +4,7 @@ import numpy as np
 import os
 import glob
 import argparse
-from scipy.signal import butter, filtfilt
+from filters import bandpass_sos, bandpass_filter
 import sys
 from datetime import datetime
 
@@ -26,19 +26,13 @@ def find_latest_csv():
 
 
 def butter_bandpass(lowcut, highcut, fs, order=5):
-    """Design a bandpass filter"""
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = butter(order, [low, high], btype='band')
-    return b, a
+    """Design a bandpass filter (cached second-order sections)"""
+    return bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
 
 
 def apply_filter(data, lowcut=0.5, highcut=5.0, fs=30.0, order=5):
-    """Apply a bandpass filter to the data"""
-    b, a = butter_bandpass(lowcut, highcut, fs, order=order)
-    y = filtfilt(b, a, data)
-    return y
+    """Apply a bandpass filter to the data (1-D, or channels x samples)"""
+    return bandpass_filter(data, lowcut, highcut, fs, order=order, axis=-1)
 
 
 def normalize_signal(signal):
@@ -76,8 +70,9 @@ def plot_filtered_data(df, fs=None, save_path=None):
     print(f"Sampling frequency: {fs:.2f} Hz")
 
     # Apply bandpass filter to isolate pulse frequencies (typically 0.5-5 Hz)
-    ir_filtered = apply_filter(df['ir'], lowcut=0.5, highcut=5.0, fs=fs)
-    red_filtered = apply_filter(df['red'], lowcut=0.5, highcut=5.0, fs=fs)
+    # Both channels are filtered together in one call
+    ir_filtered, red_filtered = apply_filter(
+        df[['ir', 'red']].values.T, lowcut=0.5, highcut=5.0, fs=fs)
 
     # Normalize for better visualization
     ir_norm = normalize_signal(ir_filtered)
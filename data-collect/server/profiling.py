@@ -0,0 +1,301 @@
+import io
+import os
+import sys
+import time
+import hmac
+import uuid
+import heapq
+import random
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter, deque
+from flask import request, g, jsonify, Response, abort
+
+# Requests are profiled on demand when they carry this token in the
+# X-Profile header or the ?profile= query argument; unset disables it
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+# Also store on-demand profiles on disk (collapsed stacks / pstats files)
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+# Keep the N slowest requests per route with their stacks (0 disables)
+PROFILE_SLOWEST = int(os.environ.get("PROFILE_SLOWEST", "0"))
+# Fraction of requests sampled for the slowest-requests record
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "1.0"))
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+KEEP_PROFILES = 20       # On-demand profiles kept in memory
+MAX_DEPTH = 128          # Frames kept per sampled stack
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame):
+    """Stack of a frame in the collapsed format (root first, ';'-separated)"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def collapsed(stacks):
+    """Collapsed stack lines ("a;b;c count") as read by flamegraph.pl and speedscope"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """
+    Samples the stacks of registered threads from one background thread.
+
+    The sampler only wakes up while at least one thread is registered, so
+    it costs nothing between profiled requests.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._active = {}   # thread ident -> Counter of folded stacks
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, ident):
+        with self._cond:
+            self._active[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name='stack-sampler')
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, ident):
+        """Stop sampling a thread and return its stack counts"""
+        with self._cond:
+            return self._active.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[fold_stack(frame)] += 1
+                del frames
+            time.sleep(self.interval)
+
+
+class _StatsSnapshot:
+    """Stats of a finished cProfile run in the form pstats.Stats() accepts"""
+
+    def __init__(self, stats):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+
+class SlowestRequests:
+    """The N slowest requests per route, each with its sampled stacks"""
+
+    def __init__(self, size):
+        self.size = size
+        self._routes = {}   # route -> min-heap of (duration, seq, entry)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def threshold(self, route):
+        """Duration a request must exceed to enter the record (0 while not full)"""
+        with self._lock:
+            heap = self._routes.get(route)
+            return heap[0][0] if heap and len(heap) >= self.size else 0.0
+
+    def add(self, route, duration, entry):
+        with self._lock:
+            heap = self._routes.setdefault(route, [])
+            self._seq += 1
+            item = (duration, self._seq, entry)
+            if len(heap) < self.size:
+                heapq.heappush(heap, item)
+            elif duration > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def entries(self):
+        with self._lock:
+            return {route: [entry for _, _, entry in sorted(heap, reverse=True)]
+                    for route, heap in self._routes.items()}
+
+    def find(self, profile_id):
+        with self._lock:
+            for heap in self._routes.values():
+                for _, _, entry in heap:
+                    if entry['id'] == profile_id:
+                        return entry
+        return None
+
+
+class Profiler:
+    """
+    Opt-in request profiling for a Flask app.
+
+    On-demand: a request carrying the admin token (X-Profile header or
+    ?profile= argument) runs under the stack sampler, or under cProfile
+    with X-Profile-Mode: cprofile / ?profile_mode=cprofile. The profile is
+    kept in memory (and in PROFILE_DIR when set) and its id is returned in
+    the X-Profile-Id response header.
+
+    Rolling: with PROFILE_SLOWEST set, a fraction of all requests is
+    sampled and the slowest ones per route are kept with their stacks.
+
+    Profiles are listed at /profiles and downloaded from /profiles/<id>:
+    collapsed stacks for sampled profiles, a pstats file (marshal format,
+    as written by cProfile) or ?format=text for cProfile ones. Both
+    endpoints require the token.
+    """
+
+    def __init__(self, app=None, token=PROFILE_TOKEN, slowest=PROFILE_SLOWEST,
+                 sample_rate=PROFILE_SAMPLE_RATE, profile_dir=PROFILE_DIR):
+        self.token = token
+        self.slowest = SlowestRequests(slowest) if slowest > 0 else None
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+        self.sampler = StackSampler()
+        self.profiles = deque(maxlen=KEEP_PROFILES)
+        # One cProfile at a time: Python 3.12+ allows a single active profiler
+        self._cprofile_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/profiles', 'list_profiles', self._list)
+        app.add_url_rule('/profiles/<profile_id>', 'get_profile', self._get)
+        app.extensions['profiler'] = self
+
+    def is_admin(self):
+        if not self.token:
+            return False
+        supplied = request.headers.get('X-Profile') or request.args.get('profile') or ''
+        return hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
+
+    def _before(self):
+        if request.endpoint in ('list_profiles', 'get_profile'):
+            return
+        on_demand = self.is_admin()
+        rolling = self.slowest is not None and random.random() < self.sample_rate
+        if not (on_demand or rolling):
+            return
+
+        mode = (request.headers.get('X-Profile-Mode') or request.args.get('profile_mode')
+                or 'sample')
+        g._profile = {'on_demand': on_demand, 'mode': 'sample', 'start': time.perf_counter()}
+        if on_demand and mode == 'cprofile' and self._cprofile_lock.acquire(False):
+            profile = cProfile.Profile()
+            g._profile.update(mode='cprofile', cprofile=profile)
+            profile.enable()
+        else:
+            g._profile['ident'] = threading.get_ident()
+            self.sampler.add(g._profile['ident'])
+
+    def _stop(self, state):
+        """Stop profiling the current request (idempotent)"""
+        if 'duration' in state:
+            return
+        state['duration'] = time.perf_counter() - state['start']
+        if state['mode'] == 'cprofile':
+            state['cprofile'].disable()
+            self._cprofile_lock.release()
+        else:
+            state['stacks'] = self.sampler.remove(state['ident'])
+
+    def _after(self, response):
+        state = g.pop('_profile', None)
+        if state is None:
+            return response
+        self._stop(state)
+
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        keep_slow = (self.slowest is not None
+                     and state['duration'] > self.slowest.threshold(route))
+        if not (state['on_demand'] or keep_slow):
+            return response
+
+        entry = {
+            'id': uuid.uuid4().hex[:12],
+            'route': route,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'duration_ms': state['duration'] * 1000,
+            'time': time.time(),
+            'mode': state['mode'],
+        }
+        if state['mode'] == 'cprofile':
+            state['cprofile'].create_stats()
+            entry['pstats'] = state['cprofile'].stats
+        else:
+            entry['samples'] = sum(state['stacks'].values())
+            entry['collapsed'] = collapsed(state['stacks'])
+
+        if state['on_demand']:
+            self.profiles.append(entry)
+            self._store(entry)
+            response.headers['X-Profile-Id'] = entry['id']
+        if keep_slow:
+            self.slowest.add(route, state['duration'], entry)
+        return response
+
+    def _teardown(self, exc):
+        # Requests that failed before after_request still stop the profiler
+        state = g.pop('_profile', None)
+        if state is not None:
+            self._stop(state)
+
+    def _store(self, entry):
+        if not self.profile_dir:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(entry['time']))
+        if 'pstats' in entry:
+            path, data, mode = f"{stamp}_{entry['id']}.prof", marshal.dumps(entry['pstats']), 'wb'
+        else:
+            path, data, mode = f"{stamp}_{entry['id']}.collapsed", entry['collapsed'], 'w'
+        with open(os.path.join(self.profile_dir, path), mode) as f:
+            f.write(data)
+
+    @staticmethod
+    def _summary(entry):
+        return {key: value for key, value in entry.items() if key not in ('pstats', 'collapsed')}
+
+    def _list(self):
+        if not self.is_admin():
+            abort(404)
+        return jsonify({
+            'status': 'success',
+            'profiles': [self._summary(entry) for entry in reversed(self.profiles)],
+            'slowest': {route: [self._summary(entry) for entry in entries]
+                        for route, entries in (self.slowest.entries() if self.slowest else {}).items()},
+        })
+
+    def _get(self, profile_id):
+        if not self.is_admin():
+            abort(404)
+        entry = next((e for e in self.profiles if e['id'] == profile_id), None)
+        if entry is None and self.slowest is not None:
+            entry = self.slowest.find(profile_id)
+        if entry is None:
+            return jsonify({'status': 'error', 'message': 'Unknown profile'}), 404
+
+        if 'collapsed' in entry:
+            return Response(entry['collapsed'], mimetype='text/plain')
+        if request.args.get('format') == 'text':
+            output = io.StringIO()
+            stats = pstats.Stats(_StatsSnapshot(entry['pstats']), stream=output)
+            stats.sort_stats('cumulative').print_stats(50)
+            return Response(output.getvalue(), mimetype='text/plain')
+        return Response(marshal.dumps(entry['pstats']), mimetype='application/octet-stream', headers={
+            'Content-Disposition': f"attachment; filename={entry['id']}.prof"})
@@ -0,0 +1,39 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class RecordingCache:
+    """
+    Small LRU cache for results computed from a recording file.
+
+    Entries are keyed by the file's path, size and modification time plus
+    any extra parameters, so a rewritten recording is computed again.
+    Cached results are shared between callers and must not be modified.
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path, compute, *params):
+        """Cached compute(file_path); compute runs outside the lock"""
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns) + params
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        result = compute(file_path)
+
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,9 +1,19 @@
 from sampling_analyzer import analyze_sampling_rate, analyze_stability_by_segments
-from data_decoder import decode_sensor_data, save_decoded_data, decode_chunked_data
-from flask import Flask, render_template, request, jsonify, send_from_directory, url_for
+from data_decoder import (decode_sensor_data, save_decoded_data, decode_chunked_data,
+                          decode_upload_body, payload_format, BodyTooLarge)
+from live_preview import LivePreview
+from beats import analyze_recording
+import spectral
+from activity_model import ActivityClassifier, CLASSES, WINDOW_SIZE, classify_file, normalize_windows
+from metrics import Registry, TimedLock, FAST_BUCKETS, SAMPLE_RATE, CONTENT_TYPE
+from profiling import Profiler
+from state import ConnectionManager, SessionStore, AnalysisStore
+from jobs import JobQueue, PRIORITY_FINALIZE, PRIORITY_ANALYSIS
+import device_listener
+from flask import Flask, render_template, request, jsonify, send_from_directory, url_for, Response
+from werkzeug.exceptions import RequestEntityTooLarge
 import matplotlib.pyplot as plt
 import os
-import socket
 import threading
 import time
 import json
@@ -12,6 +22,7 @@ import io
 import base64
 import matplotlib
 import pandas as pd
+import numpy as np
 import netifaces
 
 matplotlib.use('Agg')  # Use non-interactive backend
@@ -25,27 +36,105 @@ DATA_DIR = 'data'
 RAW_DIR = os.path.join(DATA_DIR, 'raw')
 CSV_DIR = os.path.join(DATA_DIR, 'csv')
 ANALYSIS_DIR = os.path.join(DATA_DIR, 'analysis')
+PREVIEW_FS = 40.0  # Nominal sensor sampling rate used by the live preview filter
+# Largest upload body accepted after decompression
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 16 * 1024 * 1024))
+# Multi-worker mode (see README): SQLite file shared by all HTTP workers,
+# and the Unix socket of a separate device listener process
+STATE_DB = os.environ.get("STATE_DB")
+DEVICE_SOCKET = os.environ.get("DEVICE_SOCKET")
 
 # Ensure data directories exist
 os.makedirs(RAW_DIR, exist_ok=True)
 os.makedirs(CSV_DIR, exist_ok=True)
 os.makedirs(ANALYSIS_DIR, exist_ok=True)
 
-# Global state
-connected_client = None
-client_address = None
-is_collecting = False
-last_data = None
-last_analysis = None
-
-# Storage for chunked data sessions
-chunks_store = {}
-
 # Initialize Flask app
 app = Flask(__name__)
-
-# Lock for thread safety
-lock = threading.Lock()
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Opt-in request profiling (PROFILE_TOKEN, PROFILE_SLOWEST, see profiling.py)
+profiler = Profiler(app)
+
+# Runtime metrics served by /metrics
+metrics = Registry()
+DECODE_SECONDS = metrics.histogram(
+    'datacollect_decode_seconds', 'Time to decode an upload into a DataFrame',
+    ['format', 'transfer'])
+UPLOADS = metrics.counter(
+    'datacollect_uploads_total', 'Uploads completed', ['transfer'])
+UPLOAD_SAMPLES = metrics.counter(
+    'datacollect_upload_samples_total', 'Samples in completed uploads', ['transfer'])
+CHUNKS = metrics.counter('datacollect_chunks_total', 'Chunks received')
+CHUNK_BYTES = metrics.counter('datacollect_chunk_bytes_total', 'Bytes of chunk bodies received')
+UPLOAD_BYTES = metrics.counter(
+    'datacollect_upload_bytes_total', 'Bytes of upload bodies as sent (before decompression)',
+    ['format', 'encoding'])
+FINALIZE_SECONDS = metrics.histogram(
+    'datacollect_finalize_seconds', 'Time to decode and save a completed chunked session')
+SESSION_SECONDS = metrics.histogram(
+    'datacollect_session_seconds', 'Time from the first chunk of a session until it is saved',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+ANALYSIS_SECONDS = metrics.histogram(
+    'datacollect_analysis_seconds', 'Time to generate the analysis of a recording', ['source'])
+RENDER_SECONDS = metrics.histogram(
+    'datacollect_render_seconds', 'Time to render the analysis page template')
+TCP_MESSAGES = metrics.counter('datacollect_tcp_messages_total', 'Messages received from the sensor')
+LOCK_WAIT_SECONDS = metrics.histogram(
+    'datacollect_lock_wait_seconds', 'Time spent waiting for a state lock', ['lock'],
+    buckets=FAST_BUCKETS, sample_rate=SAMPLE_RATE)
+
+# Shared state, each part with its own lock (records its wait time):
+# the sensor connection, chunked upload sessions, and the latest
+# upload/analysis (lock-free snapshots)
+if DEVICE_SOCKET:
+    connection = device_listener.RemoteConnection(DEVICE_SOCKET)
+else:
+    connection = ConnectionManager(TimedLock(LOCK_WAIT_SECONDS, lock='connection'))
+if STATE_DB:
+    import shared_state
+    shared_db = shared_state.SharedDatabase(STATE_DB)
+    sessions = shared_state.SqliteSessionStore(shared_db, lambda: LivePreview(fs=PREVIEW_FS))
+    analysis_store = shared_state.SqliteAnalysisStore(shared_db)
+    job_log = shared_state.SqliteJobLog(shared_db)
+else:
+    sessions = SessionStore(lambda: LivePreview(fs=PREVIEW_FS),
+                            TimedLock(LOCK_WAIT_SECONDS, lock='sessions'))
+    analysis_store = AnalysisStore()
+    job_log = None
+
+JOBS = metrics.counter('datacollect_jobs_total', 'Background jobs finished', ['kind', 'status'])
+JOB_WAIT_SECONDS = metrics.histogram(
+    'datacollect_job_wait_seconds', 'Time background jobs spent queued', ['kind'])
+JOB_RUN_SECONDS = metrics.histogram(
+    'datacollect_job_run_seconds', 'Time background jobs spent running', ['kind'])
+
+
+def record_job(job):
+    """Metrics of a finished background job"""
+    JOBS.inc(kind=job.kind, status=job.status)
+    JOB_WAIT_SECONDS.observe(job.started - job.submitted, kind=job.kind)
+    JOB_RUN_SECONDS.observe(job.finished - job.started, kind=job.kind)
+
+
+# Finalization and analysis of uploads run on a bounded worker pool
+# (JOB_WORKERS, JOB_QUEUE_SIZE, see jobs.py); with STATE_DB their status
+# is also recorded in the shared database for the other workers
+job_queue = JobQueue(on_finish=record_job, on_update=job_log.save if job_log else None)
+jobs_view = job_log or job_queue
+
+# Activity model, loaded on first use by /api/classify
+activity_classifier = None
+classifier_lock = threading.Lock()
+
+metrics.gauge('datacollect_active_sessions', 'Chunked sessions still receiving chunks',
+              lambda: len(sessions))
+metrics.gauge('datacollect_jobs_pending', 'Background jobs waiting for a worker',
+              lambda: job_queue.counts()['pending'])
+metrics.gauge('datacollect_jobs_running', 'Background jobs running',
+              lambda: job_queue.counts()['running'])
+metrics.gauge('datacollect_sensor_connected', 'Whether a sensor is connected over TCP',
+              lambda: int(connection.connected))
 
 
 def timestamp_filename():
@@ -53,57 +142,10 @@ def timestamp_filename():
     return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 
 
-def handle_client_connection(client_socket, addr):
-    """Handle TCP client connection"""
-    global connected_client, client_address, is_collecting
-
-    print(f"Connection established with {addr}")
-
-    with lock:
-        connected_client = client_socket
-        client_address = addr
-
-    try:
-        while True:
-            # Receive data from client
-            data = client_socket.recv(1024)
-            if not data:
-                break
-
-            message = data.decode('utf-8').strip()
-            print(f"Received from {addr}: {message}")
-
-            # Handle HELLO message
-            if message == "HELLO":
-                client_socket.send(b"WELCOME\n")
-                print(f"Sent WELCOME to {addr}")
-            # No longer handling Ping/Pong
-    except Exception as e:
-        print(f"Error handling client {addr}: {e}")
-    finally:
-        with lock:
-            if connected_client == client_socket:
-                connected_client = None
-                client_address = None
-                is_collecting = False
-        client_socket.close()
-        print(f"Connection closed with {addr}")
-
-
 def tcp_server():
     """TCP server to handle sensor connections"""
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((TCP_IP, TCP_PORT))
-    server.listen(5)
-    print(f"TCP Server listening on {TCP_IP}:{TCP_PORT}")
-
-    while True:
-        client, addr = server.accept()
-        client_thread = threading.Thread(
-            target=handle_client_connection, args=(client, addr))
-        client_thread.daemon = True
-        client_thread.start()
+    device_listener.tcp_server(connection, TCP_IP, TCP_PORT,
+                               on_message=lambda message: TCP_MESSAGES.inc())
 
 
 def start_tcp_server():
@@ -224,12 +266,49 @@ def generate_analysis(csv_filename):
             print(f"Error in segment analysis: {e}")
             segments = []
 
+        # Beat detection and HRV (cached per recording)
+        try:
+            _, hrv = analyze_recording(file_path)
+        except Exception as e:
+            print(f"Error in beat analysis: {e}")
+            hrv = {}
+
+        # Welch spectrum and band powers (cached per recording)
+        try:
+            mean_psd, _, spectrum = spectral.analyze_recording(file_path)
+
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.semilogy(mean_psd['freqs'], mean_psd['ir'], 'r-', label='IR')
+            ax.semilogy(mean_psd['freqs'], mean_psd['red'], 'b-', label='RED')
+            ax.axvspan(*spectral.BANDS['cardiac'], color='g', alpha=0.1,
+                       label='Cardiac band')
+            if spectrum['dominant_hr']:
+                ax.axvline(x=spectrum['dominant_hr'] / 60.0, color='m', linestyle='--',
+                           label=f"Dominant: {spectrum['dominant_hr']:.1f} BPM")
+            ax.set_title('Power Spectral Density (Welch, mean over windows)')
+            ax.set_xlabel('Frequency (Hz)')
+            ax.set_ylabel('PSD')
+            ax.legend()
+            ax.grid(True)
+
+            buffer = io.BytesIO()
+            plt.tight_layout()
+            plt.savefig(buffer, format='png')
+            buffer.seek(0)
+            plots['psd'] = base64.b64encode(buffer.read()).decode('utf-8')
+            plt.close()
+        except Exception as e:
+            print(f"Error in spectral analysis: {e}")
+            spectrum = {}
+
         # Store analysis with plots and results
         analysis_data = {
             'filename': csv_filename,
             'plots': plots,
             'results': analysis_results,
             'segments': segments,
+            'hrv': hrv,
+            'spectrum': spectrum,
             'timestamp': timestamp_filename()
         }
 
@@ -247,6 +326,8 @@ def generate_analysis(csv_filename):
             'plots': {},
             'results': {'error': str(e)},
             'segments': [],
+            'hrv': {},
+            'spectrum': {},
             'timestamp': timestamp_filename()
         }
 
@@ -268,43 +349,122 @@ analyze_sampling_rate.get_dataframe = get_dataframe
 
 
 def run_analysis(csv_filename):
-    """Generate analysis in a background thread"""
+    """Generate analysis as a background job"""
     try:
-        global last_analysis
-        analysis_data = generate_analysis(csv_filename)
-        with lock:
-            last_analysis = analysis_data
+        with ANALYSIS_SECONDS.time(source='background'):
+            analysis_data = generate_analysis(csv_filename)
+        analysis_store.publish_analysis(analysis_data)
         print(f"Analysis completed for {csv_filename}")
+        return {"filename": csv_filename, "error": analysis_data.get('error')}
     except Exception as e:
         print(f"Error generating analysis: {e}")
+        raise
+
+
+def submit_analysis(csv_filename):
+    """Queue the analysis of a recording (deduplicated per file)"""
+    return job_queue.submit('analysis', f"analysis:{csv_filename}", run_analysis, csv_filename,
+                            priority=PRIORITY_ANALYSIS)
 
 
 @app.route('/data', methods=['POST'])
 def receive_data():
     """Receive sensor data, supporting both regular and chunked transfers"""
-    global last_data, last_analysis, chunks_store, is_collecting
-
     try:
         # Check if this is a chunked request
         is_chunked = 'X-Chunk-Index' in request.headers
 
-        is_collecting = False
+        # Text, binary or delta frame, optionally gzip/deflate compressed
+        # (get_data: the body is never parsed as a form, whatever the Content-Type)
+        try:
+            body = request.get_data()
+            raw_data = decode_upload_body(body, request.headers.get('Content-Encoding'),
+                                          request.content_type, MAX_UPLOAD_BYTES)
+        except (BodyTooLarge, RequestEntityTooLarge):
+            return f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", 413
+        except ValueError as e:
+            return str(e), 400
+        count_upload_bytes(raw_data, request.headers.get('Content-Encoding'), len(body))
+
+        # The sensor only uploads once it has stopped collecting
+        connection.set_collecting(False)
         if is_chunked:
             # Handle chunked data
-            return handle_chunked_data()
+            return handle_chunked_data(raw_data)
         else:
             # Handle regular (non-chunked) data
-            raw_data = request.data.decode('utf-8')
             return process_complete_data(raw_data)
     except Exception as e:
         print(f"Error processing data: {e}")
         return str(e), 500
 
 
-def handle_chunked_data():
-    """Handle a chunk of data from a multi-part transfer"""
-    global chunks_store, last_data
+def count_upload_bytes(raw_data, content_encoding, size):
+    UPLOAD_BYTES.inc(size, format=payload_format(raw_data),
+                     encoding=(content_encoding or 'identity').strip().lower())
+
 
+def write_raw(path, raw_data):
+    """Save a raw payload (text or bytes) as received"""
+    with open(path, 'wb' if isinstance(raw_data, bytes) else 'w') as f:
+        f.write(raw_data)
+
+
+def chunk_session_id(chunk_index, session_key):
+    """Session ID shared by the chunks of one upload (they only carry the sample count)"""
+    if chunk_index == 0:
+        session_id = f"session_{session_key}_{int(time.time())}"
+        # Store the session ID in a file for other chunks to reference
+        with open(os.path.join(RAW_DIR, f"session_{session_key}.id"), 'w') as f:
+            f.write(session_id)
+        return session_id
+    # Read the session ID from file if it exists, otherwise generate temporary one
+    try:
+        with open(os.path.join(RAW_DIR, f"session_{session_key}.id"), 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        # Fallback if the session file is missing
+        return f"session_{session_key}_{int(time.time())}"
+
+
+def store_chunk(chunk_index, total_chunks, total_samples, start_index, raw_data, body_size):
+    """
+    Save a received chunk (its decompressed payload) and add it to its session.
+
+    Returns:
+        Tuple (session_id, session_key, chunks received so far, live preview)
+    """
+    # Log received headers for debugging
+    print(
+        f"Received chunk with headers: index={chunk_index}, total={total_chunks}, samples={total_samples}")
+
+    # Generate a unique session ID that's consistent across chunks from the same collection
+    session_key = f"{total_samples}"
+    session_id = chunk_session_id(chunk_index, session_key)
+
+    CHUNKS.inc()
+    CHUNK_BYTES.inc(body_size)
+
+    # Save raw chunk data for debugging
+    timestamp = timestamp_filename()
+    chunk_filename = f"{timestamp}_chunk{chunk_index}.raw"
+    write_raw(os.path.join(RAW_DIR, chunk_filename), raw_data)
+
+    # Initialize or update session
+    received_count, preview = sessions.add_chunk(session_id, total_chunks, total_samples, {
+        'data': raw_data,
+        'chunk_index': chunk_index,
+        'start_index': start_index
+    })
+
+    # Log status
+    print(
+        f"Received chunk {chunk_index+1}/{total_chunks} for session {session_id} ({received_count}/{total_chunks})")
+    return session_id, session_key, received_count, preview
+
+
+def handle_chunked_data(raw_data):
+    """Handle a chunk of data from a multi-part transfer"""
     try:
         # Extract chunk information from headers
         chunk_index = int(request.headers.get('X-Chunk-Index', 0))
@@ -312,70 +472,28 @@ def handle_chunked_data():
         total_samples = int(request.headers.get('X-Total-Samples', 0))
         start_index = int(request.headers.get('X-Chunk-Start-Index', 0))
 
-        # Log received headers for debugging
-        print(
-            f"Received chunk with headers: index={chunk_index}, total={total_chunks}, samples={total_samples}")
-
-        # Generate a unique session ID that's consistent across chunks from the same collection
-        session_key = f"{total_samples}"
-        if chunk_index == 0:
-            session_id = f"session_{session_key}_{int(time.time())}"
-            # Store the session ID in a file for other chunks to reference
-            with open(os.path.join(RAW_DIR, f"session_{session_key}.id"), 'w') as f:
-                f.write(session_id)
-        else:
-            # Read the session ID from file if it exists, otherwise generate temporary one
-            try:
-                with open(os.path.join(RAW_DIR, f"session_{session_key}.id"), 'r') as f:
-                    session_id = f.read().strip()
-            except FileNotFoundError:
-                # Fallback if the session file is missing
-                session_id = f"session_{session_key}_{int(time.time())}"
-
-        # Get raw data from request
-        raw_data = request.data.decode('utf-8')
-
-        # Save raw chunk data for debugging
-        timestamp = timestamp_filename()
-        chunk_filename = f"{timestamp}_chunk{chunk_index}.raw"
-        with open(os.path.join(RAW_DIR, chunk_filename), 'w') as f:
-            f.write(raw_data)
-
-        # Initialize or update session
-        with lock:
-            if session_id not in chunks_store:
-                chunks_store[session_id] = {
-                    'chunks': [],
-                    'total_chunks': total_chunks,
-                    'total_samples': total_samples,
-                    'received_chunks': 0,
-                    'timestamp': time.time()
-                }
-
-            # Add this chunk to the session
-            chunks_store[session_id]['chunks'].append({
-                'data': raw_data,
-                'chunk_index': chunk_index,
-                'start_index': start_index
-            })
-            chunks_store[session_id]['received_chunks'] += 1
-            received_count = chunks_store[session_id]['received_chunks']
+        session_id, session_key, received_count, preview = store_chunk(
+            chunk_index, total_chunks, total_samples, start_index, raw_data, len(request.get_data()))
 
-        # Log status
-        print(
-            f"Received chunk {chunk_index+1}/{total_chunks} for session {session_id} ({received_count}/{total_chunks})")
-
-        # Check if all chunks received in a separate thread to avoid blocking the response
-        if received_count >= total_chunks:
-            # Process in background to avoid blocking the response
-            threading.Thread(
-                target=process_complete_chunks,
-                args=(session_id, session_key),
-                daemon=True
-            ).start()
+        # Update the filtered live preview (outside the session lock)
+        try:
+            preview.add_chunk(chunk_index, raw_data)
+        except Exception as e:
+            print(f"Error updating live preview: {e}")
+
+        # Check if all chunks received; finalize as a job to avoid blocking the response
+        headers = {}
+        if received_count >= total_chunks and sessions.claim(session_id):
+            job = job_queue.submit('finalize', f"finalize:{session_id}", process_complete_chunks,
+                                   session_id, session_key, priority=PRIORITY_FINALIZE)
+            if job.status == 'rejected':
+                # Keep the chunks so the sensor can resend the last one
+                sessions.release(session_id)
+                return "Server busy, retry the last chunk", 503, {'Retry-After': '5'}
+            headers['X-Job-Id'] = job.id
 
         # Always return success immediately to avoid client hanging
-        return f"Chunk {chunk_index+1}/{total_chunks} received", 200
+        return f"Chunk {chunk_index+1}/{total_chunks} received", 200, headers
 
     except Exception as e:
         # Log the full exception and stack trace
@@ -386,25 +504,23 @@ def handle_chunked_data():
 
 
 def process_complete_chunks(session_id, session_key):
-    """Process complete chunks in a background thread"""
-    global chunks_store, last_data
-
+    """Process complete chunks as a background job"""
     try:
-        with lock:
-            # Get session data under lock
-            if session_id not in chunks_store:
-                print(f"Error: Session {session_id} no longer exists")
-                return
+        session_data = sessions.get(session_id)
+        if session_data is None:
+            raise KeyError(f"Session {session_id} no longer exists")
 
-            session_data = chunks_store[session_id]
-            chunks_list = session_data['chunks']
-            total_chunks = session_data['total_chunks']
+        chunks_list = session_data['chunks']
+        total_chunks = session_data['total_chunks']
 
         print(
             f"Processing {len(chunks_list)}/{total_chunks} chunks for session {session_id}")
 
         # Decode all chunks into a single DataFrame
-        df = decode_chunked_data(chunks_list)
+        finalize_start = time.perf_counter()
+        chunk_format = payload_format(chunks_list[0]['data']) if chunks_list else 'text'
+        with DECODE_SECONDS.time(format=chunk_format, transfer='chunked'):
+            df = decode_chunked_data(chunks_list)
 
         # Generate complete filenames with consistent naming based on session
         session_timestamp = datetime.datetime.fromtimestamp(
@@ -414,14 +530,16 @@ def process_complete_chunks(session_id, session_key):
         complete_raw = f"{session_timestamp}_complete.raw"
         complete_csv = f"{session_timestamp}.csv"
 
-        # Save combined raw data for reference
-        combined_raw = ""
-        for chunk in sorted(chunks_list, key=lambda x: x['chunk_index']):
-            combined_raw += chunk['data'] + "\n"
+        # Save combined raw data for reference (binary chunks back to back)
+        ordered = [chunk['data'] for chunk in sorted(chunks_list, key=lambda x: x['chunk_index'])]
+        if any(isinstance(data, bytes) for data in ordered):
+            combined_raw = b"".join(data if isinstance(data, bytes) else data.encode('utf-8')
+                                    for data in ordered)
+        else:
+            combined_raw = "".join(data + "\n" for data in ordered)
 
         raw_path = os.path.join(RAW_DIR, complete_raw)
-        with open(raw_path, 'w') as f:
-            f.write(combined_raw)
+        write_raw(raw_path, combined_raw)
         print(f"Saved combined raw data to {raw_path}")
 
         # Save combined CSV data
@@ -434,19 +552,22 @@ def process_complete_chunks(session_id, session_key):
             raise IOError(f"Failed to save CSV file to {csv_path}")
 
         # Update last data info
-        with lock:
-            last_data = {
-                "filename": complete_csv,
-                "samples": len(df),
-                "timestamp": session_timestamp,
-                "has_analysis": True,
-                "chunked": True,
-                "chunks": total_chunks
-            }
-
-            # Clean up this session
-            if session_id in chunks_store:
-                del chunks_store[session_id]
+        analysis_store.publish_data({
+            "filename": complete_csv,
+            "samples": len(df),
+            "timestamp": session_timestamp,
+            "has_analysis": True,
+            "chunked": True,
+            "chunks": total_chunks
+        })
+
+        # Clean up this session
+        sessions.discard(session_id)
+
+        FINALIZE_SECONDS.observe(time.perf_counter() - finalize_start)
+        SESSION_SECONDS.observe(time.time() - session_data['timestamp'])
+        UPLOADS.inc(transfer='chunked')
+        UPLOAD_SAMPLES.inc(len(df), transfer='chunked')
 
         # Clean up session tracking file
         try:
@@ -455,28 +576,21 @@ def process_complete_chunks(session_id, session_key):
             pass  # Ignore errors cleaning up the session file
 
         # Run analysis in background
-        analysis_thread = threading.Thread(
-            target=run_analysis, args=(complete_csv,))
-        analysis_thread.daemon = True
-        analysis_thread.start()
+        analysis_job = submit_analysis(complete_csv)
 
         print(f"Successfully processed all chunks into {len(df)} samples")
+        return {"filename": complete_csv, "samples": len(df), "analysis_job": analysis_job.id}
 
     except Exception as e:
-        import traceback
         print(f"Error processing complete chunks: {e}")
-        traceback.print_exc()
 
         # Clean up session on error
-        with lock:
-            if session_id in chunks_store:
-                del chunks_store[session_id]
+        sessions.discard(session_id)
+        raise
 
 
 def process_complete_data(raw_data):
     """Process complete (non-chunked) data"""
-    global last_data
-
     # Generate filenames
     timestamp = timestamp_filename()
     raw_filename = f"{timestamp}.raw"
@@ -486,31 +600,29 @@ def process_complete_data(raw_data):
     print(f"Saving as {raw_filename} and {csv_filename}")
 
     # Save raw data
-    with open(os.path.join(RAW_DIR, raw_filename), 'w') as f:
-        f.write(raw_data)
+    write_raw(os.path.join(RAW_DIR, raw_filename), raw_data)
 
     # Process and save as CSV
-    df = decode_sensor_data(raw_data)
+    with DECODE_SECONDS.time(format=payload_format(raw_data), transfer='single'):
+        df = decode_sensor_data(raw_data)
+    UPLOADS.inc(transfer='single')
+    UPLOAD_SAMPLES.inc(len(df), transfer='single')
     save_decoded_data(df, os.path.join(CSV_DIR, csv_filename))
 
-    # Generate analysis in a separate thread
-    analysis_thread = threading.Thread(
-        target=run_analysis, args=(csv_filename,))
-    analysis_thread.daemon = True
-    analysis_thread.start()
+    # Generate analysis in the background
+    analysis_job = submit_analysis(csv_filename)
 
     # Update last data info
-    with lock:
-        last_data = {
-            "filename": csv_filename,
-            "samples": len(df),
-            "timestamp": timestamp,
-            "has_analysis": True,
-            "chunked": False
-        }
+    analysis_store.publish_data({
+        "filename": csv_filename,
+        "samples": len(df),
+        "timestamp": timestamp,
+        "has_analysis": True,
+        "chunked": False
+    })
 
     print(f"Successfully processed {len(df)} samples")
-    return "OK", 200
+    return "OK", 200, {'X-Job-Id': analysis_job.id}
 
 # Routes
 
@@ -551,7 +663,7 @@ def get_ip_list():
 @app.route('/')
 def index():
     """Render the main dashboard"""
-    return render_template('index.html', is_collecting=is_collecting)
+    return render_template('index.html', is_collecting=connection.collecting)
 
 
 @app.route('/files')
@@ -572,8 +684,10 @@ def download_file(filename):
 def view_analysis(filename):
     """View analysis for a specific CSV file"""
     try:
-        analysis_data = generate_analysis(filename)
-        return render_template('analysis.html', analysis=analysis_data)
+        with ANALYSIS_SECONDS.time(source='request'):
+            analysis_data = generate_analysis(filename)
+        with RENDER_SECONDS.time():
+            return render_template('analysis.html', analysis=analysis_data)
     except Exception as e:
         return f"Error generating analysis: {str(e)}", 500
 
@@ -581,14 +695,12 @@ def view_analysis(filename):
 @app.route('/latest-analysis')
 def latest_analysis():
     """View analysis for the most recent CSV file"""
-    global last_data
-
     # First priority: Use the last_data information if available
-    with lock:
-        if last_data and "filename" in last_data:
-            filename = last_data["filename"]
-            if os.path.exists(os.path.join(CSV_DIR, filename)):
-                return view_analysis(filename)
+    last_data = analysis_store.last_data
+    if last_data and "filename" in last_data:
+        filename = last_data["filename"]
+        if os.path.exists(os.path.join(CSV_DIR, filename)):
+            return view_analysis(filename)
 
     # Second priority: Find the most recent file by modification time
     csv_files = [f for f in os.listdir(CSV_DIR) if f.endswith('.csv')]
@@ -615,71 +727,180 @@ def latest_analysis():
 @app.route('/start', methods=['POST'])
 def start_collection():
     """Start data collection on the sensor"""
-    global is_collecting
-
-    with lock:
-        if not connected_client:
-            return jsonify({"status": "error", "message": "No sensor connected"})
-        if is_collecting:
-            return jsonify({"status": "error", "message": "Already collecting data"})
-
-        try:
-            connected_client.send(b"START\n")
-            is_collecting = True
-            return jsonify({"status": "success"})
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)})
+    error = connection.send_command(b"START\n", collecting=True)
+    if error:
+        return jsonify({"status": "error", "message": error})
+    return jsonify({"status": "success"})
 
 
 @app.route('/stop', methods=['POST'])
 def stop_collection():
     """Stop data collection on the sensor"""
-    global is_collecting
-
-    with lock:
-        if not connected_client:
-            return jsonify({"status": "error", "message": "No sensor connected"})
-        if not is_collecting:
-            return jsonify({"status": "error", "message": "Not collecting data"})
-
-        try:
-            connected_client.send(b"STOP\n")
-            is_collecting = False
-            return jsonify({"status": "success"})
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)})
+    error = connection.send_command(b"STOP\n", collecting=False)
+    if error:
+        return jsonify({"status": "error", "message": error})
+    return jsonify({"status": "success"})
 
 
 @app.route('/clear-connection', methods=['POST'])
 def clear_connection():
     """Clear any existing connection"""
-    global connected_client, client_address, is_collecting
-
-    with lock:
-        if connected_client:
-            try:
-                connected_client.close()
-            except:
-                pass
-            connected_client = None
-            client_address = None
-            is_collecting = False
-
+    connection.clear()
     return jsonify({"status": "success"})
 
 
 @app.route('/status')
 def get_status():
     """Get current system status"""
-    global connected_client, client_address, is_collecting, last_data
-
-    with lock:
-        return jsonify({
-            "connected": connected_client is not None,
-            "client_address": client_address,
-            "collecting": is_collecting,
-            "last_data": last_data
-        })
+    return jsonify({
+        **connection.snapshot(),
+        "last_data": analysis_store.last_data,
+        "jobs": jobs_view.counts()
+    })
+
+
+@app.route('/jobs')
+def list_jobs():
+    """Recent background jobs, newest first (?file=<csv> for the analysis job of a recording)"""
+    filename = request.args.get('file')
+    if filename:
+        job = jobs_view.find(f"analysis:{os.path.basename(filename)}")
+        jobs = [job.to_dict()] if job else []
+    else:
+        jobs = jobs_view.jobs(request.args.get('limit', 50, type=int))
+    return jsonify({"status": "success", "jobs": jobs, **jobs_view.counts()})
+
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Status of one background job; poll until it is done or failed"""
+    job = jobs_view.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Runtime metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/live-preview')
+def live_preview():
+    """Bandpass-filtered samples of the chunked upload in progress"""
+    current = sessions.latest_preview
+    if current is None:
+        return jsonify({"status": "error", "message": "No upload in progress"})
+
+    session_id, preview = current
+    max_points = request.args.get('max_points', type=int)
+    return jsonify({
+        "status": "success",
+        "session_id": session_id,
+        **preview.snapshot(max_points)
+    })
+
+
+@app.route('/beats/<filename>')
+def beats(filename):
+    """Detected beats, RR intervals and HRV metrics of a stored recording"""
+    file_path = os.path.join(CSV_DIR, os.path.basename(filename))
+    if not os.path.exists(file_path):
+        return jsonify({"status": "error", "message": "File not found"}), 404
+
+    try:
+        beat_table, hrv = analyze_recording(file_path)
+    except Exception as e:
+        print(f"Error in beat analysis: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    response = {"status": "success", "filename": filename, "metrics": hrv}
+    if request.args.get('beats', '').lower() in ('1', 'true', 'yes'):
+        response["beats"] = json.loads(beat_table.to_json(orient='records'))
+    return jsonify(response)
+
+
+@app.route('/spectrum/<filename>')
+def spectrum(filename):
+    """Welch spectral features of a stored recording"""
+    file_path = os.path.join(CSV_DIR, os.path.basename(filename))
+    if not os.path.exists(file_path):
+        return jsonify({"status": "error", "message": "File not found"}), 404
+
+    try:
+        _, features, summary = spectral.analyze_recording(file_path)
+    except Exception as e:
+        print(f"Error in spectral analysis: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    response = {"status": "success", "filename": filename, "summary": summary}
+    if request.args.get('windows', '').lower() in ('1', 'true', 'yes'):
+        response["windows"] = json.loads(features.to_json(orient='records'))
+    return jsonify(response)
+
+
+def get_classifier():
+    """Load the TFLite activity model once and share it between requests"""
+    global activity_classifier
+    with classifier_lock:
+        if activity_classifier is None:
+            activity_classifier = ActivityClassifier()
+        return activity_classifier
+
+
+@app.route('/api/classify', methods=['POST'])
+def classify():
+    """
+    Classify sensor windows with the activity model.
+
+    The JSON body holds one of:
+        {"windows": [[[ir, red], ...], ...]}   raw windows of WINDOW_SIZE samples
+        {"ir": [...], "red": [...]}            a continuous signal, cut every `step` samples
+        {"filename": "<recording>.csv"}        a stored recording
+    plus optional "step" and "normalization" ("window" or "firmware").
+    """
+    payload = request.get_json(silent=True) or {}
+    normalization = payload.get('normalization', 'window')
+    step = payload.get('step', WINDOW_SIZE)
+
+    try:
+        model = get_classifier()
+    except Exception as e:
+        print(f"Error loading activity model: {e}")
+        return jsonify({"status": "error", "message": f"Model not available: {e}"}), 503
+
+    try:
+        if 'filename' in payload:
+            file_path = os.path.join(CSV_DIR, os.path.basename(payload['filename']))
+            if not os.path.exists(file_path):
+                return jsonify({"status": "error", "message": "File not found"}), 404
+            result = classify_file(model, file_path, int(step), normalization)
+        elif 'windows' in payload:
+            windows = np.asarray(payload['windows'], dtype=np.float64)
+            if windows.ndim != 3 or windows.shape[1:] != (model.window_size, model.channels):
+                return jsonify({"status": "error",
+                                "message": f"windows must have shape (n, {model.window_size}, {model.channels})"}), 400
+            class_index, confidence = model.predict(normalize_windows(windows, normalization))
+            result = pd.DataFrame({
+                'actionClass': class_index,
+                'label': np.array(CLASSES, dtype=object)[class_index],
+                'confidence': confidence,
+            })
+        elif 'ir' in payload and 'red' in payload:
+            result = model.classify_signal(payload['ir'], payload['red'], int(step), normalization)
+        else:
+            return jsonify({"status": "error",
+                            "message": "Expected 'windows', 'ir'/'red' or 'filename'"}), 400
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify({
+        "status": "success",
+        "classes": CLASSES,
+        "counts": {label: int(count) for label, count in result['label'].value_counts().items()},
+        "predictions": json.loads(result.to_json(orient='records')),
+    })
 
 
 @app.route('/plot/<filename>')
@@ -714,8 +935,9 @@ def plot_file(filename):
 
 
 if __name__ == "__main__":
-    # Start TCP server
-    start_tcp_server()
+    # Start TCP server (unless a separate device listener owns the sensor)
+    if not DEVICE_SOCKET:
+        start_tcp_server()
 
     print(f"Starting Oxi Sensor Server:")
     print(f"- TCP Server on port {TCP_PORT}")
@@ -0,0 +1,347 @@
+"""
+SQLite-backed shared state for running the server in several processes.
+
+With STATE_DB set, chunked upload sessions, the latest upload/analysis and
+the job log live in one SQLite database in WAL mode, so any gunicorn
+worker can receive any chunk and answer any status request. The classes
+mirror SessionStore, AnalysisStore and the JobQueue lookups.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from jobs import JOB_HISTORY
+from state import SESSION_TIMEOUT
+
+BUSY_TIMEOUT = 10.0   # Seconds a writer waits for another process's transaction
+KEEP_PREVIEWS = 4     # Live previews of recent sessions kept per process
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    total_chunks INTEGER NOT NULL,
+    total_samples INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    updated REAL NOT NULL,
+    finalizing INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    session_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    start_index INTEGER NOT NULL,
+    data,
+    PRIMARY KEY (session_id, chunk_index)
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage INTEGER NOT NULL,
+    submitted REAL NOT NULL,
+    record TEXT NOT NULL,
+    pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, submitted);
+"""
+
+
+class SharedDatabase:
+    """One SQLite connection per thread to a WAL-mode database file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        db = self.connection()
+        db.executescript(SCHEMA)
+        # Job logs created before the pid column
+        if 'pid' not in [row[1] for row in db.execute("PRAGMA table_info(jobs)")]:
+            try:
+                db.execute("ALTER TABLE jobs ADD COLUMN pid INTEGER")
+            except sqlite3.OperationalError:
+                pass   # Added by another process
+
+    def connection(self):
+        try:
+            return self._local.db
+        except AttributeError:
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            return db
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; takes the database write lock up front"""
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+
+class SqliteSessionStore:
+    """
+    SessionStore shared between processes.
+
+    Live previews stay in process memory: each process keeps previews of
+    recent sessions and fills in chunks received by other processes from
+    the database when /live-preview is read. The chunks of the last
+    discarded session are kept until the next one is discarded, so its
+    preview can still be completed.
+    """
+
+    def __init__(self, db, preview_factory, timeout=SESSION_TIMEOUT):
+        self.db = db
+        self.timeout = timeout
+        self._preview_factory = preview_factory
+        self._previews = OrderedDict()   # session_id -> LivePreview, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.db.connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _preview(self, session_id):
+        with self._lock:
+            preview = self._previews.get(session_id)
+            if preview is None:
+                preview = self._previews[session_id] = self._preview_factory()
+                while len(self._previews) > KEEP_PREVIEWS:
+                    self._previews.popitem(last=False)
+            return preview
+
+    def add_chunk(self, session_id, total_chunks, total_samples, chunk):
+        """
+        Store a chunk, creating its session on first use.
+
+        A chunk sent twice replaces the earlier copy instead of counting twice.
+
+        Returns:
+            Tuple (chunks received so far, the session's live preview)
+        """
+        now = time.time()
+        with self.db.transaction() as db:
+            created = db.execute("INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?, ?, 0)",
+                                 (session_id, total_chunks, total_samples, now, now)).rowcount
+            if created:
+                self._expire(db, now)
+            db.execute("UPDATE sessions SET updated = ? WHERE session_id = ?", (now, session_id))
+            db.execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                       (session_id, chunk['chunk_index'], chunk['start_index'], chunk['data']))
+            received = db.execute("SELECT COUNT(*) FROM chunks WHERE session_id = ?",
+                                  (session_id,)).fetchone()[0]
+        return received, self._preview(session_id)
+
+    def claim(self, session_id):
+        """Mark a complete session as being finalized; True for the first caller only"""
+        with self.db.transaction() as db:
+            cursor = db.execute(
+                "UPDATE sessions SET finalizing = 1, updated = ? "
+                "WHERE session_id = ? AND finalizing = 0", (time.time(), session_id))
+            return cursor.rowcount == 1
+
+    def release(self, session_id):
+        """Undo a claim whose finalization could not be queued"""
+        with self.db.transaction() as db:
+            db.execute("UPDATE sessions SET finalizing = 0 WHERE session_id = ?", (session_id,))
+
+    def _expire(self, db, now):
+        """Drop sessions that received no chunk for the timeout, with their chunks"""
+        stale = [session_id for session_id, in db.execute(
+            "SELECT session_id FROM sessions WHERE updated < ?", (now - self.timeout,))]
+        for session_id in stale:
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM chunks WHERE session_id = ?", (session_id,))
+            print(f"Dropped stale upload session {session_id}")
+
+    def get(self, session_id):
+        """A session with its chunks, or None"""
+        db = self.db.connection()
+        row = db.execute("SELECT total_chunks, total_samples, timestamp FROM sessions "
+                         "WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        chunks = [{'chunk_index': index, 'start_index': start, 'data': data}
+                  for index, start, data in db.execute(
+                      "SELECT chunk_index, start_index, data FROM chunks "
+                      "WHERE session_id = ? ORDER BY chunk_index", (session_id,))]
+        return {
+            'chunks': chunks,
+            'total_chunks': row[0],
+            'total_samples': row[1],
+            'received_chunks': len(chunks),
+            'timestamp': row[2],
+        }
+
+    def discard(self, session_id):
+        with self.db.transaction() as db:
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM chunks WHERE session_id != ? AND session_id NOT IN "
+                       "(SELECT session_id FROM sessions)", (session_id,))
+            db.execute("INSERT OR REPLACE INTO kv VALUES ('preview_session', ?)",
+                       (json.dumps(session_id),))
+
+    @property
+    def latest_preview(self):
+        """(session_id, LivePreview) of the most recent chunk, or None"""
+        db = self.db.connection()
+        row = db.execute("SELECT session_id FROM sessions ORDER BY updated DESC LIMIT 1").fetchone()
+        if row is None:
+            # No upload in progress: the last discarded session
+            row = db.execute("SELECT value FROM kv WHERE key = 'preview_session'").fetchone()
+            if row is None:
+                return None
+            row = (json.loads(row[0]),)
+        session_id = row[0]
+        preview = self._preview(session_id)
+        for index, data in db.execute(
+                "SELECT chunk_index, data FROM chunks WHERE session_id = ? AND chunk_index >= ? "
+                "ORDER BY chunk_index", (session_id, preview.next_chunk)):
+            if preview.wants(index):
+                preview.add_chunk(index, data)
+        return session_id, preview
+
+
+def _dumps(value):
+    # Analysis results hold numpy scalars and arrays
+    return json.dumps(value, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+
+
+class SqliteAnalysisStore:
+    """AnalysisStore shared between processes (snapshots stored as JSON)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _read(self, key):
+        row = self.db.connection().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, key, value):
+        with self.db.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, _dumps(value)))
+
+    @property
+    def last_data(self):
+        return self._read('last_data')
+
+    @property
+    def last_analysis(self):
+        return self._read('last_analysis')
+
+    def publish_data(self, info):
+        self._write('last_data', info)
+
+    def publish_analysis(self, analysis):
+        self._write('last_analysis', analysis)
+
+
+def _process_alive(pid):
+    if pid is None:
+        return False   # Saved before pids were recorded
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class StoredJob:
+    """A job record read back from the database"""
+
+    def __init__(self, record):
+        self.record = record
+        self.id = record['id']
+
+    def to_dict(self):
+        return self.record
+
+
+class SqliteJobLog:
+    """
+    Job statuses of every process, so /jobs/<id> can be polled on any worker.
+
+    Jobs still run in the process that submitted them; save() is the
+    JobQueue on_update hook. Each row keeps the pid of that process, and
+    queued or running jobs of a process that has exited are marked failed
+    when the log is read.
+    """
+
+    def __init__(self, db, history=JOB_HISTORY):
+        self.db = db
+        self.history = history
+
+    def save(self, job):
+        record = job.to_dict()
+        # Updates are reported from several threads; never go back to an earlier stage
+        stage = {'queued': 0, 'running': 1}.get(record['status'], 2)
+        with self.db.transaction() as db:
+            db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?) "
+                       "ON CONFLICT (id) DO UPDATE SET status = excluded.status, "
+                       "stage = excluded.stage, record = excluded.record "
+                       "WHERE excluded.stage >= jobs.stage",
+                       (job.id, job.key, record['status'], stage, job.submitted, _dumps(record),
+                        os.getpid()))
+            # Forget the oldest finished jobs beyond the history size
+            db.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs "
+                       "WHERE status NOT IN ('queued', 'running') "
+                       "ORDER BY submitted DESC LIMIT -1 OFFSET ?)", (self.history,))
+
+    def _expire_orphans(self):
+        """Mark queued or running jobs of exited processes as failed"""
+        active = self.db.connection().execute(
+            "SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        orphans = [job_id for job_id, pid in active if not _process_alive(pid)]
+        if not orphans:
+            return
+        now = time.time()
+        with self.db.transaction() as db:
+            for job_id in orphans:
+                row = db.execute("SELECT record FROM jobs WHERE id = ? AND stage < 2",
+                                 (job_id,)).fetchone()
+                if row is None:
+                    continue
+                record = dict(json.loads(row[0]), status='failed', finished=now,
+                              error='Worker process exited')
+                db.execute("UPDATE jobs SET status = 'failed', stage = 2, record = ? WHERE id = ?",
+                           (_dumps(record), job_id))
+
+    def get(self, job_id):
+        self._expire_orphans()
+        row = self.db.connection().execute("SELECT record FROM jobs WHERE id = ?",
+                                           (job_id,)).fetchone()
+        return StoredJob(json.loads(row[0])) if row else None
+
+    def find(self, key):
+        """Most recent job with this key, or None"""
+        self._expire_orphans()
+        row = self.db.connection().execute(
+            "SELECT record FROM jobs WHERE key = ? ORDER BY submitted DESC LIMIT 1",
+            (key,)).fetchone()
+        return StoredJob(json.loads(row[0])) if row else None
+
+    def jobs(self, limit=50):
+        """Most recent jobs first, as dicts"""
+        self._expire_orphans()
+        return [json.loads(record) for record, in self.db.connection().execute(
+            "SELECT record FROM jobs ORDER BY submitted DESC LIMIT ?", (limit,))]
+
+    def counts(self):
+        self._expire_orphans()
+        counts = dict(self.db.connection().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') "
+            "GROUP BY status").fetchall())
+        return {'pending': counts.get('queued', 0), 'running': counts.get('running', 0)}
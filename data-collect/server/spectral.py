@@ -0,0 +1,249 @@
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import median_filter
+from scipy.signal import get_window
+from recording_cache import RecordingCache
+
+SAMPLING_RATE = 40      # Hz, nominal sensor rate
+WINDOW_SECONDS = 16.0   # Length of each analysis window
+STEP_SECONDS = 4.0      # Hop between analysis windows
+SEGMENT_SECONDS = 8.0   # Welch segment length inside a window (50% overlap)
+TRACK_WINDOWS = 5       # Windows in the median used to track the dominant frequency
+
+CHANNELS = ['ir', 'red']
+
+# Frequency bands (Hz); the cardiac band matches the bandpass used elsewhere
+BANDS = {
+    'respiration': (0.1, 0.5),
+    'cardiac': (0.5, 4.0),
+    'high': (4.0, None),  # Up to Nyquist: motion and noise
+}
+
+CACHE_SIZE = 32
+
+_cache = RecordingCache(CACHE_SIZE)
+
+
+def welch_psd(windows, fs=SAMPLING_RATE, nperseg=None, noverlap=None):
+    """
+    Welch power spectral density along the last axis of a batch of windows.
+
+    Every window of every channel goes through a single rfft call: segments
+    are taken as strided views, mean-detrended and Hann-weighted, like
+    scipy.signal.welch with its default settings.
+
+    Args:
+        windows: Array (..., n_samples)
+        fs: Sampling frequency (Hz)
+        nperseg: Samples per segment (default: whole window)
+        noverlap: Overlapping samples between segments (default: nperseg // 2)
+
+    Returns:
+        Tuple (freqs, psd) with psd of shape (..., nperseg // 2 + 1)
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    n_samples = windows.shape[-1]
+    nperseg = min(nperseg or n_samples, n_samples)
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+
+    segments = sliding_window_view(windows, nperseg, axis=-1)[..., ::nperseg - noverlap, :]
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+
+    window = get_window('hann', nperseg)
+    spectrum = np.fft.rfft(segments * window, axis=-1)
+    psd = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=-2)
+    psd /= fs * np.sum(window ** 2)
+
+    # One-sided: fold the negative frequencies in (not DC, not Nyquist)
+    last = -1 if nperseg % 2 == 0 else None
+    psd[..., 1:last] *= 2
+    return np.fft.rfftfreq(nperseg, 1.0 / fs), psd
+
+
+def band_power(freqs, psd, low, high=None):
+    """Power in [low, high) Hz along the last axis (rectangle rule)"""
+    mask = freqs >= low
+    if high is not None:
+        mask &= freqs < high
+    return psd[..., mask].sum(axis=-1) * (freqs[1] - freqs[0])
+
+
+def dominant_frequency(freqs, psd, low=0.5, high=4.0):
+    """
+    Frequency of the largest PSD bin in [low, high] Hz, refined by parabolic
+    interpolation over the neighbouring bins.
+    """
+    band = np.flatnonzero((freqs >= low) & (freqs <= high))
+    peak = band[0] + np.argmax(psd[..., band], axis=-1)
+
+    left = np.take_along_axis(psd, np.maximum(peak - 1, 0)[..., None], axis=-1)[..., 0]
+    center = np.take_along_axis(psd, peak[..., None], axis=-1)[..., 0]
+    right = np.take_along_axis(psd, np.minimum(peak + 1, psd.shape[-1] - 1)[..., None], axis=-1)[..., 0]
+    denominator = left - 2 * center + right
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offset = np.where(denominator != 0, 0.5 * (left - right) / denominator, 0.0)
+    return freqs[peak] + np.clip(offset, -0.5, 0.5) * (freqs[1] - freqs[0])
+
+
+def recording_windows(values, fs=SAMPLING_RATE, window_seconds=WINDOW_SECONDS,
+                      step_seconds=STEP_SECONDS):
+    """
+    Analysis windows of a (n_samples, n_channels) recording, as a view.
+
+    Returns:
+        Tuple (windows (n_windows, n_channels, window), start indices)
+    """
+    window = int(round(window_seconds * fs))
+    step = max(1, int(round(step_seconds * fs)))
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window:
+        return np.empty((0, values.shape[1], window)), np.empty(0, dtype=np.int64)
+    view = sliding_window_view(values, window, axis=0)[::step]
+    return view, np.arange(len(view)) * step
+
+
+def features_from_psd(freqs, psd, starts, time_delta, window):
+    """Feature table from the PSD of one recording's windows (n_windows, n_channels, n_freqs)"""
+    centers = np.minimum(starts + window // 2, len(time_delta) - 1)
+    features = {
+        'start_index': starts,
+        'time': np.asarray(time_delta)[centers] if len(starts) else np.empty(0),
+    }
+    if len(starts) == 0:
+        return pd.DataFrame(features)
+
+    ir_psd = psd[:, 0, :]
+    dominant = dominant_frequency(freqs, ir_psd)
+    features['dominant_freq'] = dominant
+    features['dominant_hr'] = dominant * 60.0
+    # Median over neighbouring windows rejects single-window jumps to a harmonic
+    features['tracked_hr'] = median_filter(dominant * 60.0, size=TRACK_WINDOWS, mode='nearest')
+
+    total = band_power(freqs, psd, freqs[1])  # Everything except DC
+    for name, (low, high) in BANDS.items():
+        power = band_power(freqs, psd, low, high)
+        for index, channel in enumerate(CHANNELS):
+            features[f'{channel}_{name}_power'] = power[:, index]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cardiac = band_power(freqs, psd, *BANDS['cardiac'])
+        features['cardiac_ratio'] = np.where(total[:, 0] > 0, cardiac[:, 0] / total[:, 0], 0.0)
+    return pd.DataFrame(features)
+
+
+def summarize(features):
+    """Recording-level summary of a feature table"""
+    if features.empty:
+        return {'windows': 0, 'dominant_hr': None, 'dominant_hr_std': None, 'cardiac_ratio': None,
+                'ir_cardiac_power': None, 'ir_high_power': None}
+    return {
+        'windows': int(len(features)),
+        'dominant_hr': float(features['tracked_hr'].median()),
+        'dominant_hr_std': float(features['tracked_hr'].std(ddof=0)),
+        'cardiac_ratio': float(features['cardiac_ratio'].mean()),
+        'ir_cardiac_power': float(features['ir_cardiac_power'].median()),
+        'ir_high_power': float(features['ir_high_power'].median()),
+    }
+
+
+def analyze_spectrum(df, fs=SAMPLING_RATE):
+    """
+    Spectral features and summary of a recording.
+
+    Returns:
+        Tuple (mean PSD dict, features DataFrame, summary dict)
+    """
+    windows, starts = recording_windows(df[CHANNELS].to_numpy(), fs)
+    freqs, psd = welch_psd(windows, fs, int(round(SEGMENT_SECONDS * fs)))
+    features = features_from_psd(freqs, psd, starts, df['time_delta'].to_numpy(),
+                                 int(round(WINDOW_SECONDS * fs)))
+    mean_psd = {
+        'freqs': freqs,
+        'ir': psd[:, 0, :].mean(axis=0) if len(psd) else np.zeros_like(freqs),
+        'red': psd[:, 1, :].mean(axis=0) if len(psd) else np.zeros_like(freqs),
+    }
+    return mean_psd, features, summarize(features)
+
+
+def analyze_recording(file_path, fs=SAMPLING_RATE):
+    """analyze_spectrum for a CSV recording, cached per file (results must not be modified)"""
+    return _cache.get(
+        file_path,
+        lambda path: analyze_spectrum(pd.read_csv(path, usecols=CHANNELS + ['time_delta']), fs),
+        fs)
+
+
+def analyze_directory(csv_dir, fs=SAMPLING_RATE):
+    """
+    Spectral features of every recording in one batched pass.
+
+    The windows of all recordings are stacked and transformed with a single
+    Welch/rfft call, then split back per recording.
+
+    Returns:
+        Dict filename -> (features DataFrame, summary dict)
+    """
+    recordings = []
+    for file_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        df = pd.read_csv(file_path, usecols=CHANNELS + ['time_delta'])
+        windows, starts = recording_windows(df[CHANNELS].to_numpy(), fs)
+        recordings.append((os.path.basename(file_path), windows, starts, df['time_delta'].to_numpy()))
+    if not recordings:
+        return {}
+
+    freqs, psd = welch_psd(np.concatenate([r[1] for r in recordings]), fs,
+                           int(round(SEGMENT_SECONDS * fs)))
+
+    results = {}
+    offset = 0
+    for name, windows, starts, time_delta in recordings:
+        features = features_from_psd(freqs, psd[offset:offset + len(windows)], starts,
+                                     time_delta, int(round(WINDOW_SECONDS * fs)))
+        results[name] = (features, summarize(features))
+        offset += len(windows)
+    return results
+
+
+def _format(value, unit=''):
+    return '-' if value is None else f"{value:.2f}{unit}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Welch spectral features of stored recordings')
+    parser.add_argument('file', nargs='?', help='CSV file to process')
+    parser.add_argument('--all', action='store_true',
+                        help='Process every recording in data/csv in one batched pass')
+    parser.add_argument('--fs', type=float, default=SAMPLING_RATE,
+                        help='Sampling frequency (Hz)')
+    parser.add_argument('--windows', action='store_true',
+                        help='Print the per-window features')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.all:
+        results = analyze_directory(os.path.join('data', 'csv'), args.fs)
+    elif args.file:
+        _, features, summary = analyze_recording(args.file, args.fs)
+        results = {os.path.basename(args.file): (features, summary)}
+    else:
+        parser.print_help()
+        return
+    elapsed = time.perf_counter() - start
+
+    for name, (features, summary) in results.items():
+        print(f"{name}: {summary['windows']} windows, dominant HR "
+              f"{_format(summary['dominant_hr'], ' bpm')}, cardiac power ratio "
+              f"{_format(summary['cardiac_ratio'])}")
+        if args.windows:
+            print(features.to_string(index=False))
+    print(f"{len(results)} recordings in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+
+# Seconds without a chunk after which an unfinished upload session is dropped
+SESSION_TIMEOUT = float(os.environ.get("SESSION_TIMEOUT", "600"))
+
+
+class ConnectionManager:
+    """
+    The sensor's TCP connection and whether it is collecting.
+
+    Socket I/O happens outside the lock, so a slow send never holds up
+    /status.
+    """
+
+    def __init__(self, lock=None):
+        self._lock = lock or threading.Lock()
+        self._socket = None
+        self._address = None
+        self._collecting = False
+
+    def connect(self, client_socket, address):
+        with self._lock:
+            self._socket = client_socket
+            self._address = address
+
+    def disconnect(self, client_socket):
+        """Forget the connection if it is still the current one"""
+        with self._lock:
+            if self._socket is client_socket:
+                self._socket = None
+                self._address = None
+                self._collecting = False
+
+    def clear(self):
+        """Drop the current connection, closing its socket"""
+        with self._lock:
+            client_socket = self._socket
+            self._socket = None
+            self._address = None
+            self._collecting = False
+        if client_socket is not None:
+            try:
+                client_socket.close()
+            except OSError:
+                pass
+
+    def set_collecting(self, collecting):
+        with self._lock:
+            self._collecting = collecting
+
+    @property
+    def connected(self):
+        return self._socket is not None
+
+    @property
+    def collecting(self):
+        return self._collecting
+
+    def snapshot(self):
+        """Consistent view of the connection for /status"""
+        with self._lock:
+            return {
+                "connected": self._socket is not None,
+                "client_address": self._address,
+                "collecting": self._collecting,
+            }
+
+    def send_command(self, command, collecting):
+        """
+        Send START/STOP and switch the collecting flag.
+
+        The flag is switched under the lock before sending, so concurrent
+        calls cannot both send the same command; it is restored if the
+        send fails.
+
+        Args:
+            command: Command bytes (e.g. b"START\\n")
+            collecting: Collecting flag after the command
+
+        Returns:
+            Error message, or None on success
+        """
+        with self._lock:
+            client_socket = self._socket
+            if client_socket is None:
+                return "No sensor connected"
+            if self._collecting == collecting:
+                return "Already collecting data" if collecting else "Not collecting data"
+            self._collecting = collecting
+
+        try:
+            client_socket.send(command)
+            return None
+        except Exception as e:
+            with self._lock:
+                if self._socket is client_socket:
+                    self._collecting = not collecting
+            return str(e)
+
+
+class SessionStore:
+    """Chunked upload sessions that are still receiving chunks"""
+
+    def __init__(self, preview_factory, lock=None, timeout=SESSION_TIMEOUT):
+        self._lock = lock or threading.Lock()
+        self._preview_factory = preview_factory
+        self.timeout = timeout
+        self._sessions = {}
+        self._latest_preview = None   # (session_id, preview)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add_chunk(self, session_id, total_chunks, total_samples, chunk):
+        """
+        Store a chunk, creating its session on first use.
+
+        Returns:
+            Tuple (chunks received so far, the session's live preview)
+        """
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self._expire(now)
+                session = self._sessions[session_id] = {
+                    'chunks': [],
+                    'total_chunks': total_chunks,
+                    'total_samples': total_samples,
+                    'received_chunks': 0,
+                    'timestamp': now,
+                    'finalizing': False,
+                    'preview': self._preview_factory()
+                }
+            session['updated'] = now
+            session['chunks'].append(chunk)
+            session['received_chunks'] += 1
+            self._latest_preview = (session_id, session['preview'])
+            return session['received_chunks'], session['preview']
+
+    def claim(self, session_id):
+        """Mark a complete session as being finalized; True for the first caller only"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session['finalizing']:
+                return False
+            session['finalizing'] = True
+            session['updated'] = time.time()
+            return True
+
+    def release(self, session_id):
+        """Undo a claim whose finalization could not be queued"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session['finalizing'] = False
+
+    def _expire(self, now):
+        """Drop sessions that received no chunk for the timeout (lock held)"""
+        for session_id in [i for i, s in self._sessions.items()
+                           if now - s['updated'] > self.timeout]:
+            del self._sessions[session_id]
+            print(f"Dropped stale upload session {session_id}")
+
+    def get(self, session_id):
+        """Copy of a session (its chunk list can be used without the lock), or None"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return dict(session, chunks=list(session['chunks']))
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    @property
+    def latest_preview(self):
+        """(session_id, LivePreview) of the most recent chunk, or None"""
+        return self._latest_preview
+
+
+class AnalysisStore:
+    """
+    The most recent upload and its analysis.
+
+    Both are immutable snapshots: writers build a new dict and swap it in
+    with a single assignment, so readers never need a lock. Callers must
+    not modify the returned dicts.
+    """
+
+    def __init__(self):
+        self.last_data = None
+        self.last_analysis = None
+
+    def publish_data(self, info):
+        self.last_data = info
+
+    def publish_analysis(self, analysis):
+        self.last_analysis = analysis
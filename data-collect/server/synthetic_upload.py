@@ -0,0 +1,135 @@
+import gzip
+import time
+import struct
+import argparse
+import urllib.request
+import numpy as np
+
+from data_decoder import encode_delta_frame, DELTA_CONTENT_TYPE
+
+SAMPLING_RATE = 40    # Hz, as collected by the sensor
+CHUNK_SIZE = 1000     # Samples per chunk (sendCollectedData default)
+
+
+def synthetic_samples(n_samples, fs=SAMPLING_RATE, start_ms=None, heart_rate=75.0, seed=0):
+    """
+    Plausible MAX30105 readings: DC level, pulse, slow drift and noise.
+
+    Returns:
+        Tuple (timestamp, ir, red) of uint32 arrays
+    """
+    rng = np.random.default_rng(seed)
+    if start_ms is None:
+        start_ms = int(time.time() * 1000) % 2**31
+    t = np.arange(n_samples) / fs
+    pulse = np.sin(2 * np.pi * heart_rate / 60.0 * t)
+    drift = np.sin(2 * np.pi * 0.05 * t)
+
+    timestamp = start_ms + np.round(t * 1000).astype(np.int64)
+    ir = 105500 + 300 * pulse + 500 * drift + rng.normal(0, 30, n_samples)
+    red = 101000 + 200 * pulse + 400 * drift + rng.normal(0, 30, n_samples)
+    return (timestamp.astype(np.uint32),
+            np.round(ir).astype(np.uint32),
+            np.round(red).astype(np.uint32))
+
+
+def text_payload(timestamp, ir, red):
+    """Chunk body as built by data_transmission.h: count line, then timestamp,ir,red lines"""
+    lines = [str(len(timestamp))]
+    lines.extend(f"{t},{i},{r}" for t, i, r in zip(timestamp.tolist(), ir.tolist(), red.tolist()))
+    return "\n".join(lines) + "\n"
+
+
+def binary_payload(timestamp, ir, red):
+    """Binary body: uint32 sample count, then <III per sample"""
+    samples = np.empty((len(timestamp), 3), dtype='<u4')
+    samples[:, 0] = timestamp
+    samples[:, 1] = ir
+    samples[:, 2] = red
+    return struct.pack('<I', len(timestamp)) + samples.tobytes()
+
+
+def chunked_upload(n_samples, chunk_size=CHUNK_SIZE, binary=False, delta=False, compress=False,
+                   **kwargs):
+    """
+    Requests of one chunked upload, in the firmware's order.
+
+    Args:
+        binary: Fixed-width binary chunks instead of text
+        delta: Delta frames (encode_delta_frame) instead of text
+        compress: gzip each body (Content-Encoding: gzip)
+
+    Returns:
+        List of (headers dict, body) tuples; body is str for text, bytes otherwise
+    """
+    timestamp, ir, red = synthetic_samples(n_samples, **kwargs)
+    if delta:
+        build, content_type = encode_delta_frame, DELTA_CONTENT_TYPE
+    elif binary:
+        build, content_type = binary_payload, 'application/octet-stream'
+    else:
+        build, content_type = text_payload, 'text/plain'
+    total_chunks = (n_samples + chunk_size - 1) // chunk_size
+
+    requests = []
+    for chunk in range(total_chunks):
+        start, end = chunk * chunk_size, min((chunk + 1) * chunk_size, n_samples)
+        headers = {
+            'Content-Type': content_type,
+            'X-Chunk-Index': str(chunk),
+            'X-Total-Chunks': str(total_chunks),
+            'X-Total-Samples': str(n_samples),
+            'X-Chunk-Start-Index': str(start),
+        }
+        body = build(timestamp[start:end], ir[start:end], red[start:end])
+        if compress:
+            body = gzip.compress(body.encode('utf-8') if isinstance(body, str) else body)
+            headers['Content-Encoding'] = 'gzip'
+        requests.append((headers, body))
+    return requests
+
+
+def post(url, headers, body, timeout=30):
+    """POST one request to a running server; returns (status, seconds)"""
+    data = body.encode('utf-8') if isinstance(body, str) else body
+    request = urllib.request.Request(url, data=data, headers=headers, method='POST')
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        return response.status, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Send a synthetic chunked upload like the ESP32 collector')
+    parser.add_argument('--url', default='http://localhost:8888/data',
+                        help='Data endpoint of a running server')
+    parser.add_argument('--samples', type=int, default=6000,
+                        help='Samples in the upload')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Samples per chunk')
+    parser.add_argument('--binary', action='store_true',
+                        help='Send binary chunks instead of text')
+    parser.add_argument('--delta', action='store_true',
+                        help='Send delta frames instead of text')
+    parser.add_argument('--gzip', action='store_true',
+                        help='gzip each chunk (Content-Encoding: gzip)')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='Seconds between chunks (the firmware waits 0.5 s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    args = parser.parse_args()
+
+    requests = chunked_upload(args.samples, args.chunk_size, args.binary, args.delta, args.gzip,
+                              seed=args.seed)
+    size = sum(len(body) for _, body in requests)
+    print(f"Sending {args.samples} samples in {len(requests)} chunks ({size / 1024:.1f} KB)")
+    for headers, body in requests:
+        status, elapsed = post(args.url, headers, body)
+        print(f"  chunk {int(headers['X-Chunk-Index']) + 1}/{len(requests)}: "
+              f"HTTP {status} in {elapsed * 1000:.1f} ms")
+        time.sleep(args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import io
+import os
+import glob
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import sosfilt, sosfilt_zi, tf2sos
+from filters import bandpass_sos
+
+# Firmware parameters (realtime-tracking/ehtracking/config.h)
+SAMPLING_RATE = 40   # Hz
+WINDOW_SIZE = 100    # Samples per inference window
+
+# Bandpass coefficients hard-coded in vital_signs_algo.h (bandpass_filter).
+# They are rounded from butter(2, [0.5, 4], fs=40) and the rounding leaves a
+# pole outside the unit circle, so the firmware output grows over a window.
+# They are kept as is to reproduce the on-device numbers.
+FIRMWARE_B = np.array([0.0675, 0.0, -0.135, 0.0, 0.0675])
+FIRMWARE_A = np.array([1.0, -3.06, 3.44, -1.79, 0.393])
+FIRMWARE_SOS = tf2sos(FIRMWARE_B, FIRMWARE_A)
+
+# Filter modes of compute_vitals:
+#   designed: stable Butterworth bandpass, peak-interval heart rate
+#   firmware: the values the device reports (calculateVitalSigns heart rate,
+#             calc_spo2_filtered SpO2 with the firmware coefficients)
+FILTER_MODES = ('designed', 'firmware')
+
+PEAK_THRESHOLD = 0.2      # Normalized amplitude a peak must exceed
+PEAK_MIN_DISTANCE = 0.3   # Seconds between accepted peaks
+MAX_PEAKS = 32            # Size of the firmware peak buffer
+
+# calculateVitalSigns (vital_signs.h)
+FIRMWARE_HR_SAMPLES = 64   # Only the first 64 samples of a window are used
+FIRMWARE_HR_RANGE = (40.0, 180.0)
+
+# Heart rate and SpO2 the firmware reported for the bundled recordings,
+# recorded with firmware_vitals.cpp
+FIRMWARE_REFERENCE = os.path.join('data', 'firmware_vitals.csv')
+
+
+def design_sos(fs, lowcut=0.5, highcut=4.0, order=2):
+    """Properly designed (stable) bandpass in second-order sections"""
+    return bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
+
+
+def make_windows(values, window_size=WINDOW_SIZE, step=WINDOW_SIZE):
+    """
+    Split a 1-D signal into windows without copying.
+
+    Returns:
+        2-D array (n_windows, window_size), a strided view of values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window_size:
+        return np.empty((0, window_size))
+    return sliding_window_view(values, window_size)[::step]
+
+
+def bandpass_windows(windows, sos, steady_state=True):
+    """
+    Filter every window independently.
+
+    With steady_state the filter starts in steady state for the first sample
+    of each window, which removes the start-up transient caused by the large
+    DC level; otherwise it starts from a zero state like the device does.
+    """
+    if not steady_state or len(windows) == 0:
+        return sosfilt(sos, windows, axis=-1)
+    zi = sosfilt_zi(sos)[:, None, :] * windows[None, :, :1]
+    filtered, _ = sosfilt(sos, windows, axis=-1, zi=zi)
+    return filtered
+
+
+def heart_rate_windows(ir_windows, fs=SAMPLING_RATE, sos=None, steady_state=True):
+    """
+    Heart rate (BPM) per window with the peak-interval method of
+    calc_heart_rate_peak_interval.
+
+    Args:
+        ir_windows: 2-D array (n_windows, window_size) of raw IR values
+        fs: Sampling frequency (Hz)
+        sos: Bandpass filter in second-order sections (default: design_sos(fs))
+        steady_state: Start the filter in steady state (see bandpass_windows)
+
+    Returns:
+        1-D array of heart rates, 0 where fewer than two peaks were found
+    """
+    if sos is None:
+        sos = design_sos(fs)
+    filtered = bandpass_windows(ir_windows, sos, steady_state)
+
+    # Z-normalize each window (population std, as in the firmware)
+    mean = filtered.mean(axis=1, keepdims=True)
+    std = filtered.std(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        filtered = (filtered - mean) / std
+
+    # Local maxima above the threshold, all windows at once
+    center = filtered[:, 1:-1]
+    candidates = ((center > PEAK_THRESHOLD) &
+                  (center > filtered[:, :-2]) &
+                  (center > filtered[:, 2:]))
+
+    # Greedy minimum-distance selection depends on the previously accepted
+    # peak, so walk the candidate columns once, vectorized over windows
+    n_windows = len(filtered)
+    min_dist = int(fs * PEAK_MIN_DISTANCE)
+    n_peaks = np.zeros(n_windows, dtype=np.int64)
+    first_peak = np.zeros(n_windows, dtype=np.int64)
+    last_peak = np.zeros(n_windows, dtype=np.int64)
+
+    for col in np.flatnonzero(candidates.any(axis=0)):
+        i = col + 1
+        accept = (candidates[:, col] &
+                  ((n_peaks == 0) | (i - last_peak > min_dist)) &
+                  (n_peaks < MAX_PEAKS))
+        first_peak = np.where(accept & (n_peaks == 0), i, first_peak)
+        last_peak = np.where(accept, i, last_peak)
+        n_peaks += accept
+
+    # Average interval = (last - first) / (n - 1) samples
+    heart_rate = np.zeros(n_windows)
+    valid = n_peaks >= 2
+    avg_interval = (last_peak[valid] - first_peak[valid]) / \
+        (n_peaks[valid] - 1) / fs
+    heart_rate[valid] = 60.0 / avg_interval
+    return heart_rate
+
+
+def firmware_heart_rate_windows(ir_windows, fs=SAMPLING_RATE):
+    """
+    Heart rate (BPM) per window as the device reports it (calculateVitalSigns).
+
+    The FFT search range of calculateVitalSigns is empty on the device
+    (SAMPLING_RATE / actualSize is an integer division giving 0), so it
+    always falls back to counting peaks of the smoothed first 64 samples.
+    The result is a multiple of 37.5 BPM clamped to 40-180, not a usable
+    heart rate; it is reproduced to compare with what devices sent.
+    """
+    n_windows, window_size = ir_windows.shape
+    size = min(window_size, FIRMWARE_HR_SAMPLES)
+    if size < 10:
+        return np.zeros(n_windows)
+
+    # 5-point moving average, shorter at the edges
+    values = ir_windows[:, :size]
+    sums = sliding_window_view(np.pad(values, ((0, 0), (2, 2))), 5, axis=1).sum(axis=2)
+    counts = np.convolve(np.ones(size), np.ones(5), mode='same')
+    smoothed = sums / counts
+    smoothed -= smoothed.mean(axis=1, keepdims=True)
+    threshold = (smoothed.max(axis=1) - smoothed.min(axis=1)) * 0.2
+
+    # A local maximum counts when it is the first or rises more than the
+    # threshold above the last counted one; walk the columns in order
+    peak_count = np.zeros(n_windows, dtype=np.int64)
+    last_peak = np.zeros(n_windows)
+    for i in range(3, size - 3):
+        value = smoothed[:, i]
+        accept = ((value > smoothed[:, i - 1]) & (value > smoothed[:, i + 1]) &
+                  ((last_peak == 0) | (value - last_peak > threshold)))
+        peak_count += accept
+        last_peak = np.where(accept, value, last_peak)
+
+    heart_rate = peak_count * 60.0 / (size / fs)
+    return np.clip(heart_rate, *FIRMWARE_HR_RANGE)
+
+
+def spo2_windows(ir_windows, red_windows, fs=SAMPLING_RATE, mode='designed'):
+    """
+    SpO2 (%) per window with the filtered AC/DC ratio of calc_spo2_filtered.
+
+    In firmware mode, as on the device, the firmware filter starts from a
+    zero state, DC is the mean of the raw window and AC the RMS of the
+    filtered window around that DC value. In designed mode AC is the RMS of
+    the (stable) filtered window around its own mean.
+    """
+    firmware = mode == 'firmware'
+    sos = FIRMWARE_SOS if firmware else design_sos(fs)
+    ir_f = bandpass_windows(ir_windows, sos, steady_state=not firmware)
+    red_f = bandpass_windows(red_windows, sos, steady_state=not firmware)
+
+    ir_dc = ir_windows.mean(axis=1)
+    red_dc = red_windows.mean(axis=1)
+    if firmware:
+        ir_ac = np.sqrt(np.mean((ir_f - ir_dc[:, None]) ** 2, axis=1))
+        red_ac = np.sqrt(np.mean((red_f - red_dc[:, None]) ** 2, axis=1))
+    else:
+        ir_ac = ir_f.std(axis=1)
+        red_ac = red_f.std(axis=1)
+
+    spo2 = np.zeros(len(ir_windows))
+    valid = (ir_dc != 0) & (red_dc != 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = (red_ac[valid] / red_dc[valid]) / (ir_ac[valid] / ir_dc[valid])
+    spo2[valid] = np.clip(104.0 - 17.0 * ratio, 0, 100)
+    return spo2
+
+
+def compute_vitals(df, fs=SAMPLING_RATE, window_size=WINDOW_SIZE, step=WINDOW_SIZE,
+                   mode='designed'):
+    """
+    Compute heart rate and SpO2 over sliding windows of a recording.
+
+    Args:
+        df: DataFrame with 'ir', 'red' and 'time_delta' columns
+        fs: Sampling frequency (Hz)
+        window_size: Samples per window (firmware: WINDOW_SIZE)
+        step: Samples between window starts (firmware: non-overlapping)
+        mode: 'designed' for heart rates from a stable Butterworth bandpass,
+              'firmware' for the values the device reports (see FILTER_MODES)
+
+    Returns:
+        DataFrame with one row per window
+    """
+    if mode not in FILTER_MODES:
+        raise ValueError(f"Unknown filter mode {mode!r}, expected one of {FILTER_MODES}")
+    ir_windows = make_windows(df['ir'].values, window_size, step)
+    red_windows = make_windows(df['red'].values, window_size, step)
+
+    starts = np.arange(len(ir_windows)) * step
+    return pd.DataFrame({
+        'start_index': starts,
+        'start_time': df['time_delta'].values[starts] if len(starts) else [],
+        'heart_rate': (firmware_heart_rate_windows(ir_windows, fs) if mode == 'firmware'
+                       else heart_rate_windows(ir_windows, fs)),
+        'spo2': spo2_windows(ir_windows, red_windows, fs, mode),
+    })
+
+
+def recompute_directory(csv_dir, **kwargs):
+    """Compute vitals for every CSV recording in a directory"""
+    results = {}
+    for file_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        df = pd.read_csv(file_path)
+        results[os.path.basename(file_path)] = compute_vitals(df, **kwargs)
+    return results
+
+
+def load_firmware_reference(path=FIRMWARE_REFERENCE):
+    """Recorded firmware values per recording: {filename: DataFrame}"""
+    reference = pd.read_csv(path)
+    return {name: rows.drop(columns='file').reset_index(drop=True)
+            for name, rows in reference.groupby('file')}
+
+
+def record_firmware_reference(binary, csv_dir=os.path.join('data', 'csv'),
+                              path=FIRMWARE_REFERENCE):
+    """Run the firmware_vitals.cpp build on every recording and save its output"""
+    tables = []
+    for file_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        with open(file_path, 'rb') as f:
+            output = subprocess.run([binary], stdin=f, stdout=subprocess.PIPE,
+                                    check=True).stdout.decode('utf-8')
+        table = pd.read_csv(io.StringIO(output))
+        table.insert(0, 'file', os.path.basename(file_path))
+        tables.append(table)
+    pd.concat(tables).to_csv(path, index=False)
+    return path
+
+
+def check_conformance(df, reference, fs=SAMPLING_RATE, window_size=WINDOW_SIZE,
+                      hr_tolerance=0.01, spo2_tolerance=0.005):
+    """
+    Compare firmware mode with the values the firmware reported.
+
+    Args:
+        df: Recording
+        reference: Firmware values for the recording (start_index,
+                   heart_rate, spo2), see load_firmware_reference
+        hr_tolerance: Allowed heart rate difference (BPM)
+        spo2_tolerance: Allowed SpO2 difference (%); the device computes
+                        in float32
+
+    Returns:
+        DataFrame of the mismatching windows (engine and firmware values)
+    """
+    vitals = compute_vitals(df, fs, window_size, window_size, mode='firmware')
+    merged = vitals.merge(reference, on='start_index', how='outer',
+                          suffixes=('', '_firmware'))
+    mismatch = ~(np.isclose(merged['heart_rate'], merged['heart_rate_firmware'],
+                            rtol=0, atol=hr_tolerance) &
+                 np.isclose(merged['spo2'], merged['spo2_firmware'],
+                            rtol=0, atol=spo2_tolerance))
+    return merged[mismatch].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Recompute heart rate and SpO2 from stored recordings')
+    parser.add_argument('file', nargs='?', help='CSV file to process')
+    parser.add_argument('--all', action='store_true',
+                        help='Process all CSV files in data/csv')
+    parser.add_argument('--fs', type=float, default=SAMPLING_RATE,
+                        help='Sampling frequency (Hz)')
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE,
+                        help='Window size in samples')
+    parser.add_argument('--step', type=int, default=WINDOW_SIZE,
+                        help='Step between windows in samples')
+    parser.add_argument('--filter', choices=FILTER_MODES, default='designed',
+                        help='designed: heart rates from a stable bandpass (default); '
+                             'firmware: the values the device reports')
+    parser.add_argument('--check', action='store_true',
+                        help=f'Compare firmware mode with the recorded firmware values '
+                             f'in {FIRMWARE_REFERENCE}')
+    parser.add_argument('--record-firmware', metavar='BINARY',
+                        help='Record the firmware values with a firmware_vitals.cpp build')
+
+    args = parser.parse_args()
+
+    if args.record_firmware:
+        print(f"Recorded firmware values in {record_firmware_reference(args.record_firmware)}")
+        return
+
+    if args.all:
+        files = sorted(glob.glob(os.path.join('data', 'csv', '*.csv')))
+    elif args.file:
+        files = [args.file]
+    else:
+        parser.print_help()
+        return
+
+    reference = load_firmware_reference() if args.check else None
+    for file_path in files:
+        df = pd.read_csv(file_path)
+        name = os.path.basename(file_path)
+
+        if args.check:
+            if name not in reference:
+                print(f"{name}: no recorded firmware values")
+                continue
+            mismatches = check_conformance(df, reference[name], args.fs, args.window)
+            for row in mismatches.itertuples():
+                print(f"  window at {row.start_index}: HR {row.heart_rate:.2f} vs "
+                      f"{row.heart_rate_firmware:.2f}, SpO2 {row.spo2:.2f} vs {row.spo2_firmware:.2f}")
+            status = "OK" if mismatches.empty else f"{len(mismatches)} mismatching windows"
+            print(f"{name}: conformance {status} ({len(reference[name])} firmware windows)")
+            continue
+
+        vitals = compute_vitals(df, args.fs, args.window, args.step, mode=args.filter)
+        valid = vitals[vitals['heart_rate'] > 0]
+        heart_rate = f"{valid['heart_rate'].mean():.1f} bpm" if len(valid) else "n/a"
+        print(f"{name}: {len(vitals)} windows, "
+              f"HR {heart_rate} (valid {len(valid)}), "
+              f"SpO2 {vitals['spo2'].mean():.1f}%")
+
+
+if __name__ == "__main__":
+    main()
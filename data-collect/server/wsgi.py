@@ -17,8 +17,9 @@ if current_dir not in sys.path:
 # Import the Flask application from server.py
 
 # This allows the application to be run with a WSGI server
-# Example usage with Gunicorn:
-# gunicorn -w 4 -b 0.0.0.0:8888 wsgi:application
+# Example usage with Gunicorn (several workers share state through
+# STATE_DB and a separate device listener, see gunicorn.conf.py):
+# gunicorn -c gunicorn.conf.py wsgi:application
 
 if __name__ == "__main__":
     # When run directly, this will start the Flask development server
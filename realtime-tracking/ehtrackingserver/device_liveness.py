@@ -0,0 +1,97 @@
+import heapq
+import threading
+import time
+
+
+class LivenessTracker:
+    """
+    Per-device liveness deadlines kept in a min-heap.
+
+    Every event from a device pushes a new deadline; superseded heap entries
+    are skipped lazily when they reach the top. The monitor thread sleeps
+    until the earliest deadline instead of sweeping all devices on a fixed
+    period, so its cost does not grow with the number of connected devices.
+
+    Keys are the devices' (host, port) socket addresses; touch_host()
+    refreshes every device connected from one IP address.
+    """
+
+    def __init__(self, default_timeout=15.0, class_timeouts=None):
+        self.default_timeout = default_timeout
+        self.class_timeouts = dict(class_timeouts or {})
+        self._deadlines = {}   # device key -> current deadline
+        self._classes = {}     # device key -> device class
+        self._hosts = {}       # host -> device keys connected from it
+        self._heap = []        # (deadline, device key)
+        self._cond = threading.Condition()
+
+    def timeout_for(self, device_class):
+        """Return the timeout (seconds) configured for a device class"""
+        return self.class_timeouts.get(device_class, self.default_timeout)
+
+    def touch(self, key, device_class=None):
+        """Refresh a device's deadline (registers the device if it is new)"""
+        with self._cond:
+            if device_class is not None:
+                self._classes[key] = device_class
+            timeout = self.timeout_for(self._classes.get(key))
+            deadline = time.monotonic() + timeout
+
+            previous = self._deadlines.get(key)
+            self._deadlines[key] = deadline
+            self._hosts.setdefault(key[0], set()).add(key)
+            heapq.heappush(self._heap, (deadline, key))
+
+            # Wake the monitor when this deadline may be earlier than the one
+            # it sleeps on: a new device, or a shorter class timeout (HELLO)
+            # that moves the device's deadline forward. A later deadline
+            # never requires it
+            if previous is None or deadline < previous:
+                self._cond.notify()
+
+    def touch_host(self, host):
+        """Refresh the deadlines of all tracked devices connected from `host`"""
+        with self._cond:
+            keys = list(self._hosts.get(host, ()))
+        for key in keys:
+            with self._cond:
+                # Skip devices removed or expired in the meantime
+                if key in self._deadlines:
+                    self.touch(key)
+
+    def remove(self, key):
+        """Stop tracking a device (its stale heap entries are dropped lazily)"""
+        with self._cond:
+            self._forget(key)
+
+    def _forget(self, key):
+        self._deadlines.pop(key, None)
+        self._classes.pop(key, None)
+        keys = self._hosts.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._hosts[key[0]]
+
+    def is_tracked(self, key):
+        with self._cond:
+            return key in self._deadlines
+
+    def wait_expired(self):
+        """Block until at least one device misses its deadline, return their keys"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                expired = []
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, key = heapq.heappop(self._heap)
+                    # Skip entries superseded by a later touch() or remove()
+                    if self._deadlines.get(key) == deadline:
+                        self._forget(key)
+                        expired.append(key)
+                if expired:
+                    return expired
+
+                # Sleep until the earliest deadline or until a device is added
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
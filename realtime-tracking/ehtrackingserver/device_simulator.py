@@ -0,0 +1,471 @@
+"""
+Fleet of simulated tracking devices for load-testing server.py.
+
+Every virtual device behaves like the firmware (wifi_setup.h,
+status_watchdog.h): it connects to the TCP port, sends HELLO and waits for
+WELCOME, sends a STATUS_INFO line every few seconds and on every state
+change, answers START/STOP/STATUS/STATES, and POSTs vitals to /data while
+it is collecting.
+
+The fleet is ramped through increasing device counts. At every step a
+set of pollers hits GET /status like the dashboard does, and a command
+client cycles /start, /check-status, /stop, /list-states, which go
+through the server's TCP command round trip. Latency percentiles are
+reported per endpoint, together with the device count at which /status
+and /start break down:
+
+    python device_simulator.py --devices 1 5 10 25 50 --step-seconds 20
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+HTTP_PORT = 8888
+TCP_PORT = 8889
+STATUS_INTERVAL = 5.0   # Seconds between periodic STATUS_INFO lines (firmware: 5 s)
+DATA_RATE = 1.0         # /data posts per second per collecting device
+WELCOME_TIMEOUT = 3.0   # Seconds to wait for WELCOME, like the firmware
+HTTP_TIMEOUT = 15.0
+
+DEVICE_STEPS = [1, 5, 10, 25, 50]
+STEP_SECONDS = 20.0
+POLLERS = 2             # Concurrent dashboards polling /status
+POLL_INTERVAL = 0.5     # Seconds between /status polls of one poller
+STATUS_LIMIT_MS = 500.0
+START_LIMIT_MS = 3000.0
+MAX_ERROR_RATE = 0.05
+
+# State values as listed by the firmware's STATES command
+STATES = {'INIT': 0, 'IDLE': 1, 'COLLECTING': 2, 'PROCESSING': 3, 'ERROR': 4}
+
+
+async def http_request(host, port, method, path, body=None, timeout=HTTP_TIMEOUT):
+    """
+    Minimal HTTP/1.1 request over asyncio streams (one connection per request).
+
+    Returns:
+        Tuple (status code, decoded JSON body or None)
+    """
+    payload = b'' if body is None else json.dumps(body).encode('utf-8')
+    request = (f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+               f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+               f"Connection: close\r\n\r\n").encode('ascii') + payload
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = response.partition(b'\r\n\r\n')
+        status = int(head.split(b' ', 2)[1])
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+def percentiles(values):
+    """p50/p95/p99/max in milliseconds of a list of seconds"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ms = np.asarray(values) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'count': len(ms), 'p50': float(p50), 'p95': float(p95),
+            'p99': float(p99), 'max': float(ms.max())}
+
+
+class SimulatedDevice:
+    """One virtual tracking device speaking the firmware's TCP and HTTP protocol"""
+
+    def __init__(self, index, host, tcp_port=TCP_PORT, http_port=HTTP_PORT,
+                 status_interval=STATUS_INTERVAL, data_rate=DATA_RATE,
+                 collecting=False, device_class=None):
+        self.device_id = f"sim_{index:04d}"
+        self.host = host
+        self.tcp_port = tcp_port
+        self.http_port = http_port
+        self.status_interval = status_interval
+        self.data_rate = data_rate
+        self.device_class = device_class
+        self.state = 'COLLECTING' if collecting else 'IDLE'
+        self.started = time.monotonic()
+        self.rng = random.Random(index)
+
+        self.connected = False
+        self.commands = {}        # command -> times received
+        self.posts = 0
+        self.post_errors = 0
+        self.ack_latencies = []   # STATUS_INFO -> "OK: Status received"
+        self.lost_acks = 0        # STATUS_INFO lines never acknowledged
+        self._ack_pending = None
+        self._writer = None
+        self._status_now = asyncio.Event()
+        self._tasks = []
+
+    @property
+    def collecting(self):
+        return self.state in ('COLLECTING', 'PROCESSING')
+
+    def _uptime_ms(self):
+        return int((time.monotonic() - self.started) * 1000)
+
+    async def _send(self, line):
+        self._writer.write(f"{line}\n".encode('utf-8'))
+        await self._writer.drain()
+
+    def _change_state(self, state):
+        if state != self.state:
+            self.state = state
+            # The firmware sends a status update on every transition
+            self._status_now.set()
+
+    def _response(self, command):
+        """Reply to a server command like handleTCPCommand()"""
+        if command == 'START':
+            if self.collecting:
+                return f"OK: Already collecting, State: {self.state}"
+            self._change_state('COLLECTING')
+            return f"OK: Data collection started, State: {self.state}"
+        if command == 'STOP':
+            if not self.collecting:
+                return f"OK: Already stopped, State: {self.state}"
+            self._change_state('IDLE')
+            return f"OK: Data collection stopped, State: {self.state}"
+        if command == 'STATUS':
+            return (f"OK: {'COLLECTING' if self.collecting else 'IDLE'}, "
+                    f"Processing: {'YES' if self.state == 'PROCESSING' else 'NO'}, "
+                    f"Current State: {self.state}, State Value: {STATES[self.state]}, "
+                    f"LED Configured: Active HIGH")
+        if command == 'STATES':
+            return "OK: Available states: " + ", ".join(f"{name}={value}" for name, value in STATES.items())
+        if command == 'LED_TEST':
+            return "OK: LED test complete"
+        if command == 'WELCOME':
+            return "OK: Hello from device"
+        return "ERROR: Unknown command"
+
+    async def connect(self):
+        """Open the TCP session and do the HELLO/WELCOME handshake"""
+        reader, self._writer = await asyncio.open_connection(self.host, self.tcp_port)
+        await self._send(f"HELLO {self.device_class}" if self.device_class else "HELLO")
+        try:
+            # Like the firmware, carry on without WELCOME after the timeout
+            line = await asyncio.wait_for(reader.readline(), WELCOME_TIMEOUT)
+            if line.decode('utf-8').strip() != 'WELCOME':
+                self._handle_line(line)
+        except asyncio.TimeoutError:
+            pass
+        self.connected = True
+        self._status_now.set()
+        self._tasks = [asyncio.create_task(self._read_commands(reader)),
+                       asyncio.create_task(self._status_loop()),
+                       asyncio.create_task(self._data_loop())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._writer is not None:
+            self._writer.close()
+        self.connected = False
+
+    def _handle_line(self, line):
+        """Handle one line from the server; returns the reply to send, if any"""
+        message = line.decode('utf-8', errors='replace').strip()
+        if not message:
+            return None
+        if message.startswith('OK:') or message.startswith('ERROR:'):
+            if message.startswith('OK: Status received') and self._ack_pending is not None:
+                self.ack_latencies.append(time.perf_counter() - self._ack_pending)
+                self._ack_pending = None
+            return None
+        self.commands[message] = self.commands.get(message, 0) + 1
+        return self._response(message)
+
+    async def _read_commands(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = self._handle_line(line)
+                if reply is not None:
+                    await self._send(reply)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        self.connected = False
+
+    async def _status_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._status_now.wait(), self.status_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._status_now.clear()
+            # An ack can be read by the server's command path instead of
+            # being sent back; only the newest STATUS_INFO is timed
+            if self._ack_pending is not None:
+                self.lost_acks += 1
+            self._ack_pending = time.perf_counter()
+            await self._send(f"STATUS_INFO: Current State: {self.state}, "
+                             f"Collecting: {'TRUE' if self.collecting else 'FALSE'}, "
+                             f"Processing: {'TRUE' if self.state == 'PROCESSING' else 'FALSE'}, "
+                             f"Uptime: {self._uptime_ms() // 1000}s")
+
+    def _reading(self):
+        """Vitals payload in the format of sendHTTPData()"""
+        return {
+            'deviceId': self.device_id,
+            'heartRate': round(self.rng.gauss(80, 8), 1),
+            'oxygenLevel': round(min(100.0, self.rng.gauss(97, 1)), 1),
+            'actionClass': self.rng.randrange(3),
+            'confidence': round(self.rng.uniform(0.6, 1.0), 2),
+            'timestamp': self._uptime_ms(),
+            'deviceState': self.state,
+            'isCollecting': self.collecting,
+            'isProcessing': self.state == 'PROCESSING',
+        }
+
+    async def _data_loop(self):
+        if self.data_rate <= 0:
+            return
+        interval = 1.0 / self.data_rate
+        # Spread the devices' posts over the interval
+        await asyncio.sleep(self.rng.uniform(0, interval))
+        while True:
+            if self.collecting:
+                try:
+                    status, _ = await http_request(self.host, self.http_port, 'POST', '/data',
+                                                   self._reading())
+                    self.posts += 1
+                    if status != 200:
+                        self.post_errors += 1
+                except (OSError, asyncio.TimeoutError):
+                    self.post_errors += 1
+            await asyncio.sleep(interval)
+
+
+class Fleet:
+    """Growing set of simulated devices"""
+
+    def __init__(self, host, **device_options):
+        self.host = host
+        self.device_options = device_options
+        self.devices = []
+
+    async def grow(self, count):
+        """Connect new devices until there are `count` of them; returns failed connects"""
+        new = [SimulatedDevice(index, self.host, **self.device_options)
+               for index in range(len(self.devices), count)]
+        results = await asyncio.gather(*(device.connect() for device in new),
+                                       return_exceptions=True)
+        failed = 0
+        for device, result in zip(new, results):
+            if isinstance(result, Exception):
+                failed += 1
+            else:
+                self.devices.append(device)
+        return failed
+
+    async def close(self):
+        await asyncio.gather(*(device.close() for device in self.devices))
+        self.devices = []
+
+    def connected(self):
+        return sum(device.connected for device in self.devices)
+
+    def collect_device_stats(self):
+        """Drain the per-device counters into fleet totals"""
+        acks, lost, posts, post_errors = [], 0, 0, 0
+        for device in self.devices:
+            acks.extend(device.ack_latencies)
+            lost += device.lost_acks
+            posts += device.posts
+            post_errors += device.post_errors
+            device.ack_latencies, device.lost_acks, device.posts, device.post_errors = [], 0, 0, 0
+        return acks, lost, posts, post_errors
+
+
+class EndpointStats:
+    """Latencies and failures of one endpoint during a step"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def add(self, elapsed, ok):
+        self.latencies.append(elapsed)
+        if not ok:
+            self.errors += 1
+
+    def summary(self):
+        result = percentiles(self.latencies)
+        result['errors'] = self.errors
+        result['error_rate'] = self.errors / len(self.latencies) if self.latencies else 0.0
+        return result
+
+
+async def _timed(host, port, method, path):
+    """Call an endpoint; returns (seconds, ok) where ok means HTTP 200 and no error status"""
+    start = time.perf_counter()
+    try:
+        status, body = await http_request(host, port, method, path)
+        ok = status == 200 and not (isinstance(body, dict) and body.get('status') == 'error')
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+async def poll_status(host, port, stats, deadline, interval=POLL_INTERVAL):
+    while time.monotonic() < deadline:
+        elapsed, ok = await _timed(host, port, 'GET', '/status')
+        stats['/status'].add(elapsed, ok)
+        await asyncio.sleep(max(0.0, interval - elapsed))
+
+
+async def cycle_commands(host, port, stats, deadline):
+    """Alternate START and STOP, checking the device status in between"""
+    for path in _command_cycle():
+        if time.monotonic() >= deadline:
+            break
+        elapsed, ok = await _timed(host, port, 'POST', path)
+        stats[path].add(elapsed, ok)
+
+
+def _command_cycle():
+    while True:
+        yield from ('/start', '/check-status', '/stop', '/list-states')
+
+
+async def run_step(fleet, count, args):
+    failed = await fleet.grow(count)
+    # Let every device finish its first STATUS_INFO exchange
+    await asyncio.sleep(1.0)
+    fleet.collect_device_stats()
+
+    stats = {path: EndpointStats() for path in ('/status', '/start', '/check-status', '/stop', '/list-states')}
+    deadline = time.monotonic() + args.step_seconds
+    tasks = [poll_status(args.host, args.http_port, stats, deadline, args.poll_interval)
+             for _ in range(args.pollers)]
+    tasks.append(cycle_commands(args.host, args.http_port, stats, deadline))
+    await asyncio.gather(*tasks)
+
+    acks, lost_acks, posts, post_errors = fleet.collect_device_stats()
+    return {
+        'devices': count,
+        'connected': fleet.connected(),
+        'connect_failures': failed,
+        'endpoints': {path: endpoint.summary() for path, endpoint in stats.items()},
+        'status_ack': dict(percentiles(acks), errors=lost_acks),
+        'data_posts': posts,
+        'data_post_errors': post_errors,
+    }
+
+
+def broke_down(summary, limit_ms, max_error_rate=MAX_ERROR_RATE):
+    """An endpoint has broken down when its p95 or its error rate is over the limit"""
+    if summary['count'] == 0:
+        return True
+    return summary['p95'] > limit_ms or summary['error_rate'] > max_error_rate
+
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def print_step(step):
+    print(f"\n{step['devices']} devices ({step['connected']} connected, "
+          f"{step['connect_failures']} failed to connect), "
+          f"{step['data_posts']} /data posts ({step['data_post_errors']} failed)")
+    print(f"  {'endpoint':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'errors':>7}")
+    rows = list(step['endpoints'].items()) + [('STATUS_INFO ack', step['status_ack'])]
+    for name, s in rows:
+        print(f"  {name:<14} {s['count']:>6} {_fmt(s['p50']):>9} {_fmt(s['p95']):>9} "
+              f"{_fmt(s['p99']):>9} {_fmt(s['max']):>9} {s.get('errors', 0):>7}")
+
+
+async def run(args):
+    fleet = Fleet(args.host, tcp_port=args.tcp_port, http_port=args.http_port,
+                  status_interval=args.status_interval, data_rate=args.data_rate,
+                  collecting=args.collecting, device_class=args.device_class)
+    limits = {'/status': args.status_limit_ms, '/start': args.start_limit_ms}
+    breakdown = {path: None for path in limits}
+    steps = []
+    try:
+        for count in sorted(set(args.devices)):
+            step = await run_step(fleet, count, args)
+            steps.append(step)
+            print_step(step)
+            for path, limit in limits.items():
+                if breakdown[path] is None and broke_down(step['endpoints'][path], limit,
+                                                          args.max_error_rate):
+                    breakdown[path] = count
+                    print(f"  -> {path} broke down at {count} devices")
+            if all(value is not None for value in breakdown.values()):
+                break
+    finally:
+        await fleet.close()
+
+    print()
+    for path, count in breakdown.items():
+        if count is None:
+            print(f"{path}: no breakdown up to {steps[-1]['devices'] if steps else 0} devices "
+                  f"(p95 limit {limits[path]:.0f} ms)")
+        else:
+            print(f"{path}: broke down at {count} devices (p95 limit {limits[path]:.0f} ms, "
+                  f"error rate limit {args.max_error_rate:.0%})")
+    return {'steps': steps, 'breakdown': breakdown}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load-test the tracking server with a fleet of simulated devices')
+    parser.add_argument('--host', default='127.0.0.1', help='Server address')
+    parser.add_argument('--http-port', type=int, default=HTTP_PORT, help='Server HTTP port')
+    parser.add_argument('--tcp-port', type=int, default=TCP_PORT, help='Server TCP port')
+    parser.add_argument('--devices', type=int, nargs='+', default=DEVICE_STEPS,
+                        help='Device counts to ramp through')
+    parser.add_argument('--step-seconds', type=float, default=STEP_SECONDS,
+                        help='Measurement time at every device count')
+    parser.add_argument('--status-interval', type=float, default=STATUS_INTERVAL,
+                        help='Seconds between periodic STATUS_INFO lines of a device')
+    parser.add_argument('--data-rate', type=float, default=DATA_RATE,
+                        help='/data posts per second of every collecting device (0 disables)')
+    parser.add_argument('--collecting', action='store_true',
+                        help='Start the devices in COLLECTING state, so they post data from the start')
+    parser.add_argument('--device-class', help='Class announced in HELLO (e.g. esp32)')
+    parser.add_argument('--pollers', type=int, default=POLLERS,
+                        help='Concurrent clients polling /status')
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                        help='Seconds between /status polls of one client')
+    parser.add_argument('--status-limit-ms', type=float, default=STATUS_LIMIT_MS,
+                        help='p95 latency at which /status counts as broken down')
+    parser.add_argument('--start-limit-ms', type=float, default=START_LIMIT_MS,
+                        help='p95 latency at which /start counts as broken down')
+    parser.add_argument('--max-error-rate', type=float, default=MAX_ERROR_RATE,
+                        help='Error rate at which an endpoint counts as broken down')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+
+    args = parser.parse_args()
+    if any(count < 1 for count in args.devices):
+        parser.error('--devices must be positive')
+
+    results = asyncio.run(run(args))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
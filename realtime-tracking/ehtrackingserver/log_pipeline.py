@@ -0,0 +1,120 @@
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line (extra fields included)"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeviceSamplingFilter(logging.Filter):
+    """
+    Rate-limit repetitive records per device.
+
+    Records logged with `extra={'device': ..., 'sample': <kind>}` are let
+    through at most `rate` times per `interval` seconds for each
+    (device, kind) pair. The next record that passes carries the number of
+    records suppressed in between as `suppressed`. Records without a
+    `sample` attribute and records at WARNING or above are never dropped.
+    """
+
+    def __init__(self, rate=1, interval=10.0):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self._windows = {}  # (device, kind) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        kind = getattr(record, 'sample', None)
+        if kind is None or record.levelno >= logging.WARNING:
+            return True
+
+        key = (getattr(record, 'device', None), kind)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.rate:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Enqueue records without formatting them.
+
+    The stock QueueHandler formats the message in the calling thread;
+    here the record is passed through as is and all formatting happens in
+    the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(log_file="server.log", level=logging.INFO,
+                  max_bytes=10 * 1024 * 1024, backup_count=5,
+                  sample_rate=1, sample_interval=10.0):
+    """
+    Route logging through a queue to a background listener.
+
+    The file gets JSON lines with size-based rotation, stderr keeps the
+    plain text format. Returns the started QueueListener.
+    """
+    log_queue = queue.SimpleQueue()
+
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    listener = QueueListener(log_queue, file_handler, stream_handler,
+                             respect_handler_level=True)
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(DeviceSamplingFilter(sample_rate, sample_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener.start()
+    return listener
@@ -4,31 +4,87 @@ import threading
 import time
 import json
 import logging
+import atexit
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request
-
-# Configure logging
-logging.basicConfig(
+from flask import Flask, render_template, jsonify, request, Response
+from vitals_history import VitalsHistory
+from vitals_log import VitalsLog
+from device_liveness import LivenessTracker
+from log_pipeline import setup_logging
+from metrics import Registry, TimedLock, FAST_BUCKETS, SAMPLE_RATE, CONTENT_TYPE
+from profiling import Profiler
+
+try:
+    import msgpack  # Optional, enables MessagePack frames on /data/batch
+except ImportError:
+    msgpack = None
+
+# Configure logging: records are queued and written by a background
+# listener (JSON lines in a rotating server.log, plain text on stderr)
+log_listener = setup_logging(
+    "server.log",
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("server.log"),
-        logging.StreamHandler()
-    ]
+    max_bytes=10 * 1024 * 1024,
+    backup_count=5,
+    sample_rate=1,        # Repetitive per-device messages let through...
+    sample_interval=10.0  # ...per this many seconds
 )
+atexit.register(log_listener.stop)
 logger = logging.getLogger("OxiSensor")
 
 # Configuration
 TCP_HOST = '0.0.0.0'  # Listen on all available interfaces
 TCP_PORT = 8889
 HTTP_PORT = 8888
+HISTORY_CAPACITY = 3600  # Readings kept per device in the vitals ring buffer
+HISTORY_MAX_POINTS = 500  # Default number of points returned by /history
+MAX_BATCH_READINGS = 1000  # Upper bound on readings accepted per /data/batch
+DEVICE_TIMEOUT = 15  # Seconds without data/status before a device is dropped
+# Per device class timeouts, the class is announced with "HELLO <class>"
+DEVICE_CLASS_TIMEOUTS = {
+    'esp32': 15,
+}
+VITALS_LOG_DIR = os.environ.get("VITALS_LOG_DIR", "vitals_log")
+VITALS_REPLAY_SECONDS = 24 * 3600  # Reload this much history on startup
+# Vitals log retention; older segments and segments beyond the size cap are deleted
+VITALS_LOG_RETENTION_DAYS = float(os.environ.get("VITALS_LOG_RETENTION_DAYS", 30))
+VITALS_LOG_MAX_BYTES = int(os.environ.get("VITALS_LOG_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Activity class index -> descriptive name
+ACTIVITY_NAMES = {
+    0: "Resting after exercise",
+    1: "Sitting",
+    2: "Walking"
+}
+
+# Runtime metrics served by /metrics
+metrics = Registry()
+TCP_MESSAGES = metrics.counter(
+    'ehtracking_tcp_messages_total', 'Messages received over TCP', ['device', 'type'])
+COMMAND_RTT_SECONDS = metrics.histogram(
+    'ehtracking_command_rtt_seconds', 'Time from sending a command to the device response',
+    ['command', 'result'])
+READINGS = metrics.counter(
+    'ehtracking_readings_total', 'Vitals readings received', ['endpoint'])
+BATCH_DECODE_SECONDS = metrics.histogram(
+    'ehtracking_batch_decode_seconds', 'Time to decode a /data/batch body', ['format'],
+    buckets=FAST_BUCKETS)
+APPLY_SECONDS = metrics.histogram(
+    'ehtracking_apply_seconds', 'Time to apply received readings to the server state',
+    buckets=FAST_BUCKETS, sample_rate=SAMPLE_RATE)
+LOCK_WAIT_SECONDS = metrics.histogram(
+    'ehtracking_lock_wait_seconds', 'Time spent waiting for the global state lock',
+    buckets=FAST_BUCKETS, sample_rate=SAMPLE_RATE)
+
+# TCP message types counted separately, anything else is "other"
+MESSAGE_TYPES = ('HELLO', 'STATUS_INFO', 'OK', 'ERROR')
 
 # Global variables
 connected_devices = {}
 is_collecting = False
 last_data_info = None
 tcp_server_socket = None
-lock = threading.Lock()
+lock = TimedLock(LOCK_WAIT_SECONDS)
 device_status = None
 command_status = {"command": None, "timestamp": None,
                   "completed": False, "error": None}
@@ -37,34 +93,81 @@ last_device_state_update = 0
 device_reported_state = "UNKNOWN"
 device_is_collecting = False
 command_in_progress = False
+# Deadlines of connected devices for the timeout monitor
+device_liveness = LivenessTracker(DEVICE_TIMEOUT, DEVICE_CLASS_TIMEOUTS)
+liveness_thread = None
+# Per-device time series of received vitals
+vitals_history = VitalsHistory(HISTORY_CAPACITY)
+# Durable on-disk copy of the same readings, written in the background
+vitals_log = VitalsLog(VITALS_LOG_DIR, max_age=VITALS_LOG_RETENTION_DAYS * 24 * 3600,
+                       max_bytes=VITALS_LOG_MAX_BYTES)
+
+metrics.gauge('ehtracking_connected_devices', 'Devices with an open TCP session',
+              lambda: len(connected_devices))
+metrics.gauge('ehtracking_command_in_progress', 'Whether a device command is awaiting confirmation',
+              lambda: int(command_in_progress))
+metrics.gauge('ehtracking_history_devices', 'Devices with vitals in the history buffer',
+              lambda: len(vitals_history.devices()))
 
 # Flask app
 app = Flask(__name__)
 
+# Opt-in request profiling (PROFILE_TOKEN, PROFILE_SLOWEST, see profiling.py)
+profiler = Profiler(app)
+
+def start_vitals_log():
+    # Restore recent history from disk, then start the background writer
+    restored = 0
+    # Batched readings are logged out of timestamp order; the history is chronological
+    records = sorted(vitals_log.query(start=time.time() - VITALS_REPLAY_SECONDS),
+                     key=lambda record: record['timestamp'])
+    for record in records:
+        vitals_history.record(record['device'], record['timestamp'],
+                              record['heartRate'], record['oxygenLevel'],
+                              record['actionClass'], record['confidence'])
+        restored += 1
+    logger.info(f"Restored {restored} vitals readings from {VITALS_LOG_DIR}")
+    vitals_log.start()
+
+def start_liveness_monitor():
+    # Start the device timeout monitor once per process
+    global liveness_thread
+    if liveness_thread is None:
+        liveness_thread = threading.Thread(target=device_timeout_monitor)
+        liveness_thread.daemon = True
+        liveness_thread.start()
+
 # --- Device timeout monitor thread ---
-def device_timeout_monitor(timeout_seconds=15):
-    global connected_devices, is_collecting, device_status, last_device_state_update, device_reported_state, device_is_collecting, last_data_info, command_in_progress
+def device_timeout_monitor():
+    global is_collecting, device_status, last_device_state_update, device_reported_state, device_is_collecting, last_data_info, command_in_progress
     while True:
-        time.sleep(2)
+        # Blocks until some device misses its deadline
+        expired = device_liveness.wait_expired()
         with lock:
-            if connected_devices and last_device_state_update > 0:
-                elapsed = time.time() - last_device_state_update
-                if elapsed > timeout_seconds:
-                    logger.warning(f"Device timeout: no data/status received for {timeout_seconds}s, marking as disconnected")
-                    # Đóng socket và reset trạng thái
-                    for addr, device in list(connected_devices.items()):
-                        try:
-                            device['socket'].close()
-                        except:
-                            pass
-                    connected_devices.clear()
-                    is_collecting = False
-                    device_status = None
-                    device_reported_state = "DISCONNECTED"
-                    device_is_collecting = False
-                    last_data_info = None
-                    command_in_progress = False
-                    last_device_state_update = 0
+            dropped = False
+            for addr in expired:
+                device = connected_devices.pop(addr, None)
+                if device is None:
+                    continue
+                dropped = True
+                logger.warning(f"Device timeout: no data/status received from {addr} "
+                               f"for {device_liveness.timeout_for(device.get('device_class'))}s, "
+                               f"marking as disconnected")
+                # Đóng socket của thiết bị này
+                try:
+                    device['socket'].close()
+                except:
+                    pass
+
+            # Reset the shared device state once the last device is gone
+            if dropped and not connected_devices:
+                is_collecting = False
+                device_status = None
+                device_reported_state = "DISCONNECTED"
+                device_is_collecting = False
+                last_data_info = None
+                command_in_progress = False
+                last_device_state_update = 0
 
 # Send TCP command to device with better state tracking
 
@@ -93,6 +196,7 @@ def send_tcp_command(command):
             }
             command_in_progress = True
 
+        sent_at = time.perf_counter()
         client_socket.send(f"{command}\n".encode('utf-8'))
 
         # Wait for response with timeout
@@ -100,6 +204,8 @@ def send_tcp_command(command):
         try:
             response = client_socket.recv(1024).decode('utf-8').strip()
             client_socket.settimeout(None)
+            COMMAND_RTT_SECONDS.observe(time.perf_counter() - sent_at,
+                                        command=command, result='ok')
             logger.info(f"Received response: {response}")
 
             # Always update device status with latest response
@@ -132,6 +238,8 @@ def send_tcp_command(command):
                     except Exception as e:
                         logger.error(f"Error parsing state from response: {e}")
         except socket.timeout:
+            COMMAND_RTT_SECONDS.observe(time.perf_counter() - sent_at,
+                                        command=command, result='timeout')
             logger.warning(f"Timeout waiting for response to {command}")
             client_socket.settimeout(None)
             # We'll rely on subsequent STATUS_INFO updates to determine if command succeeded
@@ -151,6 +259,7 @@ def send_tcp_command(command):
             except:
                 logger.warning(
                     f"Device {device_addr} appears to be disconnected, removing")
+                device_liveness.remove(device_addr)
                 with lock:
                     if device_addr in connected_devices:
                         del connected_devices[device_addr]
@@ -169,8 +278,10 @@ def handle_tcp_client(client_socket, addr):
         connected_devices[addr] = {
             'socket': client_socket,
             'timestamp': datetime.now(),
-            'last_data': None
+            'last_data': None,
+            'device_class': None
         }
+    device_liveness.touch(addr)
 
     try:
         # Set TCP keep-alive to detect dead connections
@@ -199,15 +310,34 @@ def handle_tcp_client(client_socket, addr):
                     logger.debug(f"Ignoring empty message from {addr}")
                     continue
 
-                logger.info(f"Received message from {addr}: {message}")
+                # Sampled per device and message type (HELLO, STATUS_INFO, ...)
+                logger.info("Received message from %s: %s", addr, message,
+                            extra={'device': addr[0],
+                                   'sample': 'rx:' + message.split(':', 1)[0][:20]})
+
+                # Any message from the device proves it is alive
+                device_liveness.touch(addr)
+
+                message_type = message.split(':', 1)[0].split(' ', 1)[0]
+                TCP_MESSAGES.inc(device=addr[0],
+                                 type=message_type if message_type in MESSAGE_TYPES else 'other')
+
+                if message == "HELLO" or message.startswith("HELLO "):
+                    # Optional device class after HELLO selects its timeout
+                    device_class = message[6:].strip() or None
+                    if device_class:
+                        with lock:
+                            if addr in connected_devices:
+                                connected_devices[addr]['device_class'] = device_class
+                        device_liveness.touch(addr, device_class)
 
-                if message == "HELLO":
                     # Send welcome message
                     client_socket.send("WELCOME\n".encode('utf-8'))
                     logger.info(f"Sent WELCOME to {addr}")
                 elif message.startswith("OK:"):
                     # Acknowledgment from device, just log it
-                    logger.info(f"Acknowledgment from {addr}: {message}")
+                    logger.info("Acknowledgment from %s: %s", addr, message,
+                                extra={'device': addr[0], 'sample': 'ack'})
                 elif message.startswith("ERROR:") or "ERROR:" in message:
                     # Error message from device, just log it without responding
                     logger.info(f"Error from device {addr}: {message}")
@@ -245,8 +375,8 @@ def handle_tcp_client(client_socket, addr):
                                 logger.error(
                                     f"Error parsing state from status update: {e}")
 
-                    logger.info(
-                        f"Received status info from {addr}: {device_status}")
+                    logger.info("Received status info from %s: %s", addr, device_status,
+                                extra={'device': addr[0], 'sample': 'status'})
                     client_socket.send("OK: Status received\n".encode('utf-8'))
                 else:
                     # Just echo back an OK for any other message
@@ -266,6 +396,7 @@ def handle_tcp_client(client_socket, addr):
     finally:
         # Clean up on disconnect
         logger.info(f"Client {addr} disconnected")
+        device_liveness.remove(addr)
         with lock:
             if addr in connected_devices:
                 del connected_devices[addr]
@@ -559,6 +690,7 @@ def clear_connection():
     with lock:
         # Close all connected sockets
         for addr, device in connected_devices.items():
+            device_liveness.remove(addr)
             try:
                 device['socket'].close()
             except:
@@ -572,50 +704,100 @@ def clear_connection():
     return jsonify({'status': 'success'})
 
 
+def build_data_info(data):
+    # Convert a device payload into the data info object served by /status
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Map activity class to descriptive name
+    activity_class = data.get('actionClass', -1)
+    activity_name = ACTIVITY_NAMES.get(activity_class, "Unknown")
+
+    return {
+        'timestamp': timestamp,
+        'heartRate': data.get('heartRate', 0),
+        'oxygenLevel': data.get('oxygenLevel', 0),
+        'actionClass': activity_class,
+        'activityName': activity_name,
+        'confidence': data.get('confidence', 0),
+        'deviceState': data.get('deviceState', 'Unknown')
+    }
+
+
+def apply_readings(readings, device_id, remote_addr=None):
+    # Apply readings in order, taking the global lock once for the whole batch
+    global last_data_info, is_collecting
+
+    apply_start = time.perf_counter()
+    received_at = time.time()
+    infos = [build_data_info(data) for data in readings]
+
+    # Place buffered readings on the server clock using the device's
+    # millisecond timestamps relative to the newest reading
+    device_times = [data.get('timestamp') for data in readings]
+    if len(readings) > 1 and all(isinstance(t, (int, float)) for t in device_times):
+        newest = device_times[-1]
+        times = [received_at - (newest - t) / 1000.0 for t in device_times]
+    else:
+        times = [received_at] * len(readings)
+
+    with lock:
+        # Only the newest reading is visible through /status
+        last_data_info = infos[-1]
+
+        # Update the collecting flag based on the device state in the data
+        for data in readings:
+            if 'isCollecting' in data:
+                is_collecting = data.get('isCollecting', False)
+        if 'isCollecting' in readings[-1]:
+            logger.info(
+                f"Updated is_collecting to {is_collecting} based on data payload")
+
+        # If we have a connected device, update its last data too
+        if connected_devices:
+            addr = next(iter(connected_devices))
+            connected_devices[addr]['last_data'] = last_data_info
+
+    # A data post also proves the device's TCP session is alive
+    # (looked up by IP in the tracker, outside the global lock)
+    if remote_addr is not None:
+        device_liveness.touch_host(remote_addr)
+
+    # Keep the readings in the device's history (has its own lock); readings
+    # overlapping ones already stored are moved up to the newest timestamp.
+    # Unlike /status, a missing value is kept as missing (None -> NaN), so it
+    # is not averaged in as 0
+    times = vitals_history.record_many(device_id, {
+        'timestamp': times,
+        'heartRate': [data.get('heartRate') for data in readings],
+        'oxygenLevel': [data.get('oxygenLevel') for data in readings],
+        'actionClass': [info['actionClass'] for info in infos],
+        'confidence': [data.get('confidence') for data in readings],
+    })
+
+    # Queue for the on-disk log; the writer thread handles the I/O
+    for data, info, ts in zip(readings, infos, times):
+        vitals_log.append({
+            'device': device_id,
+            'timestamp': float(ts),
+            'heartRate': data.get('heartRate'),
+            'oxygenLevel': data.get('oxygenLevel'),
+            'actionClass': info['actionClass'],
+            'confidence': data.get('confidence'),
+            'deviceState': info['deviceState']
+        })
+    APPLY_SECONDS.observe(time.perf_counter() - apply_start)
+
+
 @app.route('/data', methods=['POST'])
 def receive_data():
     # Endpoint to receive data from ESP32
-    global last_data_info
-
     try:
         data = request.json
         logger.debug(f"Received data: {data}")
 
-        # Update the last data information
-        with lock:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            # Map activity class to descriptive name
-            activity_name = "Unknown"
-            activity_class = data.get('actionClass', -1)
-            if activity_class == 0:
-                activity_name = "Resting after exercise"
-            elif activity_class == 1:
-                activity_name = "Sitting"
-            elif activity_class == 2:
-                activity_name = "Walking"
-
-            # Create a data info object with activity name
-            last_data_info = {
-                'timestamp': timestamp,
-                'heartRate': data.get('heartRate', 0),
-                'oxygenLevel': data.get('oxygenLevel', 0),
-                'actionClass': activity_class,
-                'activityName': activity_name,
-                'confidence': data.get('confidence', 0),
-                'deviceState': data.get('deviceState', 'Unknown')
-            }
-
-            # Update the collecting flag based on the device state in the data
-            if 'isCollecting' in data:
-                is_collecting = data.get('isCollecting', False)
-                logger.info(
-                    f"Updated is_collecting to {is_collecting} based on data payload")
-
-            # If we have a connected device, update its last data too
-            if connected_devices:
-                addr = list(connected_devices.keys())[0]
-                connected_devices[addr]['last_data'] = last_data_info
+        device_id = data.get('deviceId') or request.remote_addr
+        apply_readings([data], device_id, request.remote_addr)
+        READINGS.inc(endpoint='data')
 
         return jsonify({'status': 'success'})
     except Exception as e:
@@ -623,6 +805,88 @@ def receive_data():
         return jsonify({'status': 'error', 'message': str(e)})
 
 
+@app.route('/data/batch', methods=['POST'])
+def receive_data_batch():
+    # Endpoint to receive many buffered readings from ESP32 in one request.
+    # Accepts a JSON array, {"deviceId": ..., "readings": [...]}, or the
+    # same structure encoded as MessagePack.
+    try:
+        if request.mimetype in ('application/msgpack', 'application/x-msgpack'):
+            if msgpack is None:
+                return jsonify({'status': 'error', 'message': 'MessagePack is not supported on this server'}), 415
+            with BATCH_DECODE_SECONDS.time(format='msgpack'):
+                payload = msgpack.unpackb(request.get_data(), raw=False)
+        else:
+            with BATCH_DECODE_SECONDS.time(format='json'):
+                payload = request.get_json(force=True)
+
+        if isinstance(payload, dict):
+            readings = payload.get('readings', [])
+            device_id = payload.get('deviceId')
+        else:
+            readings = payload
+            device_id = None
+
+        if not isinstance(readings, list) or not readings:
+            return jsonify({'status': 'error', 'message': 'Expected a non-empty list of readings'})
+
+        if len(readings) > MAX_BATCH_READINGS:
+            return jsonify({'status': 'error', 'message': f'Batch too large (max {MAX_BATCH_READINGS} readings)'})
+
+        # Apply in device order even if the device sent them out of order
+        if all(isinstance(r.get('timestamp'), (int, float)) for r in readings):
+            readings = sorted(readings, key=lambda r: r['timestamp'])
+
+        device_id = device_id or readings[-1].get('deviceId') or request.remote_addr
+        apply_readings(readings, device_id, request.remote_addr)
+        READINGS.inc(len(readings), endpoint='batch')
+
+        logger.debug(f"Received batch of {len(readings)} readings from {device_id}")
+        return jsonify({'status': 'success', 'count': len(readings)})
+    except Exception as e:
+        logger.error(f"Error processing data batch: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
+
+@app.route('/history')
+def history():
+    # Return the stored vitals of a device, downsampled for charting
+    try:
+        device_id = request.args.get('device')
+        since = request.args.get('since', type=float)
+        max_points = request.args.get(
+            'max_points', HISTORY_MAX_POINTS, type=int)
+
+        if not device_id:
+            # Default to the device that reported most recently
+            devices = vitals_history.devices()
+            if not devices:
+                return jsonify({'status': 'error', 'message': 'No history available'})
+            device_id = devices[0]
+
+        points = vitals_history.query(
+            device_id, since=since, max_points=max_points)
+        if points is None:
+            return jsonify({'status': 'error', 'message': f'Unknown device: {device_id}'})
+
+        return jsonify({
+            'status': 'success',
+            'device': device_id,
+            'devices': vitals_history.devices(),
+            'count': len(points['timestamp']),
+            'points': points
+        })
+    except Exception as e:
+        logger.error(f"Error reading history: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
+
+@app.route('/metrics')
+def get_metrics():
+    # Runtime metrics in the Prometheus text format
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
 @app.route('/static/<path:path>')
 def serve_static(path):
     return app.send_static_file(os.path.join('static', path))
@@ -638,10 +902,11 @@ if not os.path.exists('static/js'):
 
 
 if __name__ == '__main__':
+    # Restore history and start the vitals log writer
+    start_vitals_log()
+
     # Start device timeout monitor
-    timeout_thread = threading.Thread(target=device_timeout_monitor, args=(15,))
-    timeout_thread.daemon = True
-    timeout_thread.start()
+    start_liveness_monitor()
 
     # Start TCP server in a thread
     tcp_thread = threading.Thread(target=start_tcp_server)
@@ -0,0 +1,220 @@
+import threading
+import numpy as np
+
+# Columns kept for every reading, in the same naming as the /data payload
+HISTORY_COLUMNS = {
+    'timestamp': np.float64,     # server receive time (epoch seconds)
+    'heartRate': np.float32,
+    'oxygenLevel': np.float32,
+    'actionClass': np.int8,
+    'confidence': np.float32,
+}
+FLOAT_DECIMALS = 4  # Decimals kept for float columns in query results
+
+
+class VitalsRingBuffer:
+    """
+    Fixed-capacity, array-backed ring buffer of vitals for one device.
+
+    Readings are kept in timestamp order: a reading older than the newest
+    stored one is stored at the newest timestamp instead.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.columns = {name: np.zeros(self.capacity, dtype=dtype)
+                        for name, dtype in HISTORY_COLUMNS.items()}
+        self._head = 0   # next write position
+        self._size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _newest(self):
+        # Timestamp of the newest reading (lock held)
+        return self.columns['timestamp'][self._head - 1] if self._size else -np.inf
+
+    def append(self, timestamp, heart_rate, oxygen_level, action_class, confidence):
+        """Store one reading, overwriting the oldest one when full; returns its timestamp"""
+        with self.lock:
+            timestamp = max(float(timestamp), self._newest())
+            i = self._head
+            self.columns['timestamp'][i] = timestamp
+            self.columns['heartRate'][i] = heart_rate
+            self.columns['oxygenLevel'][i] = oxygen_level
+            self.columns['actionClass'][i] = action_class
+            self.columns['confidence'][i] = confidence
+            self._head = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+        return timestamp
+
+    def extend(self, columns):
+        """
+        Store many readings at once (dictionary of column -> sequence).
+
+        Returns:
+            The timestamps the readings were stored at
+        """
+        timestamps = np.asarray(columns['timestamp'], dtype=np.float64)
+        n = len(timestamps)
+        if n == 0:
+            return timestamps
+        with self.lock:
+            # A batch may overlap readings already stored (e.g. a /data post
+            # received before it); keep the timestamps ascending
+            timestamps = np.maximum.accumulate(np.maximum(timestamps, self._newest()))
+            # Only the newest `capacity` readings can survive anyway
+            skip = max(0, n - self.capacity)
+            count = n - skip
+            positions = (self._head + np.arange(count)) % self.capacity
+            for name, col in self.columns.items():
+                values = timestamps if name == 'timestamp' else np.asarray(columns[name])
+                col[positions] = values[skip:]
+            self._head = (self._head + count) % self.capacity
+            self._size = min(self._size + count, self.capacity)
+        return timestamps
+
+    def last_timestamp(self):
+        """Return the timestamp of the newest reading (0 if empty)"""
+        with self.lock:
+            if self._size == 0:
+                return 0.0
+            return float(self.columns['timestamp'][self._head - 1])
+
+    def snapshot(self, since=None):
+        """
+        Return the stored readings in chronological order.
+
+        Args:
+            since: Only return readings with timestamp > since (epoch seconds)
+
+        Returns:
+            Dictionary of column name -> numpy array (copies)
+        """
+        with self.lock:
+            if self._size < self.capacity:
+                data = {name: col[:self._size].copy()
+                        for name, col in self.columns.items()}
+            else:
+                # Oldest reading sits at the write position once wrapped
+                data = {name: np.concatenate((col[self._head:], col[:self._head]))
+                        for name, col in self.columns.items()}
+
+        if since is not None and len(data['timestamp']) > 0:
+            start = np.searchsorted(data['timestamp'], since, side='right')
+            data = {name: col[start:] for name, col in data.items()}
+        return data
+
+
+def downsample(data, max_points):
+    """
+    Reduce a column snapshot to at most max_points buckets.
+
+    Numeric columns are averaged per bucket, ignoring missing readings; the
+    timestamp and activity class take the value of the last reading in each
+    bucket.
+    """
+    n = len(data['timestamp'])
+    if max_points is None or max_points <= 0 or n <= max_points:
+        return data
+
+    # Bucket boundaries over contiguous ranges of readings
+    edges = np.linspace(0, n, max_points + 1).astype(np.int64)
+    starts = edges[:-1]
+    ends = edges[1:]
+
+    result = {}
+    for name in ('heartRate', 'oxygenLevel', 'confidence'):
+        # Missing readings (NaN) are left out of the bucket average
+        values = data[name].astype(np.float64)
+        present = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+        counts = np.add.reduceat(present.astype(np.int64), starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[name] = sums / counts
+    result['timestamp'] = data['timestamp'][ends - 1]
+    result['actionClass'] = data['actionClass'][ends - 1]
+    return result
+
+
+class VitalsHistory:
+    """Registry of per-device ring buffers"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def buffer_for(self, device_id):
+        """Get (or create) the ring buffer for a device"""
+        with self._lock:
+            buf = self._buffers.get(device_id)
+            if buf is None:
+                buf = VitalsRingBuffer(self.capacity)
+                self._buffers[device_id] = buf
+            return buf
+
+    def record(self, device_id, timestamp, heart_rate, oxygen_level, action_class, confidence):
+        """Append one reading to the device's history; returns its stored timestamp"""
+        return self.buffer_for(device_id).append(
+            timestamp, heart_rate, oxygen_level, action_class, confidence)
+
+    def record_many(self, device_id, columns):
+        """Append a batch of readings (dictionary of column -> sequence); returns the stored timestamps"""
+        return self.buffer_for(device_id).extend(columns)
+
+    def devices(self):
+        """Return known device ids, most recently updated first"""
+        with self._lock:
+            items = list(self._buffers.items())
+        items.sort(key=lambda item: item[1].last_timestamp(), reverse=True)
+        return [device_id for device_id, _ in items]
+
+    def query(self, device_id, since=None, max_points=None):
+        """
+        Return the (optionally downsampled) history for a device as lists.
+
+        Returns:
+            Dictionary of column name -> list, or None for an unknown device
+        """
+        with self._lock:
+            buf = self._buffers.get(device_id)
+        if buf is None:
+            return None
+
+        data = downsample(buf.snapshot(since=since), max_points)
+        return {name: _to_list(col) for name, col in data.items()}
+
+
+def _to_list(col):
+    """
+    Column as a JSON-safe list.
+
+    Missing readings (NaN) become None, and float32 values are rounded so
+    0.9 is not sent as 0.8999999761581421.
+    """
+    if col.dtype.kind != 'f':
+        return col.tolist()
+    values = np.round(col.astype(np.float64), FLOAT_DECIMALS)
+    return [None if v != v else v for v in values.tolist()]
+
+
+# Example usage: a single reading followed by a batch that overlaps it
+if __name__ == "__main__":
+    history = VitalsHistory(capacity=64)
+    history.record('demo', 100.0, 70, 97, 0, 0.9)
+    batch = np.arange(91.5, 101.0, 1.0)
+    history.record_many('demo', {
+        'timestamp': batch,
+        'heartRate': np.full(len(batch), 72.0),
+        'oxygenLevel': np.full(len(batch), 98.0),
+        'actionClass': np.zeros(len(batch), dtype=np.int8),
+        'confidence': np.full(len(batch), 0.8),
+    })
+    times = history.query('demo')['timestamp']
+    print("Stored timestamps:", times)
+    assert times == sorted(times), "history is out of order"
+    recent = history.query('demo', since=99)['timestamp']
+    print("Since 99:", recent)
+    assert recent == [t for t in times if t > 99], "since= dropped readings"
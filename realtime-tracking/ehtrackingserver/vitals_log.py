@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger("OxiSensor")
+
+INDEX_FILE = 'index.json'
+SEGMENT_PREFIX = 'vitals_'
+SEGMENT_SUFFIX = '.ndjson'
+
+
+class VitalsLog:
+    """
+    Durable append-only log of vitals readings.
+
+    Readings are queued by the request handlers and written by a background
+    thread as line-delimited JSON segments. Segments are fsynced on a timer,
+    rotated by size or age, and described in a small index (oldest/newest
+    timestamp and record count per segment) used for time-range queries.
+    Closed segments older than max_age seconds, or beyond max_bytes in
+    total, are deleted when a segment is rotated.
+    """
+
+    def __init__(self, log_dir, max_segment_bytes=8 * 1024 * 1024,
+                 max_segment_age=3600, fsync_interval=1.0, queue_size=10000,
+                 max_age=None, max_bytes=None):
+        self.log_dir = log_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._index = []
+        self._index_lock = threading.Lock()
+        self._segment = None
+        self._segment_file = None
+        self._thread = None
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._load_index()
+
+    # --- Producer side (request handlers) ---
+
+    def append(self, record):
+        """Queue a record for writing without blocking the caller"""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(
+                    f"Vitals log queue full, dropped {self.dropped} records so far")
+            return False
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._writer_loop)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Vitals log writing to {self.log_dir}")
+
+    # --- Reader side ---
+
+    def segments(self, start=None, end=None):
+        """Return index entries of segments overlapping [start, end]"""
+        with self._index_lock:
+            entries = [dict(entry) for entry in self._index]
+        return [entry for entry in entries
+                if entry['count'] > 0
+                and (start is None or entry['end'] >= start)
+                and (end is None or entry['start'] <= end)]
+
+    def query(self, start=None, end=None):
+        """
+        Yield records with start <= timestamp <= end, segment by segment.
+
+        Within a segment records are in write order; batched readings may
+        carry earlier timestamps than records written before them.
+        """
+        for entry in self.segments(start, end):
+            path = os.path.join(self.log_dir, entry['file'])
+            try:
+                with open(path, 'r') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Partially written last line after a crash
+                            continue
+                        ts = record.get('timestamp', 0)
+                        if start is not None and ts < start:
+                            continue
+                        if end is not None and ts > end:
+                            continue
+                        yield record
+            except FileNotFoundError:
+                continue
+
+    # --- Writer thread ---
+
+    def _writer_loop(self):
+        last_fsync = time.time()
+        dirty = False
+
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                batch = []
+
+            # Drain whatever else is already waiting
+            while batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                    dirty = True
+
+                now = time.time()
+                if dirty and now - last_fsync >= self.fsync_interval:
+                    self._sync()
+                    last_fsync = now
+                    dirty = False
+
+                if self._segment is not None and self._should_rotate(now):
+                    self._close_segment()
+            except Exception as e:
+                logger.error(f"Error writing vitals log: {e}")
+
+    def _write_batch(self, batch):
+        if self._segment is None:
+            self._open_segment(batch[0].get('timestamp', time.time()))
+
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                        for record in batch)
+        self._segment_file.write(lines)
+
+        # Batched readings are not in timestamp order
+        timestamps = [record.get('timestamp', 0) for record in batch]
+        entry = self._segment
+        entry['count'] += len(batch)
+        entry['bytes'] += len(lines)
+        entry['start'] = min(entry['start'], min(timestamps))
+        entry['end'] = max(entry['end'], max(timestamps))
+
+    def _sync(self):
+        if self._segment_file is None:
+            return
+        self._segment_file.flush()
+        os.fsync(self._segment_file.fileno())
+        self._save_index()
+
+    def _should_rotate(self, now):
+        return (self._segment['bytes'] >= self.max_segment_bytes or
+                now - self._segment['opened'] >= self.max_segment_age)
+
+    def _open_segment(self, first_timestamp):
+        filename = f"{SEGMENT_PREFIX}{int(time.time() * 1000)}{SEGMENT_SUFFIX}"
+        self._segment_file = open(os.path.join(self.log_dir, filename), 'a')
+        self._segment = {
+            'file': filename,
+            'start': first_timestamp,
+            'end': first_timestamp,
+            'count': 0,
+            'bytes': 0,
+            'opened': time.time()
+        }
+        with self._index_lock:
+            self._index.append(self._segment)
+
+    def _close_segment(self):
+        self._sync()
+        self._segment_file.close()
+        self._segment_file = None
+        self._segment = None
+        self._prune()
+
+    def _prune(self, now=None):
+        """Delete the oldest closed segments beyond max_age or max_bytes"""
+        if self.max_age is None and self.max_bytes is None:
+            return
+        now = time.time() if now is None else now
+        with self._index_lock:
+            closed = [entry for entry in self._index if entry is not self._segment]
+            total = sum(entry['bytes'] for entry in self._index)
+            expired = []
+            for entry in closed:  # Oldest first
+                too_old = self.max_age is not None and entry['end'] < now - self.max_age
+                too_big = self.max_bytes is not None and total > self.max_bytes
+                if not (too_old or too_big):
+                    continue
+                expired.append(entry)
+                total -= entry['bytes']
+            for entry in expired:
+                self._index.remove(entry)
+        if not expired:
+            return
+        self._save_index()
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.log_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Vitals log: removed {len(expired)} old segments")
+
+    # --- Index persistence ---
+
+    def _save_index(self):
+        path = os.path.join(self.log_dir, INDEX_FILE)
+        tmp_path = path + '.tmp'
+        with self._index_lock:
+            data = json.dumps(self._index)
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load_index(self):
+        """Load the index and rescan segments it does not fully describe"""
+        path = os.path.join(self.log_dir, INDEX_FILE)
+        indexed = {}
+        try:
+            with open(path, 'r') as f:
+                indexed = {entry['file']: entry for entry in json.load(f)}
+        except (FileNotFoundError, ValueError):
+            pass
+
+        entries = []
+        for filename in sorted(os.listdir(self.log_dir)):
+            if not (filename.startswith(SEGMENT_PREFIX) and filename.endswith(SEGMENT_SUFFIX)):
+                continue
+            entry = indexed.get(filename)
+            size = os.path.getsize(os.path.join(self.log_dir, filename))
+            # Segments written after the last index save need a rescan
+            if entry is None or entry.get('bytes') != size:
+                entry = self._scan_segment(filename)
+            entries.append(entry)
+
+        self._index = entries
+        if entries:
+            self._save_index()
+            self._prune()
+
+    def _scan_segment(self, filename):
+        path = os.path.join(self.log_dir, filename)
+        entry = {'file': filename, 'start': 0, 'end': 0, 'count': 0,
+                 'bytes': os.path.getsize(path), 'opened': 0}
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    ts = json.loads(line).get('timestamp', 0)
+                except ValueError:
+                    continue
+                if entry['count'] == 0:
+                    entry['start'] = entry['end'] = ts
+                entry['start'] = min(entry['start'], ts)
+                entry['end'] = max(entry['end'], ts)
+                entry['count'] += 1
+        return entry
@@ -1,11 +1,17 @@
 import os
 import threading
-from server import app, start_tcp_server
+from server import app, start_tcp_server, start_vitals_log, start_liveness_monitor
 
 # Only start TCP server when running via Gunicorn (not during reloads)
 if os.environ.get("SERVER_RUNNING", "0") != "1":
     os.environ["SERVER_RUNNING"] = "1"
 
+    # Restore history and start the vitals log writer
+    start_vitals_log()
+
+    # Expire devices that miss their liveness deadline
+    start_liveness_monitor()
+
     # Start TCP server in a separate thread
     tcp_thread = threading.Thread(target=start_tcp_server)
     tcp_thread.daemon = True
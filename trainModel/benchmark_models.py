@@ -0,0 +1,228 @@
+"""
+Benchmark candidate activity-model architectures for the ESP32.
+
+Every candidate is converted to TFLite and measured the way the device
+constrains it: parameters against the notebook budget, MACs per window,
+peak activation memory against TENSOR_ARENA_SIZE and interpreter latency
+on the host. With --epochs each candidate is also trained briefly so the
+table shows where it sits on the speed/accuracy frontier.
+"""
+
+import sys
+import argparse
+import numpy as np
+
+from export_model import (tf, CLASSES, MAX_PARAMS, TENSOR_ARENA_SIZE, ARENA_OVERHEAD, CSV_DIR,
+                          build_model, count_params, load_windows, convert_float, convert_int8,
+                          activation_memory, benchmark_latency)
+from segments import WINDOW_SIZE, CHANNELS
+
+INPUT_SHAPE = (WINDOW_SIZE, len(CHANNELS))
+
+
+def _sequential(*layers):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input
+    return Sequential([Input(shape=INPUT_SHAPE), *layers])
+
+
+def cnn_small():
+    """The earlier notebook model (commented out in create_model)"""
+    from tensorflow.keras.layers import Conv1D, MaxPooling1D, Flatten, Dense
+    return _sequential(
+        Conv1D(10, 5, activation='relu', padding='same'),
+        MaxPooling1D(2),
+        Conv1D(10, 5, activation='relu', padding='same'),
+        MaxPooling1D(2),
+        Flatten(),
+        Dense(21, activation='relu'),
+        Dense(len(CLASSES), activation='softmax'),
+    )
+
+
+def cnn_gap():
+    """Two convolutions and global average pooling instead of Flatten + Dense"""
+    from tensorflow.keras.layers import Conv1D, MaxPooling1D, GlobalAveragePooling1D, Dense
+    return _sequential(
+        Conv1D(16, 5, activation='relu', padding='same'),
+        MaxPooling1D(2),
+        Conv1D(32, 5, activation='relu', padding='same'),
+        GlobalAveragePooling1D(),
+        Dense(len(CLASSES), activation='softmax'),
+    )
+
+
+def cnn_strided():
+    """Strided convolutions downsample early, so later layers see short inputs"""
+    from tensorflow.keras.layers import Conv1D, GlobalAveragePooling1D, Dense
+    return _sequential(
+        Conv1D(12, 7, strides=2, activation='relu', padding='same'),
+        Conv1D(24, 5, strides=2, activation='relu', padding='same'),
+        Conv1D(24, 3, strides=2, activation='relu', padding='same'),
+        GlobalAveragePooling1D(),
+        Dense(len(CLASSES), activation='softmax'),
+    )
+
+
+def cnn_separable():
+    """Depthwise-separable convolutions"""
+    from tensorflow.keras.layers import (Conv1D, SeparableConv1D, MaxPooling1D,
+                                         GlobalAveragePooling1D, Dense)
+    return _sequential(
+        Conv1D(16, 5, activation='relu', padding='same'),
+        MaxPooling1D(2),
+        SeparableConv1D(32, 5, activation='relu', padding='same'),
+        MaxPooling1D(2),
+        SeparableConv1D(32, 5, activation='relu', padding='same'),
+        GlobalAveragePooling1D(),
+        Dense(len(CLASSES), activation='softmax'),
+    )
+
+
+CANDIDATES = {
+    'notebook': lambda: build_model(INPUT_SHAPE, len(CLASSES)),
+    'cnn_small': cnn_small,
+    'cnn_gap': cnn_gap,
+    'cnn_strided': cnn_strided,
+    'cnn_separable': cnn_separable,
+}
+
+
+def layer_macs(layer):
+    """Multiply-accumulates of one layer for a single window"""
+    name = type(layer).__name__
+    output_shape = tuple(layer.output.shape[1:])
+    positions = int(np.prod(output_shape[:-1])) if len(output_shape) > 1 else 1
+
+    if name == 'SeparableConv1D':
+        depthwise = int(np.prod(layer.depthwise_kernel.shape))
+        pointwise = int(np.prod(layer.pointwise_kernel.shape))
+        return (depthwise + pointwise) * positions
+    if name == 'DepthwiseConv1D':
+        return int(np.prod(layer.depthwise_kernel.shape)) * positions
+    if name in ('Conv1D', 'Dense'):
+        return int(np.prod(layer.kernel.shape)) * positions
+    return 0
+
+
+def model_macs(model):
+    """Tuple (total, [(layer name, macs), ...])"""
+    per_layer = [(layer.name, layer_macs(layer)) for layer in model.layers]
+    return sum(macs for _, macs in per_layer), per_layer
+
+
+def train_and_score(model, X, y, epochs, seed=42):
+    """Short training run; returns test accuracy"""
+    from sklearn.model_selection import train_test_split
+    tf.random.set_seed(seed)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=seed, stratify=y)
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model.fit(X_train, y_train, epochs=epochs, batch_size=32, verbose=0)
+    return float(model.evaluate(X_test, y_test, verbose=0)[1])
+
+
+def benchmark_candidate(name, model, X, y, representative, runs=200, epochs=0, quantize='float'):
+    """Measure one candidate; returns a result dict"""
+    accuracy = train_and_score(model, X, y, epochs) if epochs > 0 else None
+    macs, per_layer = model_macs(model)
+
+    tflite_model = (convert_int8(model, representative) if quantize == 'int8'
+                    else convert_float(model))
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    interpreter.allocate_tensors()
+    peak, _ = activation_memory(interpreter)
+    latency = benchmark_latency(interpreter, representative, runs)
+
+    params = count_params(model)
+    arena = peak + ARENA_OVERHEAD
+    return {
+        'name': name,
+        'params': params,
+        'macs': macs,
+        'per_layer': per_layer,
+        'size': len(tflite_model),
+        'peak': peak,
+        'arena': arena,
+        'latency': latency['p50'],
+        'accuracy': accuracy,
+        'fits': params <= MAX_PARAMS and arena <= TENSOR_ARENA_SIZE,
+    }
+
+
+def mark_frontier(results):
+    """Flag candidates not beaten on both latency and accuracy by another fitting one"""
+    for result in results:
+        result['frontier'] = result['fits'] and result['accuracy'] is not None and not any(
+            other['fits'] and other['accuracy'] is not None
+            and other['latency'] <= result['latency'] and other['accuracy'] >= result['accuracy']
+            and (other['latency'] < result['latency'] or other['accuracy'] > result['accuracy'])
+            for other in results)
+
+
+def rank(results):
+    """Fitting models first, then by accuracy (when trained) and latency"""
+    return sorted(results, key=lambda r: (
+        not r['fits'],
+        -(r['accuracy'] if r['accuracy'] is not None else 0.0),
+        r['latency'],
+    ))
+
+
+def print_table(results):
+    header = (f"{'#':>2}  {'model':<14} {'params':>7} {'MACs':>9} {'size KB':>8} "
+              f"{'arena KB':>9} {'p50 ms':>8} {'acc':>6}  fits")
+    print(header)
+    print('-' * len(header))
+    for position, r in enumerate(results, 1):
+        accuracy = f"{r['accuracy']:.3f}" if r['accuracy'] is not None else '-'
+        fits = ('yes' if r['fits'] else 'no') + (' *' if r.get('frontier') else '')
+        print(f"{position:>2}  {r['name']:<14} {r['params']:>7,} {r['macs']:>9,} "
+              f"{r['size'] / 1024:>8.2f} {r['arena'] / 1024:>9.2f} {r['latency']:>8.3f} "
+              f"{accuracy:>6}  {fits}")
+    print(f"\nBudget: {MAX_PARAMS:,} parameters, {TENSOR_ARENA_SIZE / 1024:.0f} KB arena. "
+          "* = on the speed/accuracy frontier")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rank candidate model architectures by device cost and accuracy')
+    parser.add_argument('models', nargs='*',
+                        help=f"Candidates to run (default: all of {', '.join(CANDIDATES)})")
+    parser.add_argument('--data', default=CSV_DIR, help='Directory with labelled recordings')
+    parser.add_argument('--epochs', type=int, default=0,
+                        help='Train each candidate this many epochs to report accuracy')
+    parser.add_argument('--quantize', choices=['float', 'int8'], default='float',
+                        help='TFLite variant to measure')
+    parser.add_argument('--runs', type=int, default=200, help='Latency benchmark iterations')
+    parser.add_argument('--layers', action='store_true', help='Print MACs per layer')
+
+    args = parser.parse_args()
+    unknown = [name for name in args.models if name not in CANDIDATES]
+    if unknown:
+        parser.error(f"unknown candidates: {', '.join(unknown)}")
+    if tf is None:
+        print("TensorFlow is required: pip install tensorflow")
+        return 1
+
+    X, y = load_windows(args.data)
+    representative = X[np.random.default_rng(42).permutation(len(X))[:200]]
+
+    results = []
+    for name in args.models or CANDIDATES:
+        print(f"Benchmarking {name}...")
+        result = benchmark_candidate(name, CANDIDATES[name](), X, y, representative,
+                                     args.runs, args.epochs, args.quantize)
+        results.append(result)
+        if args.layers:
+            for layer_name, macs in result['per_layer']:
+                print(f"    {layer_name:<28} {macs:>9,}")
+
+    mark_frontier(results)
+    print()
+    print_table(rank(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Out-of-core training dataset builder.
+
+Recordings are read in chunks and cut into normalized windows as they
+stream in, so a recording never has to fit in memory. Windows are written
+to fixed-size shards of .npy files next to a manifest.json; training reads
+the shards back memory-mapped through a generator or a tf.data pipeline.
+
+Layout of an output directory:
+
+    manifest.json
+    shard_00000_x.npy   float32 (n, window_size, channels)
+    shard_00000_y.npy   int8    (n,) class index into manifest['classes']
+    ...
+"""
+
+import os
+import json
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from segments import (WINDOW_SIZE, STEP_SIZE, CHANNELS, LABEL_PREFIXES,
+                      normalized_windows, label_from_filename)
+
+# Class order used by the firmware (0 resting, 1 sitting, 2 walking)
+CLASSES = ['resting', 'sitting', 'walking']
+
+SHARD_SIZE = 50000    # Windows per shard (about 40 MB at 100 x 2 float32)
+CHUNK_ROWS = 100000   # CSV rows read at a time
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def label_from_path(file_path):
+    """Label from the file name, or from the parent directory (train/walking/x.csv)"""
+    label = label_from_filename(file_path)
+    if label is None:
+        parent = os.path.basename(os.path.dirname(os.path.abspath(file_path))).lower()
+        if parent in CLASSES:
+            label = parent
+        else:
+            label = LABEL_PREFIXES.get(parent)
+    return label
+
+
+def find_recordings(paths):
+    """
+    Labelled CSV recordings under the given files and directories.
+
+    Returns:
+        List of (file_path, label), sorted by path
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, '**', '*.csv'), recursive=True))
+        else:
+            files.append(path)
+
+    recordings = []
+    for file_path in sorted(set(files)):
+        label = label_from_path(file_path)
+        if label not in CLASSES:
+            print(f"Skipping {file_path}: no label for this file name")
+            continue
+        recordings.append((file_path, label))
+    return recordings
+
+
+def stream_windows(file_path, window_size=WINDOW_SIZE, step_size=STEP_SIZE,
+                   include_tail=True, chunk_rows=CHUNK_ROWS):
+    """
+    Yield normalized windows of one recording, chunk by chunk.
+
+    Window positions are the same as segments.normalized_windows over the
+    whole recording; only the samples of windows not yet emitted are kept
+    between chunks.
+    """
+    n_channels = len(CHANNELS)
+    carry = np.empty((0, n_channels))   # Samples from `consumed` onwards
+    recent = np.empty((0, n_channels))  # Last window_size samples, for the tail
+    consumed = 0
+    next_start = 0
+    total = 0
+
+    for chunk in pd.read_csv(file_path, usecols=CHANNELS, chunksize=chunk_rows):
+        values = chunk[CHANNELS].to_numpy(dtype=np.float64)
+        total += len(values)
+        buffer = np.concatenate((carry, values))
+        recent = np.concatenate((recent, values))[-window_size:]
+
+        local = next_start - consumed
+        if len(buffer) - local >= window_size:
+            windows = normalized_windows(buffer[local:], window_size, step_size,
+                                         include_tail=False)
+            next_start += len(windows) * step_size
+            yield windows
+
+        drop = min(next_start - consumed, len(buffer))
+        carry = buffer[drop:]
+        consumed += drop
+
+    last_start = next_start - step_size
+    if include_tail and total >= window_size and last_start != total - window_size:
+        yield normalized_windows(recent, window_size, step_size, include_tail=False)
+
+
+class ShardWriter:
+    """Collect windows in a fixed buffer and write it out as a shard when full"""
+
+    def __init__(self, out_dir, shard_size=SHARD_SIZE, window_size=WINDOW_SIZE,
+                 channels=len(CHANNELS)):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.X = np.empty((shard_size, window_size, channels), dtype=np.float32)
+        self.y = np.empty(shard_size, dtype=np.int8)
+        self.filled = 0
+        self.shards = []
+
+    def add(self, windows, label_index):
+        offset = 0
+        while offset < len(windows):
+            count = min(len(windows) - offset, self.shard_size - self.filled)
+            self.X[self.filled:self.filled + count] = windows[offset:offset + count]
+            self.y[self.filled:self.filled + count] = label_index
+            self.filled += count
+            offset += count
+            if self.filled == self.shard_size:
+                self.flush()
+
+    def flush(self):
+        if self.filled == 0:
+            return
+        name = f"shard_{len(self.shards):05d}"
+        np.save(os.path.join(self.out_dir, f"{name}_x.npy"), self.X[:self.filled])
+        np.save(os.path.join(self.out_dir, f"{name}_y.npy"), self.y[:self.filled])
+        self.shards.append({
+            'x': f"{name}_x.npy",
+            'y': f"{name}_y.npy",
+            'count': self.filled,
+        })
+        self.filled = 0
+
+
+def build_shards(paths, out_dir, window_size=WINDOW_SIZE, step_size=STEP_SIZE,
+                 include_tail=True, shard_size=SHARD_SIZE, chunk_rows=CHUNK_ROWS):
+    """
+    Build a sharded dataset from labelled recordings.
+
+    Args:
+        paths: CSV files and/or directories containing them
+        out_dir: Output directory (existing shards in it are replaced)
+        window_size, step_size, include_tail: Windowing, as in segments.py
+        shard_size: Windows per shard
+        chunk_rows: CSV rows read at a time
+
+    Returns:
+        The manifest dict (also written to out_dir/manifest.json)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(out_dir, 'shard_*.npy')):
+        os.remove(old)
+
+    writer = ShardWriter(out_dir, shard_size, window_size, len(CHANNELS))
+    recordings = []
+    for file_path, label in find_recordings(paths):
+        label_index = CLASSES.index(label)
+        count = 0
+        for windows in stream_windows(file_path, window_size, step_size,
+                                      include_tail, chunk_rows):
+            writer.add(windows, label_index)
+            count += len(windows)
+        recordings.append({'file': file_path, 'label': label, 'windows': count})
+        print(f"{file_path}: {count} windows ({label})")
+    writer.flush()
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'window_size': window_size,
+        'step_size': step_size,
+        'include_tail': include_tail,
+        'channels': CHANNELS,
+        'classes': CLASSES,
+        'total': sum(shard['count'] for shard in writer.shards),
+        'shards': writer.shards,
+        'recordings': recordings,
+    }
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+class ShardedDataset:
+    """
+    Read-only view over a sharded dataset.
+
+    Shards are opened memory-mapped; only the windows of the batch being
+    produced are read into memory.
+    """
+
+    def __init__(self, out_dir):
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.classes = self.manifest['classes']
+        self.window_size = self.manifest['window_size']
+        self.channels = len(self.manifest['channels'])
+
+        self.X = [np.load(os.path.join(out_dir, shard['x']), mmap_mode='r')
+                  for shard in self.manifest['shards']]
+        self.y = [np.load(os.path.join(out_dir, shard['y']), mmap_mode='r')
+                  for shard in self.manifest['shards']]
+        counts = [shard['count'] for shard in self.manifest['shards']]
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def labels(self):
+        """All labels (small: one byte per window)"""
+        if not self.y:
+            return np.empty(0, dtype=np.int8)
+        return np.concatenate([np.asarray(y) for y in self.y])
+
+    def take(self, indices):
+        """Windows and labels at the given global indices, in that order"""
+        indices = np.asarray(indices, dtype=np.int64)
+        X = np.empty((len(indices), self.window_size, self.channels), dtype=np.float32)
+        y = np.empty(len(indices), dtype=np.int8)
+
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            local = indices[mask] - self.offsets[shard_id]
+            # Sorted reads are sequential on disk; scatter back afterwards
+            order = np.argsort(local)
+            positions = np.flatnonzero(mask)[order]
+            X[positions] = self.X[shard_id][local[order]]
+            y[positions] = self.y[shard_id][local[order]]
+        return X, y
+
+    def split(self, test_size=0.2, seed=42):
+        """Stratified train/test split of the window indices"""
+        labels = self.labels()
+        rng = np.random.default_rng(seed)
+        train, test = [], []
+        for cls in np.unique(labels):
+            idx = rng.permutation(np.flatnonzero(labels == cls))
+            n_test = int(round(len(idx) * test_size))
+            test.append(idx[:n_test])
+            train.append(idx[n_test:])
+        if not train:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(train)), np.sort(np.concatenate(test))
+
+    def batches(self, indices=None, batch_size=32, shuffle=True, seed=None):
+        """
+        Generator of (X, y) batches over the given indices (default: all).
+
+        A new permutation is drawn on every pass when shuffle is set.
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        indices = np.asarray(indices, dtype=np.int64)
+        if shuffle:
+            indices = np.random.default_rng(seed).permutation(indices)
+        for start in range(0, len(indices), batch_size):
+            yield self.take(indices[start:start + batch_size])
+
+    def to_tf_dataset(self, indices=None, batch_size=32, shuffle=True, seed=None):
+        """
+        tf.data.Dataset of (X, y) batches read from the shards.
+
+        Each iteration of the dataset (each epoch) reshuffles the indices.
+        """
+        import tensorflow as tf  # Only needed for training, not for building
+
+        epoch = [0]
+
+        def generator():
+            epoch_seed = None if seed is None else seed + epoch[0]
+            epoch[0] += 1
+            yield from self.batches(indices, batch_size, shuffle, epoch_seed)
+
+        dataset = tf.data.Dataset.from_generator(
+            generator,
+            output_signature=(
+                tf.TensorSpec(shape=(None, self.window_size, self.channels), dtype=tf.float32),
+                tf.TensorSpec(shape=(None,), dtype=tf.int8),
+            ))
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build a sharded, memory-mappable training dataset from labelled recordings')
+    parser.add_argument('inputs', nargs='*',
+                        default=[os.path.join('..', 'data-collect', 'server', 'data', 'csv')],
+                        help='CSV files or directories of labelled recordings')
+    parser.add_argument('--out', default='shards',
+                        help='Output directory for shards and manifest')
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE,
+                        help='Window size in samples')
+    parser.add_argument('--step', type=int, default=STEP_SIZE,
+                        help='Step between windows in samples')
+    parser.add_argument('--no-tail', action='store_true',
+                        help='Do not add the trailing window of each recording')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE,
+                        help='Windows per shard')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='CSV rows read at a time')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = build_shards(args.inputs, args.out, args.window, args.step,
+                            not args.no_tail, args.shard_size, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+
+    print(f"Wrote {manifest['total']} windows in {len(manifest['shards'])} shards "
+          f"to {args.out} in {elapsed:.2f}s")
+    labels = ShardedDataset(args.out).labels()
+    for index, label in enumerate(CLASSES):
+        print(f"  {label}: {int(np.sum(labels == index))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Export the activity model for the ESP32 firmware.
+
+Loads best_model.h5 (or trains it with --train), converts it to TFLite,
+writes the C header used by realtime-tracking/ehtracking, and reports the
+numbers that decide whether the model fits on the device: parameter count
+against the notebook's budget, flatbuffer size, tensor arena estimate and
+interpreter latency.
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+try:
+    import tensorflow as tf
+except ImportError:
+    tf = None
+
+from segments import WINDOW_SIZE, STEP_SIZE, CHANNELS, build_dataset, load_recordings
+
+CLASSES = ['resting', 'sitting', 'walking']  # Firmware class order
+MAX_PARAMS = 3000 * 3          # 3000 objects of 3 uint32_t (notebook section 2)
+TENSOR_ARENA_SIZE = 40 * 1024  # config.h
+ARENA_OVERHEAD = 2 * 1024      # Rough allowance for interpreter bookkeeping in the arena
+REPRESENTATIVE_SAMPLES = 200
+BYTES_PER_LINE = 12
+
+CSV_DIR = os.path.join('..', 'data-collect', 'server', 'data', 'csv')
+EXPORT_DIR = 'export'  # Keeps the committed model files next to this script intact
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_HEX = [f"0x{byte:02x}, " for byte in range(256)]
+
+
+def format_c_array(data, bytes_per_line=BYTES_PER_LINE):
+    """Body of a C byte array, laid out like the notebook's exporter"""
+    data = bytes(data)
+    lines = []
+    for start in range(0, len(data), bytes_per_line):
+        line = "  " + "".join(map(_HEX.__getitem__, data[start:start + bytes_per_line]))
+        if start + bytes_per_line <= len(data):
+            line += "\n"
+        lines.append(line)
+    return "".join(lines)
+
+
+def write_c_header(tflite_model, header_file, model_name="model_esp8266"):
+    """Write a TFLite flatbuffer as the g_model / g_model_len C header"""
+    guard = f"{model_name.upper()}_H"
+    content = (
+        f"#ifndef {guard}\n"
+        f"#define {guard}\n\n"
+        "const unsigned char g_model[] = {\n"
+        f"{format_c_array(tflite_model)}\n"
+        "};\n"
+        f"const int g_model_len = {len(tflite_model)};\n\n"
+        f"#endif // {guard}\n"
+    )
+    with open(header_file, "w") as f:
+        f.write(content)
+
+
+def build_model(input_shape=(WINDOW_SIZE, len(CHANNELS)), num_classes=len(CLASSES)):
+    """The 1D CNN from train.ipynb (create_model)"""
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Flatten, Conv1D, MaxPooling1D
+    return Sequential([
+        Conv1D(10, kernel_size=5, activation='relu', input_shape=input_shape, padding='same'),
+        MaxPooling1D(pool_size=2),
+        Conv1D(16, kernel_size=5, activation='relu', padding='same'),
+        MaxPooling1D(pool_size=2),
+        Flatten(),
+        Dense(32, activation='relu'),
+        Dense(num_classes, activation='softmax'),
+    ])
+
+
+def count_params(model):
+    """Trainable parameters, as counted in the notebook"""
+    return int(np.sum([np.prod(v.shape) for v in model.trainable_weights]))
+
+
+def load_windows(csv_dir=CSV_DIR):
+    """Normalized windows and firmware class indices of all labelled recordings"""
+    X, y = build_dataset(load_recordings(csv_dir), WINDOW_SIZE, STEP_SIZE)
+    return X, np.array([CLASSES.index(label) for label in y], dtype=np.int64)
+
+
+def train_model(X, y, model_file, epochs=50, batch_size=32, seed=42):
+    """Train the notebook model with its callbacks; the best epoch is saved to model_file"""
+    from sklearn.model_selection import train_test_split
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+    from tensorflow.keras.optimizers import Adam
+
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=seed, stratify=y)
+
+    model = build_model()
+    model.compile(optimizer=Adam(learning_rate=0.001),
+                  loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model.fit(X_train, y_train, validation_split=0.2, epochs=epochs, batch_size=batch_size,
+              callbacks=[
+                  EarlyStopping(monitor='val_accuracy', patience=10,
+                                restore_best_weights=True, verbose=1),
+                  ModelCheckpoint(model_file, monitor='val_accuracy',
+                                  save_best_only=True, verbose=1),
+              ], verbose=2)
+    loss, accuracy = model.evaluate(X_test, y_test, verbose=0)
+    print(f"Test accuracy: {accuracy:.4f}")
+    return model
+
+
+def convert_float(model):
+    """Size-optimized model with float input/output (what model_runner.h feeds)"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.OPTIMIZE_FOR_SIZE]
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    return converter.convert()
+
+
+def convert_int8(model, representative):
+    """Fully int8 model calibrated on representative windows"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    def representative_dataset_gen():
+        for i in range(len(representative)):
+            yield [representative[i:i + 1].astype(np.float32)]
+
+    converter.representative_dataset = representative_dataset_gen
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def _tensor_bytes(detail):
+    return int(np.prod(detail['shape'])) * np.dtype(detail['dtype']).itemsize
+
+
+def activation_memory(interpreter):
+    """
+    Peak bytes of activation tensors alive at the same time.
+
+    A tensor is alive from the op that produces it (or the start, for model
+    inputs) to the last op that reads it (or the end, for model outputs).
+    Constant tensors (weights) stay in flash and are not counted.
+
+    The op list comes from the interpreter's private _get_ops_details();
+    without it the sum of all tensors is returned as an upper bound.
+
+    Returns:
+        Tuple (peak_bytes, per_op) where per_op lists (op_name, live_bytes),
+        or None for the upper bound
+    """
+    sizes = {d['index']: _tensor_bytes(d) for d in interpreter.get_tensor_details()}
+    try:
+        ops = interpreter._get_ops_details()
+    except Exception:  # Private API, missing or changed in other TF versions
+        return sum(sizes.values()), None
+    inputs = [d['index'] for d in interpreter.get_input_details()]
+    outputs = [d['index'] for d in interpreter.get_output_details()]
+
+    first = {index: 0 for index in inputs}
+    last = {index: len(ops) - 1 for index in outputs}
+    for position, op in enumerate(ops):
+        for index in op['outputs']:
+            first.setdefault(index, position)
+        for index in op['inputs']:
+            if index >= 0:
+                last[index] = max(last.get(index, position), position)
+
+    per_op = []
+    for position, op in enumerate(ops):
+        live = sum(sizes[index] for index, start in first.items()
+                   if start <= position <= last.get(index, start))
+        per_op.append((op['op_name'], live))
+    peak = max((live for _, live in per_op), default=0)
+    return peak, per_op
+
+
+def benchmark_latency(interpreter, windows, runs=200, warmup=10):
+    """
+    Single-window interpreter latency.
+
+    Returns:
+        Dict with mean, p50, p95 and max in milliseconds
+    """
+    detail = interpreter.get_input_details()[0]
+    output = interpreter.get_output_details()[0]
+    samples = windows[:max(1, min(len(windows), runs))].astype(np.float32)
+    if np.issubdtype(detail['dtype'], np.integer):
+        scale, zero_point = detail['quantization']
+        info = np.iinfo(detail['dtype'])
+        samples = np.clip(np.round(samples / scale + zero_point), info.min, info.max)
+    samples = samples.astype(detail['dtype'])
+
+    for i in range(warmup):
+        interpreter.set_tensor(detail['index'], samples[i % len(samples)][None])
+        interpreter.invoke()
+
+    times = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        interpreter.set_tensor(detail['index'], samples[i % len(samples)][None])
+        interpreter.invoke()
+        interpreter.get_tensor(output['index'])
+        times[i] = time.perf_counter() - start
+    times *= 1000.0
+    return {
+        'mean': float(times.mean()),
+        'p50': float(np.percentile(times, 50)),
+        'p95': float(np.percentile(times, 95)),
+        'max': float(times.max()),
+    }
+
+
+def report(name, tflite_model, windows, runs):
+    """Print size, arena estimate and latency of one converted model"""
+    interpreter = tf.lite.Interpreter(model_content=tflite_model)
+    interpreter.allocate_tensors()
+    peak, per_op = activation_memory(interpreter)
+    arena = peak + ARENA_OVERHEAD
+    latency = benchmark_latency(interpreter, windows, runs)
+
+    print(f"\n[{name}]")
+    print(f"  Model size:        {len(tflite_model) / 1024:.2f} KB ({len(tflite_model)} bytes)")
+    print(f"  Peak activations:  {peak / 1024:.2f} KB"
+          f"{'' if per_op is not None else ' (upper bound: all tensors, op details unavailable)'}")
+    print(f"  Arena estimate:    {arena / 1024:.2f} KB of {TENSOR_ARENA_SIZE / 1024:.0f} KB "
+          f"{'OK' if arena <= TENSOR_ARENA_SIZE else 'OVER'}")
+    print(f"  Latency (host):    mean {latency['mean']:.3f} ms, p50 {latency['p50']:.3f} ms, "
+          f"p95 {latency['p95']:.3f} ms, max {latency['max']:.3f} ms")
+    return {'size': len(tflite_model), 'arena': arena, 'latency': latency}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert the activity model to TFLite and export the firmware header')
+    parser.add_argument('--model', default='best_model.h5', help='Keras model file')
+    parser.add_argument('--train', action='store_true',
+                        help='Train the notebook model first and save it to --model')
+    parser.add_argument('--data', default=CSV_DIR, help='Directory with labelled recordings')
+    parser.add_argument('--epochs', type=int, default=50, help='Training epochs with --train')
+    parser.add_argument('--out', default=EXPORT_DIR,
+                        help='Output directory for .tflite files and the header')
+    parser.add_argument('--header', help='C header to write (default: model_esp8266.h in --out)')
+    parser.add_argument('--force', action='store_true',
+                        help='Allow overwriting the model files committed next to this script')
+    parser.add_argument('--header-from', choices=['float', 'int8'], default='float',
+                        help='Model embedded in the header (the firmware feeds float input)')
+    parser.add_argument('--runs', type=int, default=200, help='Latency benchmark iterations')
+    parser.add_argument('--max-latency-ms', type=float,
+                        help='Fail when the p95 host latency of the header model exceeds this')
+    parser.add_argument('--strict', action='store_true',
+                        help='Fail when the parameter budget or arena size is exceeded')
+
+    args = parser.parse_args()
+    if tf is None:
+        print("TensorFlow is required: pip install tensorflow")
+        return 1
+
+    header = args.header or os.path.join(args.out, 'model_esp8266.h')
+    outputs = [os.path.join(args.out, f"model_{name}.tflite") for name in ('float', 'int8')]
+    committed = [path for path in outputs + [header]
+                 if os.path.dirname(os.path.abspath(path)) == SCRIPT_DIR and os.path.exists(path)]
+    if committed and not args.force:
+        print(f"Refusing to overwrite {', '.join(committed)} (use --force or another --out)")
+        return 1
+
+    X, y = load_windows(args.data)
+    print(f"Loaded {len(X)} windows from {args.data}")
+
+    if args.train:
+        model = train_model(X, y, args.model, epochs=args.epochs)
+    else:
+        model = tf.keras.models.load_model(args.model)
+        print(f"Loaded {args.model}")
+
+    params = count_params(model)
+    within_budget = params <= MAX_PARAMS
+    print(f"Parameters: {params:,} of {MAX_PARAMS:,} {'OK' if within_budget else 'OVER'}")
+
+    representative = X[np.random.default_rng(42).permutation(len(X))[:REPRESENTATIVE_SAMPLES]]
+    models = {
+        'float': convert_float(model),
+        'int8': convert_int8(model, representative),
+    }
+    os.makedirs(args.out, exist_ok=True)
+    for name, tflite_model in models.items():
+        with open(os.path.join(args.out, f"model_{name}.tflite"), 'wb') as f:
+            f.write(tflite_model)
+
+    results = {name: report(name, tflite_model, representative, args.runs)
+               for name, tflite_model in models.items()}
+
+    write_c_header(models[args.header_from], header)
+    print(f"\nWrote {header} from the {args.header_from} model "
+          f"({len(models[args.header_from])} bytes)")
+
+    failures = []
+    header_result = results[args.header_from]
+    if args.strict and not within_budget:
+        failures.append(f"{params} parameters > {MAX_PARAMS}")
+    if args.strict and header_result['arena'] > TENSOR_ARENA_SIZE:
+        failures.append(f"arena {header_result['arena']} bytes > {TENSOR_ARENA_SIZE}")
+    if args.max_latency_ms is not None and header_result['latency']['p95'] > args.max_latency_ms:
+        failures.append(f"p95 latency {header_result['latency']['p95']:.3f} ms "
+                        f"> {args.max_latency_ms} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
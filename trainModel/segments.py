@@ -0,0 +1,186 @@
+"""
+Sliding-window segmentation of sensor recordings for model training.
+
+Windows are taken as strided views of the recording and z-normalized per
+window and channel in one broadcasted operation, so the only allocation is
+the output array itself.
+"""
+
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOW_SIZE = 100  # Samples per window (WINDOW_SIZE in the firmware)
+STEP_SIZE = 20     # Samples between consecutive windows
+CHANNELS = ['ir', 'red']
+
+# Recording filename prefix -> activity label
+LABEL_PREFIXES = {
+    'rest': 'resting',
+    'sit': 'sitting',
+    'walk': 'walking',
+}
+
+
+def window_starts(n_samples, window_size=WINDOW_SIZE, step_size=STEP_SIZE, include_tail=True):
+    """
+    Start indices of the windows over a recording.
+
+    With include_tail, a last window aligned to the end of the recording is
+    added when the regular steps do not reach it.
+    """
+    if n_samples < window_size:
+        return np.empty(0, dtype=np.int64)
+    starts = np.arange(0, n_samples - window_size + 1, step_size)
+    if include_tail and starts[-1] != n_samples - window_size:
+        starts = np.append(starts, n_samples - window_size)
+    return starts
+
+
+def count_windows(n_samples, window_size=WINDOW_SIZE, step_size=STEP_SIZE, include_tail=True):
+    return len(window_starts(n_samples, window_size, step_size, include_tail))
+
+
+def normalized_windows(values, window_size=WINDOW_SIZE, step_size=STEP_SIZE,
+                       include_tail=True, out=None, dtype=np.float32):
+    """
+    Z-normalized windows of a multi-channel signal.
+
+    Args:
+        values: Array (n_samples, n_channels)
+        window_size: Samples per window
+        step_size: Samples between window starts
+        include_tail: Add a last window aligned to the end of the signal
+        out: Optional preallocated output (n_windows, window_size, n_channels)
+        dtype: Output dtype when out is not given
+
+    Returns:
+        Array (n_windows, window_size, n_channels)
+    """
+    values = np.asarray(values)
+    n_samples, n_channels = values.shape
+    starts = window_starts(n_samples, window_size, step_size, include_tail)
+    n_windows = len(starts)
+
+    if out is None:
+        out = np.empty((n_windows, window_size, n_channels), dtype=dtype)
+    if n_windows == 0:
+        return out
+
+    # (n_positions, n_channels, window_size) view, no copy
+    view = sliding_window_view(values, window_size, axis=0)
+    regular = view[::step_size]
+    n_regular = len(regular)
+
+    _normalize_into(regular, out[:n_regular])
+    if n_windows > n_regular:
+        # Trailing window aligned to the end of the signal
+        _normalize_into(view[-1:], out[n_regular:])
+    return out
+
+
+def _normalize_into(view, out):
+    """(view - mean) / std per window and channel, written into out"""
+    mean = view.mean(axis=-1, keepdims=True)
+    std = view.std(axis=-1, keepdims=True)
+    std[std == 0] = 1.0  # Flat windows become all zeros instead of NaN
+
+    # Samples go on axis 1 of the output, channels on axis 2
+    target = out.transpose(0, 2, 1)
+    np.subtract(view, mean, out=target, casting='unsafe')
+    np.divide(target, std, out=target, casting='unsafe')
+
+
+def create_segments(df, window_size=WINDOW_SIZE, step_size=STEP_SIZE, include_tail=True):
+    """
+    Windows and labels for one labelled recording.
+
+    Drop-in replacement for create_segments in train.ipynb.
+    """
+    if df is None:
+        return np.empty((0, window_size, len(CHANNELS)), dtype=np.float32), np.empty(0)
+
+    segments = normalized_windows(df[CHANNELS].to_numpy(), window_size, step_size, include_tail)
+    labels = np.full(len(segments), df['label'].iloc[0])
+    return segments, labels
+
+
+def build_dataset(frames, window_size=WINDOW_SIZE, step_size=STEP_SIZE, include_tail=True):
+    """
+    Windows and labels for many labelled recordings.
+
+    The output is allocated once and every recording is written into its
+    slice, so no per-recording arrays are concatenated afterwards. Windows
+    never span two recordings.
+    """
+    frames = [df for df in frames if df is not None and len(df) > 0]
+    counts = [count_windows(len(df), window_size, step_size, include_tail) for df in frames]
+
+    X = np.empty((sum(counts), window_size, len(CHANNELS)), dtype=np.float32)
+    y = np.empty(sum(counts), dtype=object)
+
+    offset = 0
+    for df, count in zip(frames, counts):
+        normalized_windows(df[CHANNELS].to_numpy(), window_size, step_size,
+                           include_tail, out=X[offset:offset + count])
+        y[offset:offset + count] = df['label'].iloc[0]
+        offset += count
+    return X, y
+
+
+def label_from_filename(file_path):
+    """Activity label from a recording name (walk1_train.csv -> walking)"""
+    name = os.path.basename(file_path).lower()
+    for prefix, label in LABEL_PREFIXES.items():
+        if name.startswith(prefix):
+            return label
+    return None
+
+
+def load_recordings(csv_dir):
+    """Load every labelled recording in a directory"""
+    frames = []
+    for file_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+        label = label_from_filename(file_path)
+        if label is None:
+            print(f"Skipping {file_path}: no label for this file name")
+            continue
+        df = pd.read_csv(file_path, usecols=CHANNELS)
+        df['label'] = label
+        frames.append(df)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build training windows from labelled recordings')
+    parser.add_argument('csv_dir', nargs='?',
+                        default=os.path.join('..', 'data-collect', 'server', 'data', 'csv'),
+                        help='Directory with labelled CSV recordings')
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE,
+                        help='Window size in samples')
+    parser.add_argument('--step', type=int, default=STEP_SIZE,
+                        help='Step between windows in samples')
+    parser.add_argument('--no-tail', action='store_true',
+                        help='Do not add the trailing window of each recording')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    frames = load_recordings(args.csv_dir)
+    X, y = build_dataset(frames, args.window, args.step, not args.no_tail)
+    elapsed = time.perf_counter() - start
+
+    labels, counts = np.unique(y.astype(str), return_counts=True)
+    print(f"Built {X.shape} windows ({X.nbytes / 1024 / 1024:.1f} MB) "
+          f"from {len(frames)} recordings in {elapsed:.2f}s")
+    for label, count in zip(labels, counts):
+        print(f"  {label}: {count}")
+
+
+if __name__ == "__main__":
+    main()